@@ -0,0 +1,223 @@
+# Background autosave for the graph editor.
+# Every edit of the graph model (see the change events of GUI/graphModel.py) is appended to an append-only journal,
+# journal.jsonl, in the session's directory under GUI/autosave/. A writer thread picks the events up in batches every
+# SYNC_INTERVAL seconds, applies them to its own copy of the graph and periodically compacts: it writes the copy as
+# snapshot.json (to a temporary file that is then renamed over the old snapshot, so a crash never leaves a half-written
+# file) and starts a new journal. The GUI thread only serialises the event it just produced and never wakes the writer,
+# all file writes happen on the writer thread. Saving a graph to a folder goes through the same thread (writeFiles()), so
+# a save with its fsyncs never blocks the editor either.
+#
+# A session that was not closed cleanly (its process is gone but its directory is still there) can be recovered with
+# recoverSession(): the snapshot is loaded and the journal entries written after it are replayed.
+
+import itertools
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+from GUI.graphIO import atomicWrite
+from GUI.graphModel import GraphModel
+
+AUTOSAVE_DIR = "GUI/autosave"
+SNAPSHOT_NAME = "snapshot.json"
+JOURNAL_NAME = "journal.jsonl"
+SNAPSHOT_INTERVAL = 30.0  # Seconds between compactions while there are new journal entries
+COMPACT_EVERY = 1000  # Journal entries that trigger a compaction regardless of time
+SYNC_INTERVAL = 0.2  # Seconds between journal writes, the most work a crash can lose
+_sessionCounter = itertools.count()
+
+
+def sessionDirectory(graphName, root=AUTOSAVE_DIR):
+    '''A new autosave directory for one editor window of this process.'''
+    return os.path.join(root, f"{graphName}-{os.getpid()}-{next(_sessionCounter)}")
+
+
+def staleSessions(root=AUTOSAVE_DIR):
+    '''Autosave directories left behind by processes that are no longer running, most recent first.'''
+    if not os.path.isdir(root):
+        return []
+    import psutil
+    sessions = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            pid = int(name.rsplit('-', 2)[1])
+        except (IndexError, ValueError):
+            continue
+        if pid != os.getpid() and not psutil.pid_exists(pid) and os.path.exists(os.path.join(path, SNAPSHOT_NAME)):
+            sessions.append(path)
+    return sorted(sessions, key=os.path.getmtime, reverse=True)
+
+
+def _snapshotOf(model):
+    return {'sequence': 0,
+            'components': {str(componentId): info for componentId, info in model.components.items()},
+            'flows': {str(flowId): flow for flowId, flow in model.flows.items()}}
+
+
+def applyEvent(state, event):
+    '''Applies a journalled model event to a snapshot dictionary.'''
+    op = event['op']
+    key = str(event['id'])
+    if op == 'addComponent':
+        state['components'][key] = event['info']
+    elif op == 'removeComponent':
+        state['components'].pop(key, None)
+    elif op == 'renameComponent':
+        state['components'][key]['Name'] = event['new']
+    elif op == 'updateComponent':
+        for removed in event.get('removed', ()):
+            state['components'][key].pop(removed, None)
+        state['components'][key].update(event['new'])
+    elif op == 'addFlow':
+        state['flows'][key] = event['flow']
+    elif op == 'removeFlow':
+        state['flows'].pop(key, None)
+    state['sequence'] = event['seq']
+
+
+def recoverSession(directory):
+    '''Rebuilds the graph model of an autosave session from its snapshot and journal.'''
+    with open(os.path.join(directory, SNAPSHOT_NAME), 'r') as file:
+        state = json.load(file)
+    journalPath = os.path.join(directory, JOURNAL_NAME)
+    if os.path.exists(journalPath):
+        with open(journalPath, 'r') as file:
+            for line in file:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # The last line was being written when the process died
+                if event['seq'] > state['sequence']:  # Older entries are already part of the snapshot
+                    applyEvent(state, event)
+    model = GraphModel()
+    for componentId, info in state['components'].items():
+        model.addComponent(info, int(componentId))
+    for flowId, flow in state['flows'].items():
+        model.addFlow(flow[0], flow[1], flow[2], flow[3], flow[4] if len(flow) > 4 else None, int(flowId))
+    return model
+
+
+class Autosave:
+    '''Journals the changes of a graph model and writes compacted snapshots on a background thread.'''
+    def __init__(self, model, directory, interval=SNAPSHOT_INTERVAL, compactEvery=COMPACT_EVERY):
+        self.directory = directory
+        self.interval = interval
+        self.compactEvery = compactEvery
+        self.sequence = 0  # Number of events recorded, the journal entries are numbered by it
+        self.model = None
+        self.queue = queue.Queue()
+        self.wake = threading.Event()  # Set to make the writer thread process the queue right away
+        os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self.thread.start()
+        self.attach(model)
+
+    def attach(self, model):
+        '''Follows another model, e.g. after a graph was loaded. Its current content becomes the new snapshot.'''
+        if self.model is not None:
+            self.model.removeListener(self.record)
+        self.model = model
+        model.addListener(self.record)
+        state = _snapshotOf(model)
+        state['sequence'] = self.sequence
+        self.queue.put(('reset', json.dumps(state)))
+
+    def record(self, event):
+        '''Model listener: numbers the event and hands it, serialised, to the writer thread.'''
+        self.sequence += 1
+        self.queue.put(('event', json.dumps(dict(event, seq=self.sequence))))
+
+    def writeFiles(self, files, done):
+        '''Writes [(path, bytes)] with atomicWrite in order on the writer thread, then calls done(error) there, with the
+        OSError that stopped the writes or None.'''
+        self.queue.put(('write', (files, done)))
+        self.wake.set()
+
+    def flush(self):
+        '''Waits until every recorded event is on disk.'''
+        self.wake.set()
+        self.queue.join()
+
+    def close(self):
+        '''Writes a final snapshot and stops the writer thread.'''
+        if self.thread.is_alive():
+            self.model.removeListener(self.record)
+            self.queue.put(('close', None))
+            self.wake.set()
+            self.thread.join()
+
+    def discard(self):
+        '''Stops autosaving and deletes the session, used when the graph was saved or is empty.'''
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _run(self):
+        snapshotPath = os.path.join(self.directory, SNAPSHOT_NAME)
+        journalPath = os.path.join(self.directory, JOURNAL_NAME)
+        state = None
+        journal = None
+        pending = 0  # Journal entries not yet in the snapshot
+        snapshotAt = time.monotonic()
+        closing = False
+        while not closing:
+            # Events are picked up in batches, so recording an edit never wakes this thread
+            self.wake.wait(SYNC_INTERVAL)
+            self.wake.clear()
+            reset = False
+            taken = 0
+            written = 0  # Journal entries written by this batch
+            try:
+                while True:
+                    try:
+                        kind, payload = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    taken += 1
+                    try:
+                        if kind == 'reset':
+                            state = json.loads(payload)
+                            reset = True
+                        elif kind == 'event':
+                            applyEvent(state, json.loads(payload))
+                            if journal is None:
+                                journal = open(journalPath, 'a')
+                            journal.write(payload + '\n')
+                            pending += 1
+                            written += 1
+                        elif kind == 'write':
+                            files, done = payload
+                            try:
+                                for path, data in files:
+                                    atomicWrite(path, data)
+                            except OSError as e:
+                                done(e)
+                            else:
+                                done(None)
+                        elif kind == 'close':
+                            closing = True
+                    except Exception as e:  # A bad item must not stop the thread, flush() would then wait forever
+                        print(f"Autosave skipped a {kind} item: {e!r}")
+                if journal is not None and written:
+                    journal.flush()
+                    os.fsync(journal.fileno())
+                if state is not None and (reset or (pending and (closing or pending >= self.compactEvery or time.monotonic() - snapshotAt >= self.interval))):
+                    atomicWrite(snapshotPath, json.dumps(state).encode('utf-8'))
+                    # Entries up to state['sequence'] are in the snapshot, a crash before the truncation only leaves
+                    # entries that recovery skips
+                    if journal is not None:
+                        journal.close()
+                        journal = None
+                    open(journalPath, 'w').close()
+                    pending = 0
+                    snapshotAt = time.monotonic()
+            except Exception as e:
+                print(f"Autosave failed: {e!r}")
+            finally:
+                for _ in range(taken):  # Only now is the batch on disk, which is what flush() waits for
+                    self.queue.task_done()
+        if journal is not None:
+            journal.close()
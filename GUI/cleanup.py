@@ -0,0 +1,19 @@
+# Removes shared memory left behind by a run that was killed before it could release its flow buffers.
+# createGraph.stopNeuroweaver calls cleanupSegments directly; from a shell:
+#     python3 -m GUI.cleanup [--run-id RUN_ID]
+
+import argparse
+
+from GUI.ringBuffer import cleanupSegments
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remove leftover Neuroweaver shared memory segments.")
+    parser.add_argument('--run-id', help="Only remove the segments of this run.")
+    args = parser.parse_args(argv)
+    removed = cleanupSegments(args.run_id)
+    print(f"Removed {len(removed)} shared memory segment(s)")
+
+
+if __name__ == '__main__':
+    main()
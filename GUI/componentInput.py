@@ -1,138 +1,178 @@
-from PyQt5.QtWidgets import QCheckBox, QLabel, QPushButton, QDialog, QVBoxLayout, QComboBox, QLineEdit, QWidget, QHBoxLayout, QPushButton, QMessageBox
+from PyQt5.QtWidgets import QCheckBox, QLabel, QPushButton, QDialog, QVBoxLayout, QComboBox, QLineEdit, QWidget, QHBoxLayout, QPushButton, QMessageBox, QStackedWidget
 from copy import deepcopy
 
-import json
-class NewNodeDialog(QDialog):
-    '''A dialog window that allows the user to input the details of a new component.'''
-    def __init__(self,config):
+from GUI.componentRegistry import componentRegistry
+
+class ComponentForm(QWidget):
+    '''The fields of one component type: a line edit per parameter and, per port, an enable checkbox with a shape edit.
+    Built once from the catalog entry and refilled with reset() or load() instead of being rebuilt.'''
+    def __init__(self, componentType, config, parent=None):
+        super().__init__(parent)
+        self.componentType = componentType
+        self.config = config
+        self.parameters = {}  # parameter name -> QLineEdit
+        self.ports = {'inputs': {}, 'outputs': {}, 'state': {}}  # category -> port name -> (QCheckBox, QLineEdit)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(QLabel("Parameters:"))
+        for name in componentType['parameters']:
+            hbox = QHBoxLayout()
+            line_edit = QLineEdit()
+            hbox.addWidget(QLabel(f"{name}:"))
+            hbox.addWidget(line_edit)
+            layout.addLayout(hbox)
+            self.parameters[name] = line_edit
+        for title, category in (("Inputs:", 'inputs'), ("Outputs:", 'outputs'), ("State:", 'state')):
+            layout.addWidget(QLabel(title))
+            for port in componentType[category]:
+                hbox = QHBoxLayout()
+                checkbox = QCheckBox(f"Enable {port}")
+                line_edit = QLineEdit()
+                checkbox.toggled.connect(line_edit.setVisible)  # Disabled ports hide their shape instead of deleting it
+                hbox.addWidget(checkbox)
+                hbox.addWidget(line_edit)
+                layout.addLayout(hbox)
+                self.ports[category][port] = (checkbox, line_edit)
+        layout.addStretch()
+        self.reset()
+
+    def defaultShape(self, port):
+        return f'({int(self.config["Num Channels"])+1},{self.config["Rollout Steps"]})' if port == 'rollout' else "(1,)"
+
+    def setPort(self, category, port, enabled, shape):
+        checkbox, line_edit = self.ports[category][port]
+        checkbox.setChecked(enabled)
+        line_edit.setVisible(enabled)
+        line_edit.setText(shape)
+
+    def reset(self):
+        '''Fills the form with the catalog defaults: default parameter values and every port enabled.'''
+        defaults = self.componentType['parameters']
+        for name, line_edit in self.parameters.items():
+            line_edit.setText(str(defaults[name]))
+        for category, ports in self.ports.items():
+            for port in ports:
+                self.setPort(category, port, True, self.defaultShape(port))
+
+    def load(self, componentInfo):
+        '''Fills the form from an existing component. Ports missing from componentInfo are shown disabled.'''
+        defaults = self.componentType['parameters']
+        values = componentInfo.get('parameters', {})
+        for name, line_edit in self.parameters.items():
+            line_edit.setText(str(values.get(name, defaults[name])))
+        for category, ports in self.ports.items():
+            enabled = componentInfo.get(category, {})
+            for port in ports:
+                shape = enabled.get(port)
+                if isinstance(shape, list):
+                    shape = shape[0] if shape else None  # Ports store their shape as a one element list
+                self.setPort(category, port, port in enabled, shape or self.defaultShape(port))
+
+    def values(self):
+        '''Parameters and enabled ports in the component info format.'''
+        results = {'parameters': {name: line_edit.text() for name, line_edit in self.parameters.items()}}
+        for category, ports in self.ports.items():
+            results[category] = {port: [line_edit.text()] for port, (checkbox, line_edit) in ports.items() if checkbox.isChecked()}
+        return results
+
+
+class ComponentFormStack(QStackedWidget):
+    '''Holds one ComponentForm per component type and switches between them. A form is built the first time its type is
+    shown and rebuilt only if the catalog entry of the type was reloaded.'''
+    def __init__(self, config, parent=None):
+        super().__init__(parent)
+        self.config = config
+        self.forms = {}  # type name -> ComponentForm
+
+    def showType(self, typeName, componentType):
+        form = self.forms.get(typeName)
+        if form is None or form.componentType is not componentType:
+            if form is not None:
+                self.removeWidget(form)
+                form.deleteLater()
+            form = ComponentForm(componentType, self.config)
+            self.addWidget(form)
+            self.forms[typeName] = form
+        self.setCurrentWidget(form)
+        return form
+
+
+class ComponentDialog(QDialog):
+    '''Common part of the component dialogs: the type selector, the name field and the cached form of the selected type.
+    The dialogs are meant to be kept and reused, so switching type or reopening them does not rebuild any widget.'''
+    def __init__(self, config):
         super().__init__()
         self.config = config
         self.rollout = config['Rollout Steps']
-        with open("GUI/components.json", 'r') as file:
-            self.components = json.load(file)
-        self.setWindowTitle('Component Input')
+        self.components = componentRegistry() # Shared, already parsed catalog of component types
+        self.form = None
+        self.typeNames = []
         self.setMinimumSize(300, 600)
-        self.widget_groups = {}
         self.layout = QVBoxLayout(self)
 
         self.component_type_combo = QComboBox()
-        self.component_type_combo.addItems(self.components.keys())
         self.component_type_combo.currentIndexChanged.connect(self.updateFields)
         self.layout.addWidget(self.component_type_combo)
 
-        
         self.componentName = QLineEdit()
-        self.componentName.setPlaceholderText('Enter component name')
         self.layout.addWidget(self.componentName)
 
-        self.dynamic_container = QWidget()
-        self.dynamic_layout = QVBoxLayout(self.dynamic_container)
-        self.layout.addWidget(self.dynamic_container)
-
-        self.ok_button = QPushButton('OK', clicked=self.accept)
-        self.cancel_button = QPushButton('Cancel', clicked=self.reject)
-        self.layout.addWidget(self.ok_button)
-        self.layout.addWidget(self.cancel_button)
-
-        self.updateFields()  # Initialize with no dynamic fields
+        self.forms = ComponentFormStack(config)
+        self.layout.addWidget(self.forms)
+
+    def refreshTypes(self):
+        '''Fills the type selector from the registry, only touching it when the catalog changed.'''
+        names = list(self.components)
+        if names == self.typeNames:
+            return
+        current = self.component_type_combo.currentText()
+        self.component_type_combo.blockSignals(True)
+        self.component_type_combo.clear()
+        self.component_type_combo.addItems(names)
+        if current in names:
+            self.component_type_combo.setCurrentText(current)
+        self.component_type_combo.blockSignals(False)
+        self.typeNames = names
+
+    def selectType(self, typeName):
+        '''Selects a type without triggering updateFields and shows its form.'''
+        self.component_type_combo.blockSignals(True)
+        self.component_type_combo.setCurrentText(typeName)
+        self.component_type_combo.blockSignals(False)
+        self.form = self.forms.showType(typeName, self.components[typeName])
+        return self.form
 
     def updateFields(self):
-        '''Update the dynamic fields based on the selected component type. This is adaptable to any type of component defined in the components.json file.'''
-        while self.dynamic_layout.count():
-            item = self.dynamic_layout.takeAt(0)
-            widget = item.widget()
-            if widget:
-                widget.deleteLater()
-            elif item.layout():
-                self.clearLayout(item.layout())
-
-        selected_type = self.component_type_combo.currentText()
-        selectedComp = self.components[selected_type]
-
-        self.addParameterSection("Parameters:", selectedComp['parameters'], 'parameters')
-        self.addSection("Inputs:", selectedComp['inputs'], 'inputs')
-        self.addSection("Outputs:", selectedComp['outputs'], 'outputs')
-        self.addSection("State:", selectedComp['state'], 'state')
-
-    
-    def addParameterSection(self, title, items, category):
-        '''Add a section of parameters to the dialog.'''
-        label = QLabel(title)
-        self.dynamic_layout.addWidget(label)
-        for item in items:
-            hbox = QHBoxLayout()
-            widget_data = {'category': category, 'inputs': []}
-            line_edit = QLineEdit(str(items[item]))
-            hbox.addWidget(QLabel(f"{item}:"))
-            hbox.addWidget(line_edit)
-            widget_data['input'] = line_edit
-            self.widget_groups[item] = widget_data
-            self.dynamic_layout.addLayout(hbox)
-    
-    def addSection(self, title, items, category, first=True):
-        '''Add a section of inputs, outputs, or state to the dialog.'''
-        label = QLabel(title)
-        self.dynamic_layout.addWidget(label)
-        for item in items:
-            hbox = QHBoxLayout()
-            widget_data = {'category': category, 'inputs': []}
-            checkbox = QCheckBox(f"Enable {item}")
-            checkbox.setChecked(True)
-            checkbox.stateChanged.connect(lambda checked, item=item, hbox=hbox: self.handleCheckbox(checked, item, hbox))
-            hbox.addWidget(checkbox)
-            widget_data['checkbox'] = checkbox
-            widget_data['layout'] = hbox
-            self.widget_groups[item] = widget_data
-            self.dynamic_layout.addLayout(hbox)
-            if first:
-                self.handleCheckbox(True, item, hbox)
-        first = False
-    
-    def handleCheckbox(self, checked, label, hbox):
-        '''Handle the enabling/disabling of input fields based on the checkbox state.'''
-        widgets = self.widget_groups[label]
-        if checked:
-            line_edit = QLineEdit(f'({int(self.config["Num Channels"])+1},{self.config["Rollout Steps"]})' if label == 'rollout' else "(1,)")
-            hbox.addWidget(line_edit)
-            widgets['inputs'].append(line_edit)
-        else:
-            while widgets['inputs']:
-                widget = widgets['inputs'].pop()
-                hbox.removeWidget(widget)
-                widget.deleteLater()
+        '''Shows the form of the selected type with its catalog defaults. This is adaptable to any type of component defined in the catalog.'''
+        self.selectType(self.component_type_combo.currentText()).reset()
 
     def get_inputs(self):
         '''provides other classes with the data from the dialog.'''
-        results = {'Component':self.component_type_combo.currentText(), "Name":self.componentName.text(), 'parameters': {}, 'inputs': {}, 'outputs': {}, 'state': {}}
-        
-        for key, data in self.widget_groups.items():
-            category = data['category']
-            if 'input' in data and data['input'] is not None:
-                try:
-                    results[category][key] = data['input'].text()
-                except RuntimeError:  # Safely handle deleted widget case
-                    continue
-            if 'inputs' in data:
-                inputs = []
-                for input_widget in data['inputs']:
-                    try:
-                        inputs.append(input_widget.text())
-                    except RuntimeError:  # Catch cases where the widget might have been deleted
-                        continue
-                if inputs:
-                    results[category][key] = inputs
+        results = {'Component': self.component_type_combo.currentText(), "Name": self.componentName.text()}
+        results.update(self.form.values() if self.form else {'parameters': {}, 'inputs': {}, 'outputs': {}, 'state': {}})
         return results
 
 
-    def clearLayout(self, layout):
-        '''Clear the layout, used for updating the dynamic fields when the component type changes.'''
-        while layout.count():
-            item = layout.takeAt(0)
-            widget = item.widget()
-            if widget:
-                widget.deleteLater()
-            elif item.layout():
-                self.clearLayout(item.layout())
+class NewNodeDialog(ComponentDialog):
+    '''A dialog window that allows the user to input the details of a new component.'''
+    def __init__(self, config):
+        super().__init__(config)
+        self.setWindowTitle('Component Input')
+        self.componentName.setPlaceholderText('Enter component name')
+
+        self.ok_button = QPushButton('OK', clicked=self.accept)
+        self.cancel_button = QPushButton('Cancel', clicked=self.reject)
+        self.layout.addWidget(self.ok_button)
+        self.layout.addWidget(self.cancel_button)
+        self.prepare()
+
+    def prepare(self):
+        '''Readies the dialog for a new component: clears the name and restores the defaults of the selected type.'''
+        self.refreshTypes()
+        self.componentName.clear()
+        if self.component_type_combo.count():
+            self.updateFields()
+
 
 class FlowInput(QDialog):
     '''A dialog window that allows the user to input the details of a new flow.'''
@@ -163,10 +203,36 @@ class FlowInput(QDialog):
         self.end_combo = QComboBox()
         self.end_combo.addItems(end_pipes)
         self.layout.addWidget(self.end_combo)
+
+        # Remote flows are carried over ZeroMQ so the two components can run on different machines
+        self.remote_checkbox = QCheckBox("Remote (ZeroMQ)")
+        self.remote_checkbox.stateChanged.connect(self.handleRemote)
+        self.layout.addWidget(self.remote_checkbox)
+        self.pattern_combo = QComboBox()
+        self.pattern_combo.addItems(['pushpull', 'pubsub'])
+        self.layout.addWidget(self.pattern_combo)
+        from GUI.flowTransport import freeTcpPort
+        port = freeTcpPort() # Every remote flow needs its own address
+        self.bind_edit = QLineEdit(f"tcp://*:{port}")
+        self.bind_edit.setToolTip("Address the producer binds to")
+        self.layout.addWidget(self.bind_edit)
+        self.connect_edit = QLineEdit(f"tcp://127.0.0.1:{port}")
+        self.connect_edit.setToolTip("Address the consumer connects to")
+        self.layout.addWidget(self.connect_edit)
+        self.handleRemote(False)
+
+    def handleRemote(self, checked):
+        '''Shows the transport options only for remote flows.'''
+        for widget in (self.pattern_combo, self.bind_edit, self.connect_edit):
+            widget.setVisible(bool(checked))
     
     def get_inputs(self):
-        '''provides other classes with the data from the dialog.'''
-        return [self.start_combo.currentText(), self.end_combo.currentText()]
+        '''provides other classes with the data from the dialog. Remote flows get a third element with the transport options.'''
+        inputs = [self.start_combo.currentText(), self.end_combo.currentText()]
+        if self.remote_checkbox.isChecked():
+            inputs.append({'transport': 'zmq', 'pattern': self.pattern_combo.currentText(),
+                           'bind': self.bind_edit.text(), 'connect': self.connect_edit.text()})
+        return inputs
     
     def Footer(self):
         # Ok and Cancel buttons
@@ -179,37 +245,15 @@ class FlowInput(QDialog):
         self.layout.addWidget(self.cancel_button)
         self.setLayout(self.layout)
 
-class ComponentConfigDialog(QDialog):
+class ComponentConfigDialog(ComponentDialog):
     '''A dialog window that allows the user to edit the details of a component.'''
     def __init__(self, componentInfo, config):
-        super().__init__()
-        self.config = config
+        super().__init__(config)
         self.rollout = int(config['Rollout Steps'])
-        with open("GUI/components.json", 'r') as file:
-            self.components = json.load(file)
-        self.originalInfo = deepcopy(componentInfo)
-        self.componentInfo = componentInfo
         self.initUI()
-    
-    def initUI(self):
-        self.setMinimumSize(300, 600)
-        self.widget_groups = {}
-        self.layout = QVBoxLayout(self)
-
-        self.component_type_combo = QComboBox()
-        self.component_type_combo.addItems(self.components.keys())
-        self.component_type_combo.setCurrentText(self.componentInfo['Component'])
-        self.component_type_combo.currentIndexChanged.connect(self.updateFields)
-        self.layout.addWidget(self.component_type_combo)
-
-        self.componentName = QLineEdit()
-        self.componentName.setText(self.componentInfo['Name'])
-        self.layout.addWidget(self.componentName)
+        self.edit(componentInfo)
 
-        self.dynamic_container = QWidget()
-        self.dynamic_layout = QVBoxLayout(self.dynamic_container)
-        self.layout.addWidget(self.dynamic_container)
-        
+    def initUI(self):
         # Cancel button
         self.cancelButton = QPushButton('Cancel', self)
         self.cancelButton.clicked.connect(self.reject)
@@ -225,41 +269,20 @@ class ComponentConfigDialog(QDialog):
         self.deleteButton.clicked.connect(self.deleteComponent)
         self.layout.addWidget(self.deleteButton)
 
-        self.setLayout(self.layout)
-        self.initializeFields() # Initialize with current dynamic fields
-
-    def initializeFields(self):
-        '''Initialize the dynamic fields based on the component info.'''
-        self.addParameterSection("Parameters:", self.componentInfo['parameters'], 'parameters')
-        self.addSection("Inputs:", self.componentInfo['inputs'], 'inputs')
-        self.addSection("Outputs:", self.componentInfo['outputs'], 'outputs')
-        self.addSection("State:", self.componentInfo['state'], 'state')
-    
-    def updateFields(self):
-        while self.dynamic_layout.count():
-            item = self.dynamic_layout.takeAt(0)
-            widget = item.widget()
-            if widget:
-                widget.deleteLater()
-            elif item.layout():
-                self.clearLayout(item.layout())
-
-        selected_type = self.component_type_combo.currentText()
-        selectedComp = self.components[selected_type]
-
-        self.addParameterSection("Parameters:", selectedComp['parameters'], 'parameters')
-        self.addSection("Inputs:", selectedComp['inputs'], 'inputs')
-        self.addSection("Outputs:", selectedComp['outputs'], 'outputs')
-        self.addSection("State:", selectedComp['state'], 'state')
+    def edit(self, componentInfo):
+        '''Loads a component into the dialog, reusing the cached form of its type.'''
+        self.originalInfo = deepcopy(componentInfo)
+        self.componentInfo = componentInfo
+        self.refreshTypes()
+        self.componentName.setText(componentInfo['Name'])
+        self.selectType(componentInfo['Component']).load(componentInfo)
 
     def saveComponent(self):
         '''Save the new component info and defines which parts were changed and returns the appropriate code.'''
-        print(self.originalInfo)
-        print('aaa')
-        print(self.get_inputs())
+        inputs = self.get_inputs()
         nameChanged = self.componentName.text() != self.originalInfo['Name']
-        paramsChanged = self.originalInfo['parameters'] != self.get_inputs()['parameters']
-        othersChanged = self.originalInfo['inputs'] != self.get_inputs()['inputs'] or self.originalInfo['outputs'] != self.get_inputs()['outputs'] or self.originalInfo['state'] != self.get_inputs()['state'] or self.originalInfo['Component'] != self.get_inputs()['Component']
+        paramsChanged = self.originalInfo['parameters'] != inputs['parameters']
+        othersChanged = self.originalInfo['inputs'] != inputs['inputs'] or self.originalInfo['outputs'] != inputs['outputs'] or self.originalInfo['state'] != inputs['state'] or self.originalInfo['Component'] != inputs['Component']
         if othersChanged:
             self.done(1)
         elif nameChanged:
@@ -278,82 +301,3 @@ class ComponentConfigDialog(QDialog):
 
         if reply == QMessageBox.Yes:
             self.done(2)  # code to indicate deletion
-
-    # The following are very similar to the methods in NewNodeDialog, but with some modifications to handle the existing data
-    def addParameterSection(self, title, items, category):
-        '''Add a section of parameters to the dialog.'''
-        label = QLabel(title)
-        self.dynamic_layout.addWidget(label)
-        for item in items:
-            hbox = QHBoxLayout()
-            widget_data = {'category': category, 'inputs': []}
-            line_edit = QLineEdit(str(items[item]))
-            hbox.addWidget(QLabel(f"{item}:"))
-            hbox.addWidget(line_edit)
-            widget_data['input'] = line_edit
-            self.widget_groups[item] = widget_data
-            self.dynamic_layout.addLayout(hbox)
-    
-    def addSection(self, title, items, category, first=True):
-        '''Add a section of inputs, outputs, or state to the dialog.'''
-        label = QLabel(title)
-        self.dynamic_layout.addWidget(label)
-        for item in items:
-            hbox = QHBoxLayout()
-            widget_data = {'category': category, 'inputs': []}
-            checkbox = QCheckBox(f"Enable {item}")
-            checkbox.setChecked(True)
-            checkbox.stateChanged.connect(lambda checked, item=item, hbox=hbox: self.handleCheckbox(checked, item, hbox))
-            hbox.addWidget(checkbox)
-            widget_data['checkbox'] = checkbox
-            widget_data['layout'] = hbox
-            self.widget_groups[item] = widget_data
-            self.dynamic_layout.addLayout(hbox)
-            if first:
-                self.handleCheckbox(True, item, hbox)
-        first = False
-
-    def handleCheckbox(self, checked, label, hbox):
-        '''Handle the enabling/disabling of input fields based on the checkbox state.'''
-        widgets = self.widget_groups[label]
-        if checked:
-            line_edit = QLineEdit(f'({int(self.config["Num Channels"])+1},{self.config["Rollout Steps"]})' if label == 'rollout' else "(1,)")
-            hbox.addWidget(line_edit)
-            widgets['inputs'].append(line_edit)
-        else:
-            while widgets['inputs']:
-                widget = widgets['inputs'].pop()
-                hbox.removeWidget(widget)
-                widget.deleteLater()
-
-    def clearLayout(self, layout):
-        '''Clear the layout, used for updating the dynamic fields when the component type changes.'''
-        while layout.count():
-            item = layout.takeAt(0)
-            widget = item.widget()
-            if widget:
-                widget.deleteLater()
-            elif item.layout():
-                self.clearLayout(item.layout())
-
-    def get_inputs(self):
-        '''provides other classes with the data from the dialog.'''
-        results = {'Component':self.component_type_combo.currentText(), "Name":self.componentName.text(), 'parameters': {}, 'inputs': {}, 'outputs': {}, 'state': {}}
-        
-        for key, data in self.widget_groups.items():
-            category = data['category']
-            if 'input' in data and data['input'] is not None:
-                try:
-                    results[category][key] = data['input'].text()
-                except RuntimeError:  # Safely handle deleted widget case
-                    continue
-            if 'inputs' in data:
-                inputs = []
-                for input_widget in data['inputs']:
-                    try:
-                        inputs.append(input_widget.text())
-                    except RuntimeError:  # Catch cases where the widget might have been deleted
-                        continue
-                if inputs:
-                    results[category][key] = inputs
-        return results
\ No newline at end of file
@@ -0,0 +1,173 @@
+# Process-wide registry of component types.
+# Component types are described in GUI/components.json and, optionally, in any number of extra *.json files placed in
+# GUI/catalog/ (handy when a catalog grows to hundreds of types maintained by different people). Every file has the
+# same layout as components.json: a dictionary of type name -> description.
+#
+# The files are parsed once and every entry is validated into a ComponentType. Dialogs, the graph editor and the
+# engine all share the registry returned by componentRegistry(), so opening a dialog does not touch the disk. Edits to
+# the catalog files are still picked up: on access the registry compares the files' modification times (at most once
+# per CHECK_INTERVAL seconds) and reloads only when something changed.
+
+import json
+import os
+import time
+from collections.abc import Mapping
+
+CATALOG_PATH = "GUI/components.json"
+CATALOG_DIR = "GUI/catalog"
+CHECK_INTERVAL = 1.0  # Seconds between modification time checks
+
+
+class ComponentType(Mapping):
+    '''A validated component type. Behaves as a read-only dictionary of the catalog entry so existing lookups keep working.'''
+    __slots__ = ('name', 'inputs', 'outputs', 'state', 'parameters', 'module', 'function', 'iterationAddition', 'period',
+                 'vectorized', 'kwargs', 'required', 'source', '_entry')
+
+    def __init__(self, name, entry, source=None):
+        where = f"component type {name!r}" + (f" in {source}" if source else "")
+        if not isinstance(entry, dict):
+            raise ValueError(f"Invalid {where}: expected a dictionary, got {type(entry).__name__}")
+        for key in ('module', 'function'):
+            if not isinstance(entry.get(key), str) or not entry[key]:
+                raise ValueError(f"Invalid {where}: {key!r} must be a non-empty string")
+        for key in ('inputs', 'outputs', 'state', 'kwargs', 'required'):
+            ports = entry.get(key, [])
+            if not isinstance(ports, list) or not all(isinstance(port, str) for port in ports):
+                raise ValueError(f"Invalid {where}: {key!r} must be a list of names")
+        if not isinstance(entry.get('parameters', {}), dict):
+            raise ValueError(f"Invalid {where}: 'parameters' must be a dictionary of name -> default value")
+        addition = entry.get('iterationAddition', 0)
+        if not isinstance(addition, int) or isinstance(addition, bool) or addition < 0:
+            raise ValueError(f"Invalid {where}: 'iterationAddition' must be a non-negative integer")
+        period = entry.get('period', 1)
+        if isinstance(period, bool) or not (isinstance(period, int) and period >= 1 or isinstance(period, str) and period.strip()):
+            raise ValueError(f"Invalid {where}: 'period' must be a positive integer or a configuration expression")
+        if not isinstance(entry.get('vectorized', False), bool):
+            raise ValueError(f"Invalid {where}: 'vectorized' must be true or false")
+        unknown = [port for port in entry.get('required', []) if port not in entry.get('inputs', []) + entry.get('state', [])]
+        if unknown:
+            raise ValueError(f"Invalid {where}: required ports {unknown} are not inputs or state ports")
+        self.name = name
+        self.inputs = tuple(entry.get('inputs', []))
+        self.outputs = tuple(entry.get('outputs', []))
+        self.state = tuple(entry.get('state', []))
+        self.parameters = dict(entry.get('parameters', {}))
+        self.module = entry['module']
+        self.function = entry['function']
+        self.iterationAddition = addition
+        self.period = period  # Ticks between calls, an int or an expression of the configuration such as "Rollout Steps"
+        self.vectorized = entry.get('vectorized', False)  # Takes and returns values batched along a leading axis
+        self.kwargs = tuple(entry.get('kwargs', []))
+        self.required = frozenset(entry.get('required', []))  # Input/state ports that must be fed by a flow
+        self.source = source
+        self._entry = entry
+
+    def __getitem__(self, key):
+        return self._entry[key]
+
+    def __iter__(self):
+        return iter(self._entry)
+
+    def __len__(self):
+        return len(self._entry)
+
+    def __repr__(self):
+        return f"ComponentType({self.name!r}, {self.module}.{self.function})"
+
+
+class ComponentRegistry(Mapping):
+    '''Component types from a catalog file plus a directory of extra catalogs, reloaded lazily when the files change.'''
+    def __init__(self, path=CATALOG_PATH, directory=CATALOG_DIR, checkInterval=CHECK_INTERVAL):
+        self.path = path
+        self.directory = directory
+        self.checkInterval = checkInterval
+        self.types = {}  # type name -> ComponentType
+        self._stamp = None
+        self._checkedAt = float('-inf')
+
+    def files(self):
+        '''Catalog files in load order: the main catalog, then the extra catalogs sorted by name.'''
+        files = [self.path] if self.path else []
+        if self.directory and os.path.isdir(self.directory):
+            files += [os.path.join(self.directory, name) for name in sorted(os.listdir(self.directory)) if name.endswith('.json')]
+        return files
+
+    def stamp(self):
+        '''Modification time and size of every catalog file, compared to decide whether to reload.'''
+        stamp = []
+        for path in self.files():
+            info = os.stat(path)
+            stamp.append((path, info.st_mtime_ns, info.st_size))
+        return tuple(stamp)
+
+    def refresh(self, force=False):
+        '''Reloads the catalog if a file was added, removed or modified. Returns True if it was reloaded.
+        A broken catalog raises on the first load (or with force=True); a later reload prints the error and keeps the
+        previous catalog, e.g. while a file is half saved, until the files change again.'''
+        now = time.monotonic()
+        if not force and now - self._checkedAt < self.checkInterval:
+            return False
+        self._checkedAt = now
+        stamp = None
+        try:
+            stamp = self.stamp()
+            if not force and stamp == self._stamp:
+                return False
+            types = self.load(stamp)
+        except (OSError, ValueError) as e:
+            if force or self._stamp is None:
+                raise
+            print(f"Component catalog not reloaded: {e}")
+            if stamp is not None:
+                self._stamp = stamp  # Retried once the files change again
+            return False
+        self.types = types  # Swapped in one go, so a failed reload keeps the previous catalog
+        self._stamp = stamp
+        return True
+
+    def load(self, stamp):
+        '''Parses and validates the catalog files listed in a stamp into a dictionary of type name -> ComponentType.'''
+        types = {}
+        for path, mtime, size in stamp:
+            with open(path, 'r') as file:
+                try:
+                    entries = json.load(file)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Cannot parse component catalog {path}: {e}") from e
+            if not isinstance(entries, dict):
+                raise ValueError(f"Component catalog {path} must contain a dictionary of component types")
+            for name, entry in entries.items():
+                if name in types:
+                    raise ValueError(f"Component type {name!r} is defined in both {types[name].source} and {path}")
+                types[name] = ComponentType(name, entry, path)
+        return types
+
+    def __getitem__(self, name):
+        self.refresh()
+        try:
+            return self.types[name]
+        except KeyError:
+            raise KeyError(f"Unknown component type {name!r}") from None
+
+    def __contains__(self, name):
+        self.refresh()
+        return name in self.types
+
+    def __iter__(self):
+        self.refresh()
+        return iter(self.types)
+
+    def __len__(self):
+        self.refresh()
+        return len(self.types)
+
+
+_registry = None
+
+
+def componentRegistry():
+    '''The registry shared by the whole process, created on first use.'''
+    global _registry
+    if _registry is None:
+        _registry = ComponentRegistry()
+    return _registry
@@ -1,48 +1,78 @@
 # Opens the graph editor
 # This creates the GUI for drawing and editing a graph. It is a separate window that can be opened from the main window.
 # The graph is created by adding components and flows between them. The components are draggable and can be connected by clicking and dragging between them.
+# The canvas is a QGraphicsScene shown in a GraphView, so moving a node only repaints it and its edges. Use the mouse wheel to zoom and drag the background to pan.
 # Edges are created by clicking the nodes consecutively.
 # Nodes can be edited by double-clicking them, which opens a dialog to edit the node's properties.
 # The graph can be saved to files.
+# Running the graph needs numpy, psutil and the engine modules; they are imported on the first run (or flow check),
+# not when the editor opens. With Profile switched on, the editor creates latency histograms (GUI/runProfile.py) the
+# run records into, and tints the nodes by their p99 call latency while it runs; Ctrl+Shift+E exports the report.
+# Clicking a flow's edge during a run opens a live plot of the data it carries (GUI/signalMonitor.py). With Record
+# switched on, the run records its flows under the configured Save Path (GUI/flowRecording.py).
 
 import sys
 sys.path.extend(["../..", "..","../ppo"])
 import json
-from PyQt5.QtWidgets import QMainWindow, QPushButton,QWidget,QLabel,QHBoxLayout,QDialog, QFileDialog, QMessageBox
-from PyQt5.QtGui import QPainter, QPen
-from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtWidgets import QMainWindow, QPushButton,QWidget,QLabel,QHBoxLayout,QVBoxLayout,QDialog, QFileDialog, QMessageBox, QGraphicsScene, QAction
+from PyQt5.QtCore import Qt, QTimer, QRectF, pyqtSignal
+from PyQt5.QtGui import QKeySequence, QPainterPathStroker
 from GUI.componentInput import NewNodeDialog, FlowInput, ComponentConfigDialog
-from GUI.guiElements import DraggableNode
-import subprocess
-import psutil
-from PyQt5.QtGui import QPainter, QPen, QPainterPath
+from GUI.guiElements import DraggableNode, EdgeItem, GraphView
+from GUI.graphModel import GraphModel
+from GUI.componentRegistry import componentRegistry
+from GUI.graphIO import BINARY_NAME, packGraph, sourceDigest
+from GUI.autosave import Autosave, recoverSession, sessionDirectory
+from GUI.editHistory import EditHistory, UNDO_DEPTH
+import os
+import shutil
 
 class createGraph(QMainWindow):
     """This class represents the window for creating and editing graphical representations of the component-flow model. It allows users to add, connect, and configure nodes (components) and edges (flows)."""
+    saveFinished = pyqtSignal(str, str) # Folder and error message, empty on success. Emitted by the autosave writer thread
+
     def __init__(self,inputs):
         super().__init__()
         x,y,h = inputs['x'],inputs['y'],inputs['h']
         self.config = inputs['config']
         self.iterations = int(self.config['Iterations'])
         self.graphName = "rwtest"
-        with open("GUI/components.json", 'r') as file:
-            self.component_config = json.load(file)
+        self.component_config = componentRegistry()
         self.initUI(x,y,h)
         self.initNW()
+        self.autosave = Autosave(self.model, sessionDirectory(self.graphName)) # Journals every edit in the background
+        self.history = EditHistory(self.model, int(self.config.get('Undo Depth', UNDO_DEPTH)))
+        self.savedSequence = 0 # Autosave sequence number at the last save, nothing to recover while they match
         self.NeuroweaverProcess = None
+        self.runId = None
+        self.runFlows = None # Flows of the current run, they determine which shared buffer carries each flow
+        self.monitors = [] # Open signal monitors of the current run
+        self.profile = None # ProfileHistograms of the last profiled run, kept for the overlay and export after it ends
+        self.profileTimer = QTimer(self) # Refreshes the latency overlay while a profiled run is going
+        self.profileTimer.setInterval(500)
+        self.profileTimer.timeout.connect(self.updateProfileOverlay)
+        self.newNodeDialog = None # Component dialogs are built on first use and reused, with their cached forms
+        self.configDialog = None
+        self.saveFinished.connect(self.onSaveFinished)
         
         
     def initUI(self,x,y,h):
         self.setWindowTitle('Neuroweaver GUI')
         self.setGeometry(x, y, 800, h)
 
+        centralWidget = QWidget(self)
+        self.setCentralWidget(centralWidget)
+        self.mainLayout = QVBoxLayout(centralWidget)
+        self.mainLayout.setContentsMargins(0, 0, 0, 0)
+        self.mainLayout.setSpacing(0)
+
         self.nameWidget = QWidget(self)
-        self.nameWidget.setGeometry(0, 0, 800, 30)
+        self.nameWidget.setFixedHeight(30)
         self.nameWidget.setStyleSheet("background-color: black")
         self.nameLayout = QHBoxLayout(self.nameWidget)
         self.nameLayout.setSpacing(30)
         self.nameLayout.setContentsMargins(30, 0, 30, 0) 
-        self.nameWidget.show()
+        self.mainLayout.addWidget(self.nameWidget)
 
         self.nameLabel = QLabel(self.graphName, self)
         self.nameLabel.setStyleSheet("color: white")
@@ -52,12 +82,20 @@ class createGraph(QMainWindow):
         # Create a top widget to hold the buttons
 
         self.topWidget = QWidget(self)
-        self.topWidget.setGeometry(0, 30, 800, 60)
+        self.topWidget.setFixedHeight(60)
         self.topWidget.setStyleSheet("background-color: navy")
         self.layout = QHBoxLayout(self.topWidget)
         self.layout.setSpacing(30)
         self.layout.setContentsMargins(30, 0, 30, 0) 
-        self.topWidget.show()
+        self.mainLayout.addWidget(self.topWidget)
+
+        # The canvas holding nodes and edges
+        self.scene = QGraphicsScene(self)
+        self.scene.setItemIndexMethod(QGraphicsScene.BspTreeIndex) # Spatial index used for hit-testing clicks, updated as nodes move
+        self.view = GraphView(self.scene, self)
+        self.view.clicked.connect(self.nodeClicked)
+        self.view.doubleClicked.connect(self.nodeDoubleClicked)
+        self.mainLayout.addWidget(self.view)
 
         # Create buttons
 
@@ -82,70 +120,149 @@ class createGraph(QMainWindow):
         self.runButton.setMinimumSize(150, 40)
         self.layout.addWidget(self.runButton)
 
+        ### Profile toggle, runs are only instrumented while it is checked
+        self.profileButton = QPushButton("Profile", self)
+        self.profileButton.setCheckable(True)
+        self.profileButton.setStyleSheet("QPushButton { background-color: grey } QPushButton:checked { background-color: red }")
+        self.profileButton.setToolTip("Record per-component latency histograms during the next run")
+        self.profileButton.setMinimumSize(100, 40)
+        self.layout.addWidget(self.profileButton)
+
+        ### Record toggle, the flows of the next run are recorded under the configured Save Path
+        self.recordButton = QPushButton("Record", self)
+        self.recordButton.setCheckable(True)
+        self.recordButton.setStyleSheet("QPushButton { background-color: grey } QPushButton:checked { background-color: red }")
+        self.recordButton.setToolTip("Record the data of every flow during the next run, for replay with GUI/runner.py --replay")
+        self.recordButton.setMinimumSize(100, 40)
+        self.layout.addWidget(self.recordButton)
+
         ### Save Button
         self.saveButton = QPushButton("Save", self)
         self.saveButton.setStyleSheet("background-color: grey")
         self.saveButton.clicked.connect(self.save)
         self.saveButton.setMinimumSize(150, 40)
         self.layout.addWidget(self.saveButton)
+
+        ### Undo and redo shortcuts
+        self.undoAction = QAction("Undo", self)
+        self.undoAction.setShortcut(QKeySequence.Undo)
+        self.undoAction.triggered.connect(self.undo)
+        self.addAction(self.undoAction)
+        self.redoAction = QAction("Redo", self)
+        self.redoAction.setShortcuts([QKeySequence("Ctrl+Y"), QKeySequence("Ctrl+Shift+Z")])
+        self.redoAction.triggered.connect(self.redo)
+        self.addAction(self.redoAction)
+        self.exportProfileAction = QAction("Export Profile", self)
+        self.exportProfileAction.setShortcut(QKeySequence("Ctrl+Shift+E"))
+        self.exportProfileAction.triggered.connect(self.exportProfile)
+        self.addAction(self.exportProfileAction)
     
     def initNW(self):
         '''Initializes Neuroweaver related data structures'''
         self.flowState = False
-        self.components = {} # Dictionary to store component information, this will be used to create the neuroweaver components in the backend
-        self.flows = [] # List to store flow information, this will be used to create the neuroweaver flows in the backend
+        self.model = GraphModel() # Components and flows, this will be used to create the neuroweaver components and flows in the backend
+        self.model.addListener(self.onModelEvent) # Nodes and edges follow the model, whether changed by the user or by undo/redo
         self.currentNode = None
-        self.nodesGUI = []
-        self.edgesGUI = []
+        self.nodeItems = {} # component id -> DraggableNode
+        self.edgeItems = {} # flow id -> EdgeItem
+        self.removedPositions = {} # component id -> (x, y) of deleted nodes, so undoing a deletion puts them back in place
+
+    @property
+    def flows(self):
+        '''Flows in the saved [output, start name, input, end name] form'''
+        return self.model.flowList()
 
     def addNodeGUI(self, componentInfo):
-        '''Adds a new node to the GUI and places in an appropriate position, also stores the component information in the components dictionary'''
-        num_per_row = 3  # Number of nodes to display per row, adjust as needed
-        index = len(self.nodesGUI)
-        row = index // num_per_row
-        column = index % num_per_row
-        x_position = 20 + (column * (self.width() // num_per_row))
-        y_position = 100 + (row * 100)  # Assuming each row is spaced 100 pixels apart
-        comp_gui = DraggableNode(self, componentInfo['Name'])
-        comp_gui.move(x_position, y_position)
-        comp_gui.moved.connect(self.update)
-        self.nodesGUI.append(comp_gui)
-        comp_gui.show()
-        self.components[componentInfo['Name']] = {
-            'Info': componentInfo,
-            'GUI': comp_gui,
-        }
+        '''Adds a new node to the GUI and places in an appropriate position, also stores the component information in the graph model'''
+        return self.model.addComponent(componentInfo) # The node is created by onModelEvent
+
+    def createNode(self, componentId, position=None):
+        '''Creates the node of a model component at the given (x, y) position, or at the next position of the grid'''
+        componentInfo = self.model.info(componentId)
+        if position is None:
+            num_per_row = 3  # Number of nodes to display per row, adjust as needed
+            index = len(self.nodeItems)
+            row = index // num_per_row
+            column = index % num_per_row
+            x_position = 20 + (column * (self.view.viewport().width() // num_per_row))
+            y_position = 10 + (row * 100)  # Assuming each row is spaced 100 pixels apart
+            position = (x_position, y_position)
+        comp_gui = DraggableNode(None, componentInfo['Name'])
+        comp_gui.componentId = componentId
+        comp_gui.setPos(*position)
+        self.scene.addItem(comp_gui)
+        self.nodeItems[componentId] = comp_gui
+        return comp_gui
+
+    def loadModel(self, model, progress=None, every=500, layout=None):
+        '''Shows a whole graph model at once. Items are created in a single batch with the view detached and scene indexing suspended.
+        progress(fraction) is called every few items and can return False to cancel, in which case False is returned.
+        layout gives saved {name: (x, y)} node positions, nodes without one are placed on the grid'''
+        self.model.removeListener(self.onModelEvent)
+        self.model = model
+        model.addListener(self.onModelEvent)
+        self.history.attach(model)
+        self.autosave.attach(model)
+        self.savedSequence = self.autosave.sequence
+        layout = layout or {}
+        total = max(len(model.components) + len(model.flows), 1)
+        self.view.setScene(None) # Without a view the scene does not track dirty regions of the new items
+        self.scene.setItemIndexMethod(QGraphicsScene.NoIndex) # The BSP tree is built once at the end instead of growing item by item
+        try:
+            for count, componentId in enumerate(model.components):
+                self.createNode(componentId, layout.get(model.name(componentId)))
+                if progress and count % every == 0 and progress(count / total) is False:
+                    return False
+            for count, flowId in enumerate(model.flows, len(model.components)):
+                self.drawEdge(flowId)
+                if progress and count % every == 0 and progress(count / total) is False:
+                    return False
+        finally:
+            self.scene.setItemIndexMethod(QGraphicsScene.BspTreeIndex)
+            self.view.setScene(self.scene)
+        return True
 
     def addNode(self):
         '''Opens a dialog to take components details from the user and directs the information to addNodeGUI'''
-        dialog = NewNodeDialog(self.config)
+        if self.newNodeDialog is None:
+            self.newNodeDialog = NewNodeDialog(self.config)
+        else:
+            self.newNodeDialog.prepare()
+        dialog = self.newNodeDialog
         if dialog.exec_() == QDialog.Accepted:
             # print(dialog.get_inputs())
             componentInfo = dialog.get_inputs()
-            self.addNodeGUI(componentInfo)
+            try:
+                self.addNodeGUI(componentInfo)
+            except ValueError as e:
+                QMessageBox.warning(self, "Component Not Added", str(e))
         else:
             print("Dialog canceled")
       
     def addFlow(self,start_node, end_node):
-        '''Opens a dialog to take flow details from the user and stores the information in the flows list'''
-        start_node_name = None
-        end_node_name = None
-        for name, node in self.components.items():
-            if node['GUI'] == start_node:
-                start_node_name = name
-            if node['GUI'] == end_node:
-                end_node_name = name
-        if start_node_name is None or end_node_name is None:
-            print("Error: Could not find the component names for the nodes")
-            return False
-        dialog = FlowInput(self.components[start_node_name], self.components[end_node_name])
+        '''Opens a dialog to take flow details from the user and stores the flow in the graph model. Returns the flow id, or None if cancelled'''
+        startId = start_node.componentId
+        endId = end_node.componentId
+        if startId not in self.model.components or endId not in self.model.components:
+            print("Error: Could not find the components for the nodes")
+            return None
+        dialog = FlowInput({'Info': self.model.info(startId)}, {'Info': self.model.info(endId)})
         if dialog.exec_() == QDialog.Accepted:
             flow_inputs = dialog.get_inputs()
-            self.flows.append([flow_inputs[0], start_node_name, flow_inputs[1] , end_node_name])
-        else:
-            print("Dialog canceled")
-            return False
-        return True
+            from GUI.graphValidation import flowShapeMismatch
+            mismatch = flowShapeMismatch(self.model.info(startId), flow_inputs[0], self.model.info(endId), flow_inputs[1], self.config,
+                                         self.component_config)
+            if mismatch:
+                QMessageBox.warning(self, "Shape Mismatch", f"The flow was not added: {mismatch}.")
+                return None
+            options = flow_inputs[2] if len(flow_inputs) > 2 else None # Remote flows carry their transport options
+            return self.model.addFlow(flow_inputs[0], startId, flow_inputs[1], endId, options)
+        print("Dialog canceled")
+        return None
+
+    def addFlowData(self, flow):
+        '''Adds a flow given in the saved [output, start name, input, end name] form and draws its edge'''
+        return self.model.addFlowByName(flow) # The edge is drawn by onModelEvent
     
     def FlowState(self):
         '''Changes the state of the flow button, if true, the button will be red and the user can add flows between nodes''' 
@@ -157,138 +274,158 @@ class createGraph(QMainWindow):
             #change addFlowButton color to red
             self.addFlowButton.setStyleSheet("background-color: red")
 
-    def mousePressEvent(self, event):
+    def nodeAt(self, scenePos):
+        '''Returns the node under the given scene position, if any. The scene's BSP tree index keeps this logarithmic in the number of items'''
+        # Topmost first, nodes are drawn above edges. Bounding rectangles are enough for nodes and avoid stroking every edge under the cursor
+        for item in self.scene.items(scenePos, Qt.IntersectsItemBoundingRect):
+            if isinstance(item, DraggableNode):
+                return item
+        return None
+
+    def nodeClicked(self, scenePos):
         '''detects if a node is clicked. Contains node creation and edge creation logic'''
-        super().mousePressEvent(event)
         if self.flowState:
-            found_node = None
-            for node in self.nodesGUI:
-                if node.geometry().contains(event.pos()):
-                    print("Node clicked")
-                    found_node = node
-                    break
+            found_node = self.nodeAt(scenePos)
             if found_node:
+                print("Node clicked")
                 if self.currentNode is None:
                     # This is the first node clicked, set it as the start of a potential edge
                     self.currentNode = found_node
-                    self.start_point = found_node.pos() + QPoint(found_node.width() // 2, found_node.height() // 2)
                 elif self.currentNode is not None and found_node is not self.currentNode:
                     print("Edge created between", self.currentNode.name, "and", found_node.name)
-                    flowAdded = self.addFlow(self.currentNode, found_node)
-                    if flowAdded:
-                        # A second distinct node is clicked; create an edge
-                        self.edgesGUI.append((self.currentNode, found_node))
-                        self.end_point = found_node.pos() + QPoint(found_node.width() // 2, found_node.height() // 2)
-                        self.update()
+                    # A second distinct node is clicked; create a flow, its edge is drawn by onModelEvent
+                    self.addFlow(self.currentNode, found_node)
                     self.currentNode = None
                     self.FlowState()
                     
                 elif self.currentNode is found_node:
                     self.currentNode = None
+        elif self.nodeAt(scenePos) is None:
+            edge = self.edgeAt(scenePos)
+            if edge is not None:
+                self.monitorFlow(edge.flowId)
 
-    def drawEdge(self,startNodeName,endNodeName):
-        '''Locates the start and end points of the edge and stores the edge in the edgesGUI list'''
-        startNode = self.components[startNodeName]['GUI']
-        self.start_point = startNode.pos() + QPoint(startNode.width() // 2, startNode.height() // 2)
-        endNode = self.components[endNodeName]['GUI']
-        self.end_point = endNode.pos() + QPoint(endNode.width() // 2, endNode.height() // 2)
-        self.edgesGUI.append((startNode, endNode))
-        self.update()
+    def edgeAt(self, scenePos, tolerance=4):
+        '''Returns the edge whose curve passes within `tolerance` of the given scene position, if any'''
+        area = QRectF(scenePos.x() - tolerance, scenePos.y() - tolerance, 2 * tolerance, 2 * tolerance)
+        stroker = QPainterPathStroker()
+        stroker.setWidth(2 * tolerance)
+        for item in self.scene.items(area, Qt.IntersectsItemBoundingRect):
+            # Only the few edges whose bounding rectangle is under the cursor are stroked
+            if isinstance(item, EdgeItem) and stroker.createStroke(item.path()).contains(scenePos):
+                return item
+        return None
 
+    def monitorFlow(self, flowId):
+        '''Opens a live plot of the data a flow carries in the current run'''
+        if self.NeuroweaverProcess is None or self.NeuroweaverProcess.poll() is not None:
+            self.statusBar().showMessage("Run the graph to monitor the data of its flows", 5000)
+            return
+        from GUI.ringBuffer import flowSegmentNames
+        from GUI.signalMonitor import SignalMonitor
+        output, start, pipe, end = self.model.savedFlow(flowId)[:4]
+        segment = flowSegmentNames(self.runFlows, self.runId).get((start, output))
+        if segment is None:
+            self.statusBar().showMessage("This flow is not part of the running graph", 5000)
+            return
+        monitor = SignalMonitor(segment, f"{start}.{output} -> {end}.{pipe}", self)
+        monitor.setAttribute(Qt.WA_DeleteOnClose)
+        monitor.destroyed.connect(lambda _, monitor=monitor: self.monitors.remove(monitor) if monitor in self.monitors else None)
+        self.monitors.append(monitor)
+        monitor.show()
+
+    def closeMonitors(self):
+        '''Closes the signal monitors, which only show the run they were opened for'''
+        for monitor in list(self.monitors):
+            monitor.close()
+        self.monitors = []
 
-    def mouseMoveEvent(self, event):
-        '''Updates the end point of the edge as the mouse is moved, to be used when the node moves'''
-        if self.currentNode:
-            self.end_point = event.pos()
-            self.update()
+    def drawEdge(self, flowId):
+        '''Creates the curve of a flow between its start and end nodes and stores it in edgeItems'''
+        flow = self.model.flows[flowId]
+        edge = EdgeItem(self.nodeItems[flow[1]], self.nodeItems[flow[3]])
+        edge.flowId = flowId
+        self.scene.addItem(edge)
+        self.edgeItems[flowId] = edge
 
-    def mouseDoubleClickEvent(self, event):
+    def nodeDoubleClicked(self, scenePos):
         '''Opens a dialog to edit the node properties when a node is double-clicked'''
-        super().mouseDoubleClickEvent(event)
-        found_node = None
-        for node in self.nodesGUI:
-            if node.geometry().contains(event.pos()):
-                found_node = node
-                break
-        changed = None
-        if found_node:
-            toBeDeleted = None
-            for name, node in self.components.items():
-                if node['GUI'] == found_node:
-                    dialog = ComponentConfigDialog(node['Info'], self.config)
-                    result = dialog.exec_()
-                    if result == 1: # The user changed the node type or input-output configuration. Therefore all connections should be deleted
-                        updated_info = dialog.get_inputs()
-                        node['Info'].update(updated_info)
-                        print(f"Updated {name} with new information")
-                        self.deleteComponentAndFlows(name)
-                        if name != updated_info['Name']:
-                            changed = (name, updated_info['Name'])
-                    elif result == 2:  # The user wants to delete the node
-                        toBeDeleted = name
-                        found_node.setParent(None)
-                        self.nodesGUI.remove(found_node)
-                        print(f"Deleted {name}")
-                    elif result == 3: # The user changed the name of the node, only change the appearance of the node
-                        updated_info = dialog.get_inputs()
-                        node['Info'].update(updated_info)
-                        changed = (name, updated_info['Name'])
-                    elif result == 4: # The user changed the parameters of the component
-                        updated_info = dialog.get_inputs()
-                        node['Info'].update(updated_info)
-                    else:
-                        print("cancelled")
-                    self.update()
-                    break
-            if toBeDeleted:
-                self.deleteComponentAndFlows(toBeDeleted)
-                del self.components[toBeDeleted]
-            if changed: # change the name, update the appearance, and dictionary key
-                for flow in self.flows:
-                    if flow[1] == changed[0]:
-                        flow[1] = changed[1]
-                    if flow[3] == changed[0]:
-                        flow[3] = changed[1]
-                # 'changed' is a tuple (old_name, new_name)
-                old_name, new_name = changed
-                gui_node = self.components[old_name]['GUI']
-                gui_node.name = new_name  # Update the node's name in the GUI
-                gui_node.setText(new_name) 
-                changed = None
-                self.components[new_name] = self.components.pop(old_name)  # Update the key in the components dictionary
-                print(self.flows)
-                self.update()
-                
-
-    def deleteComponentAndFlows(self, componentName):
-        # Remove any flows associated with the deleted component
-        self.flows = [flow for flow in self.flows if flow[1] != componentName and flow[3] != componentName]
-        # Update GUI elements for edges
-        new_edgesGUI = []
-        for start_node, end_node in self.edgesGUI:
-            if start_node.name != componentName and end_node.name != componentName:
-                new_edgesGUI.append((start_node, end_node))
-        self.edgesGUI = new_edgesGUI
-        self.update()  # Refresh the GUI to reflect these changes
-    
-    def paintEvent(self, event):
-        '''Draws the edges between the nodes'''
-        super().paintEvent(event)
-        painter = QPainter(self)
-        pen = QPen(Qt.white, 2)
-        painter.setPen(pen)
-
-        for start_node, end_node in self.edgesGUI:
-            start_pos = start_node.pos() + QPoint(start_node.width() // 2, start_node.height() // 2)
-            end_pos = end_node.pos() + QPoint(end_node.width() // 2, end_node.height() // 2)
-            
-            path = QPainterPath(start_pos)
-            # Control points are chosen to create a smooth curve, modify as necessary
-            ctrl1 = QPoint((start_pos.x() + end_pos.x()) // 2, start_pos.y())
-            ctrl2 = QPoint((start_pos.x() + end_pos.x()) // 2, end_pos.y())
-            path.cubicTo(ctrl1, ctrl2, end_pos)
-            
-            painter.drawPath(path)
+        found_node = self.nodeAt(scenePos)
+        if found_node is None or found_node.componentId not in self.model.components:
+            return
+        componentId = found_node.componentId
+        name = self.model.name(componentId)
+        if self.configDialog is None:
+            self.configDialog = ComponentConfigDialog(self.model.info(componentId), self.config)
+        else:
+            self.configDialog.edit(self.model.info(componentId))
+        dialog = self.configDialog
+        result = dialog.exec_()
+        if result == 1: # The user changed the node type or input-output configuration. Therefore all connections should be deleted
+            with self.history.command("Change component"):
+                self.deleteComponentAndFlows(componentId)
+                self.updateComponent(componentId, dialog.get_inputs())
+            print(f"Updated {name} with new information")
+        elif result == 2:  # The user wants to delete the node
+            self.deleteComponent(componentId)
+            print(f"Deleted {name}")
+        elif result in (3, 4): # The user changed the name or the parameters of the component, only the appearance of the node changes
+            self.updateComponent(componentId, dialog.get_inputs())
+        else:
+            print("cancelled")
+
+    def updateComponent(self, componentId, updated_info):
+        '''Stores the edited component info, the node is renamed by onModelEvent. Flows refer to component ids, so a rename does not touch them'''
+        try:
+            with self.history.command("Edit component"):
+                self.model.updateComponent(componentId, updated_info)
+        except ValueError as e:
+            QMessageBox.warning(self, "Rename Failed", str(e))
+
+    def deleteComponent(self, componentId):
+        '''Removes a component and its flows as one undo step, their visuals are removed by onModelEvent'''
+        with self.history.command("Delete component"):
+            self.deleteComponentAndFlows(componentId)
+            self.model.removeComponent(componentId)
+
+    def deleteComponentAndFlows(self, componentId):
+        '''Removes the flows entering or leaving a component. Only the component's own flows are visited'''
+        self.model.removeFlowsOf(componentId)
+
+    def onModelEvent(self, event):
+        '''Keeps the nodes and edges in step with the graph model'''
+        op = event['op']
+        itemId = event['id']
+        if op == 'addComponent':
+            self.createNode(itemId, self.removedPositions.pop(itemId, None))
+        elif op == 'removeComponent':
+            node = self.nodeItems.pop(itemId)
+            self.removedPositions[itemId] = (node.x(), node.y())
+            if self.currentNode is node:
+                self.currentNode = None
+            self.scene.removeItem(node)
+        elif op == 'renameComponent':
+            node = self.nodeItems[itemId]
+            node.name = event['new'] # Update the node's name in the GUI
+            node.setText(event['new'])
+        elif op == 'addFlow':
+            self.drawEdge(itemId)
+        elif op == 'removeFlow':
+            edge = self.edgeItems.pop(itemId)
+            edge.detach()
+            self.scene.removeItem(edge)
+
+    def undo(self):
+        '''Reverts the last edit (Ctrl+Z)'''
+        label = self.history.undo()
+        if label:
+            self.statusBar().showMessage(f"Undid {label}", 2000)
+
+    def redo(self):
+        '''Applies the last undone edit again (Ctrl+Y or Ctrl+Shift+Z)'''
+        label = self.history.redo()
+        if label:
+            self.statusBar().showMessage(f"Redid {label}", 2000)
 
     def save(self):
         '''Saves the graph to a user-selected directory as components.json and flows.json'''
@@ -298,42 +435,170 @@ class createGraph(QMainWindow):
             QMessageBox.information(self, "Save Cancelled", "No folder was selected.")
             return
 
-        # Attempt to save components.json and flows.json in the selected folder
+        # Attempt to save components.json and flows.json in the selected folder, the result is reported by onSaveFinished
         try:
-            saveNode = {}
-            for name, node in self.components.items():
-                saveNode[name] = node['Info']
-
-            with open(f'{folder_path}/nodes.json', 'w') as file:
-                json.dump(saveNode, file)
-            with open(f'{folder_path}/flows.json', 'w') as file:
-                json.dump(self.flows, file)
-            
-            QMessageBox.information(self, "Save Successful", "The graph has been successfully saved!")
+            self.saveToFolder(folder_path)
         except Exception as e:
             QMessageBox.critical(self, "Save Failed", f"Failed to save files: {str(e)}")
 
+    def saveToFolder(self, folder_path):
+        '''Writes nodes.json, flows.json and the binary graph.nwg, which also keeps the node positions, to folder_path.
+        The files are serialised here and written on the autosave writer thread, saveFinished is emitted when they are on disk'''
+        components = self.model.nodeDict()
+        flows = self.flows
+        sequence = self.autosave.sequence
+        # Each file is written to a temporary file and renamed, a crash mid-save leaves the previous version intact
+        nodesData = json.dumps(components).encode('utf-8')
+        flowsData = json.dumps(flows).encode('utf-8')
+        # The binary records the JSON pair it was saved with, loading uses it only while that pair is unchanged
+        files = [(f'{folder_path}/nodes.json', nodesData),
+                 (f'{folder_path}/flows.json', flowsData),
+                 (f'{folder_path}/{BINARY_NAME}', packGraph(components, flows, self.nodePositions(), sourceDigest(nodesData, flowsData)))]
+
+        def done(error):
+            if error is None:
+                self.savedSequence = sequence # Set here rather than in the slot so closeEvent sees it after a flush
+            self.saveFinished.emit(folder_path, '' if error is None else str(error))
+        self.autosave.writeFiles(files, done)
+
+    def onSaveFinished(self, folder_path, error):
+        '''Reports the result of a save started by save()'''
+        if error:
+            QMessageBox.critical(self, "Save Failed", f"Failed to save files to {folder_path}: {error}")
+        else:
+            self.statusBar().showMessage(f"Saved the graph to {folder_path}", 5000)
+
+    def nodePositions(self):
+        '''Current node positions {name: (x, y)}'''
+        return {self.model.name(componentId): (node.x(), node.y()) for componentId, node in self.nodeItems.items()}
+
+    def restoreSession(self, directory):
+        '''Shows the graph recovered from an autosave session left by a previous run, then deletes that session'''
+        self.loadModel(recoverSession(directory))
+        self.savedSequence = -1 # Recovered work has not been saved yet
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def closeEvent(self, event):
+        '''Stops the autosave. Its journal is kept for recovery only if there are unsaved changes'''
+        self.autosave.flush() # Lets a save still being written finish first
+        if self.autosave.sequence == self.savedSequence:
+            self.autosave.discard()
+        else:
+            self.autosave.close()
+        self.profileTimer.stop()
+        self.releaseProfile()
+        self.closeMonitors()
+        super().closeEvent(event)
+
     def runNeuroweaver(self):
-        '''Starts the Neuroweaver workflow'''
-        print("Since the NeuroWeaver code is not available, this button does nothing.")
-        # if self.NeuroweaverProcess is None:
-        #     # Start the process
-        #     runData = {'config': self.config, 'components': {name: node['Info'] for name, node in self.components.items()}, 'flows': self.flows}
-        #     with open('GUI/temp.json', 'w') as f:
-        #         json.dump(runData, f)
-        #     self.NeuroweaverProcess = subprocess.Popen(["python3", "GUI/runner.py"])
-        #     self.runButton.setText("Stop")
-        # else:
-        #     self.stopNeuroweaver()
+        '''Starts the Neuroweaver workflow in a separate process running GUI/runner.py'''
+        if self.NeuroweaverProcess is not None and self.NeuroweaverProcess.poll() is not None:
+            self.NeuroweaverProcess = None # The previous run has finished on its own
+            self.runButton.setText("Run")
+        if self.NeuroweaverProcess is None:
+            import subprocess
+            from GUI.planCache import cachedPlanPath
+            from GUI.ringBuffer import newRunId
+            runData = {'config': self.config, 'components': self.model.nodeDict(), 'flows': self.model.flowList()}
+            self.closeMonitors()
+            self.runId = newRunId()
+            self.runFlows = runData['flows']
+            command = [sys.executable, "-m", "GUI.runner", "--shared-buffers", "--run-id", self.runId]
+            plan = cachedPlanPath(runData['components'], runData['flows'], self.config, self.component_config)
+            if os.path.exists(plan):
+                command += ["--plan", plan] # Unchanged since it last ran: already validated and compiled
+            elif not self.validateRun(runData):
+                return
+            # The runner validates again, so the plan it compiles is cached and the next run can start from it. With
+            # --plan the graph is still passed, it is compiled if the plan cannot be loaded (e.g. another Python version)
+            with open('GUI/temp.json', 'w') as f:
+                json.dump(runData, f)
+            command += ["--temp", "GUI/temp.json"]
+            self.releaseProfile()
+            if self.profileButton.isChecked():
+                # The editor owns the histograms, so they stay readable once the run has ended
+                from GUI.runProfile import ProfileHistograms, profileSeries
+                self.profile = ProfileHistograms(profileSeries(runData['components'], runData['flows']), runId=self.runId)
+                command += ["--profile-segment", self.profile.name]
+                self.profileTimer.start()
+            if self.recordButton.isChecked():
+                command.append("--record")
+            # Start the process
+            self.NeuroweaverProcess = subprocess.Popen(command)
+            self.runButton.setText("Stop")
+        else:
+            self.stopNeuroweaver()
+
+    def validateRun(self, runData, shown=20):
+        '''Validates the graph before a run. Errors block the run, warnings ask for confirmation. Returns True to go ahead'''
+        from GUI.graphValidation import validateGraph
+        report = validateGraph(runData['components'], runData['flows'], runData['config'], self.component_config)
+        self.statusBar().showMessage(report.summary(), 10000)
+        if report.ok and not report.warnings:
+            return True
+        issues = report.errors or report.warnings
+        details = "\n".join(str(issue) for issue in issues[:shown])
+        if len(issues) > shown:
+            details += f"\n... and {len(issues) - shown} more"
+        if not report.ok:
+            QMessageBox.critical(self, "Graph Not Valid", f"The graph cannot be run:\n{details}\n\n{report.summary()}")
+            return False
+        reply = QMessageBox.question(self, "Graph Warnings", f"{details}\n\n{report.summary()}\n\nRun anyway?",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+        return reply == QMessageBox.Yes
 
     def stopNeuroweaver(self):
         '''Stops the Neuroweaver workflow'''
-        print("Since the NeuroWeaver code is not available, this button does nothing.")
-        # if self.NeuroweaverProcess:
-        #     parent = psutil.Process(self.NeuroweaverProcess.pid)
-        #     for child in parent.children(recursive=True):  # terminate child processes
-        #         child.kill()
-        #     parent.kill()
-        #     process = subprocess.Popen(['python3','GUI/cleanup.py'])
-        #     self.NeuroweaverProcess = None
-        #     self.runButton.setText("Run")        
+        if self.NeuroweaverProcess:
+            import psutil
+            from GUI.ringBuffer import cleanupSegments
+            try:
+                parent = psutil.Process(self.NeuroweaverProcess.pid)
+                for child in parent.children(recursive=True):  # terminate child processes
+                    child.kill()
+                parent.kill()
+            except psutil.NoSuchProcess:
+                pass # Already finished
+            if self.profileTimer.isActive():
+                self.updateProfileOverlay()
+            self.profileTimer.stop()
+            cleanupSegments(self.runId) # A killed runner cannot release its shared flow buffers
+            self.NeuroweaverProcess = None
+            self.runButton.setText("Run")
+
+    def updateProfileOverlay(self):
+        '''Tints every node by its p99 call latency in the running (or last) profiled run'''
+        import numpy as np
+        if self.profile is None:
+            self.profileTimer.stop()
+            return
+        finished = self.NeuroweaverProcess is None or self.NeuroweaverProcess.poll() is not None
+        latencies = self.profile.p99()
+        if latencies:
+            # Log scale, so one slow component does not make every other node look equally fast
+            fastest, slowest = max(min(latencies.values()), 1e-3), max(max(latencies.values()), 1e-3)
+            span = np.log(slowest / fastest) if slowest > fastest else 1.0
+            for node in self.nodeItems.values():
+                latency = latencies.get(node.text())
+                node.setLatency(latency, 0.0 if latency is None else float(np.log(max(latency, fastest) / fastest) / span))
+        if finished:
+            self.profileTimer.stop()
+
+    def releaseProfile(self):
+        '''Clears the latency overlay and detaches from the histograms of the last profiled run'''
+        if self.profile is not None:
+            self.profile.close()
+            self.profile = None
+        for node in self.nodeItems.values():
+            node.setLatency(None)
+
+    def exportProfile(self):
+        '''Saves the latency report of the last profiled run as JSON'''
+        if self.profile is None:
+            QMessageBox.information(self, "No Profile", "Run the graph with Profile switched on first.")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Export Profile", "profile.json", "JSON files (*.json)")
+        if path:
+            with open(path, 'w') as file:
+                json.dump(self.profile.report(), file, indent=4)
+            self.statusBar().showMessage(f"Profile exported to {path}", 5000)
@@ -0,0 +1,131 @@
+# Undo/redo history of the graph editor.
+# The history listens to the change events of a GraphModel (see GUI/graphModel.py) and keeps them as commands: the
+# events produced by one user action, grouped with command(). Events are small deltas (ids, names and the info or
+# flow they touched) rather than copies of the graph, and only the last `depth` commands are kept, so memory stays
+# bounded however large the graph is. Undo reverts the events of a command in reverse order through the model, redo
+# replays them; listeners of the model (the canvas, the autosave journal) follow along through the usual events.
+
+from collections import deque
+from contextlib import contextmanager
+
+UNDO_DEPTH = 200  # Commands kept when the configuration has no "Undo Depth"
+
+
+def revertEvent(model, event):
+    '''Applies the opposite of a model change event.'''
+    op = event['op']
+    if op == 'addComponent':
+        model.removeComponent(event['id'])
+    elif op == 'removeComponent':
+        model.addComponent(event['info'], event['id'])
+    elif op == 'renameComponent':
+        model.renameComponent(event['id'], event['old'])
+    elif op == 'updateComponent':
+        model.updateComponent(event['id'], event['old'], event.get('added', ()))
+    elif op == 'addFlow':
+        model.removeFlow(event['id'])
+    elif op == 'removeFlow':
+        output, startId, pipe, endId, *options = event['flow']
+        model.addFlow(output, startId, pipe, endId, options[0] if options else None, event['id'])
+
+
+def replayEvent(model, event):
+    '''Applies a model change event again.'''
+    op = event['op']
+    if op == 'addComponent':
+        model.addComponent(event['info'], event['id'])
+    elif op == 'removeComponent':
+        model.removeComponent(event['id'])
+    elif op == 'renameComponent':
+        model.renameComponent(event['id'], event['new'])
+    elif op == 'updateComponent':
+        model.updateComponent(event['id'], event['new'], event.get('removed', ()))
+    elif op == 'addFlow':
+        output, startId, pipe, endId, *options = event['flow']
+        model.addFlow(output, startId, pipe, endId, options[0] if options else None, event['id'])
+    elif op == 'removeFlow':
+        model.removeFlow(event['id'])
+
+
+class EditHistory:
+    '''Bounded undo/redo stacks of model change events.'''
+    def __init__(self, model, depth=UNDO_DEPTH):
+        self.undoStack = deque(maxlen=depth)  # (label, events) of the most recent commands
+        self.redoStack = []
+        self.model = None
+        self._group = None  # Events of the command being recorded
+        self._nesting = 0
+        self._replaying = False
+        self.attach(model)
+
+    def attach(self, model):
+        '''Follows another model, e.g. after a graph was loaded. The history starts empty.'''
+        if self.model is not None:
+            self.model.removeListener(self.record)
+        self.model = model
+        model.addListener(self.record)
+        self.clear()
+
+    def clear(self):
+        self.undoStack.clear()
+        self.redoStack.clear()
+
+    def record(self, event):
+        '''Model listener: adds the event to the current command, or makes it a command of its own.'''
+        if self._replaying:
+            return
+        if self._group is not None:
+            self._group.append(event)
+            return
+        self.undoStack.append((event['op'], [event]))
+        self.redoStack.clear()
+
+    @contextmanager
+    def command(self, label):
+        '''Groups the events of a user action, e.g. deleting a component and its flows, into one undo step.'''
+        if self._nesting == 0:
+            self._group = []
+        self._nesting += 1
+        try:
+            yield
+        finally:
+            self._nesting -= 1
+            if self._nesting == 0:
+                events, self._group = self._group, None
+                if events:
+                    self.undoStack.append((label, events))
+                    self.redoStack.clear()
+
+    def canUndo(self):
+        return bool(self.undoStack)
+
+    def canRedo(self):
+        return bool(self.redoStack)
+
+    def undo(self):
+        '''Reverts the last command and returns its label, or None if there is nothing to undo.'''
+        if not self.undoStack:
+            return None
+        label, events = self.undoStack.pop()
+        self._replaying = True
+        try:
+            for event in reversed(events):
+                revertEvent(self.model, event)
+        finally:
+            self._replaying = False
+        self.redoStack.append((label, events))
+        return label
+
+    def redo(self):
+        '''Applies the last undone command again and returns its label, or None if there is nothing to redo.'''
+        if not self.redoStack:
+            return None
+        label, events = self.redoStack.pop()
+        self._replaying = True
+        try:
+            for event in events:
+                replayEvent(self.model, event)
+        finally:
+            self._replaying = False
+        self.undoStack.append((label, events))
+        return label
@@ -0,0 +1,359 @@
+# Recording of flow data to disk and replay of recordings into a graph.
+# With `python3 -m GUI.runner --record` (or the Record button of the graph editor) every port feeding a flow, or the
+# ports listed as "component.port,...", is recorded under <Save Path>/recordings/<date>-<run id>/:
+#     manifest.json               the graph, configuration and per-port shape, dtype and item counts
+#     <component>.<port>/data_00000.npy, times_00000.npy, data_00001.npy, ...
+# Chunks are ordinary .npy files (np.load works on them), filled as memory maps of about CHUNK_BYTES each; times hold
+# the nanoseconds since the start of the recording at which each item was published.
+#
+# The engine's publishing wrapper only copies every value into a preallocated in-memory staging ring per port. A
+# writer thread moves the staged items into the memory-mapped chunks and creates and flushes the chunk files, so the
+# real-time loop never waits for the disk. If the disk falls so far behind that a staging ring fills up, items are
+# dropped (and counted in the manifest) rather than stalling the loop.
+#
+# Replay (`--replay <recording>`) feeds a recording back into the same graph: the source components (those no flow
+# feeds) whose ports were recorded are not called, their recorded values are read from the memory-mapped chunks
+# instead, without copying. The rest of the graph, e.g. the learning components, runs on them as it did live, at the
+# original pace (`--replay-speed 1`), faster (`--replay-speed 10`) or as fast as it can (`--replay-speed 0`).
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from GUI.graphEngine import parseShape
+from GUI.graphIO import atomicWrite
+
+RECORDING_DIR = "recordings"
+MANIFEST_NAME = "manifest.json"
+RECORDING_VERSION = 1
+CHUNK_BYTES = 64 << 20  # Size of a chunk file, chunks hold at least one item
+STAGING_BYTES = 32 << 20  # Memory per port for items not written yet, at least MIN_STAGING items
+MIN_STAGING = 256
+WRITE_INTERVAL = 0.02  # Seconds the writer thread waits when there is nothing to write
+MIN_SLEEP = 200_000  # Nanoseconds a replay must be ahead of the recording before it sleeps
+
+
+def recordingDirectory(config, runId):
+    '''New recording directory of a run under the configured Save Path.'''
+    return os.path.join(config.get('Save Path', '.'), RECORDING_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{runId}")
+
+
+def publishedPorts(components, flows):
+    '''(component name, port) of every output or state port feeding a flow, in flow order.'''
+    ports = []
+    for output, start, pipe, end in (flow[:4] for flow in flows):
+        if start in components and (start, output) not in ports:
+            ports.append((start, output))
+    return ports
+
+
+def parsePortList(text):
+    '''Parses "component.port,component.port" into (component name, port) pairs.'''
+    ports = []
+    for entry in text.split(','):
+        name, dot, port = entry.strip().rpartition('.')
+        if not dot or not name or not port:
+            raise ValueError(f"Expected component.port, got {entry.strip()!r}")
+        ports.append((name, port))
+    return ports
+
+
+def _portKey(name, port):
+    return f"{name}.{port}"
+
+
+def _chunkPath(directory, kind, index):
+    return os.path.join(directory, f"{kind}_{index:05d}.npy")
+
+
+class _PortRecording:
+    '''Staging ring and current chunk of one recorded port.'''
+    def __init__(self, directory, shape, dtype, chunkBytes, stagingBytes):
+        self.directory = directory
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        itemBytes = max(int(np.prod(shape, dtype=np.int64)) * self.dtype.itemsize, 1)
+        self.chunkItems = max(chunkBytes // itemBytes, 1)
+        self.staging = np.empty((max(stagingBytes // itemBytes, MIN_STAGING),) + shape, dtype=self.dtype)
+        self.times = np.empty(len(self.staging), dtype=np.int64)
+        self.recorded = 0  # Items copied into the staging ring by the engine
+        self.written = 0  # Items moved into chunks by the writer thread
+        self.dropped = 0
+        self.chunks = 0
+        self.chunk = None  # Memory maps of the chunk being filled
+        self.chunkTimes = None
+        self.fill = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def nextChunk(self):
+        self.closeChunk()
+        self.chunk = np.lib.format.open_memmap(_chunkPath(self.directory, 'data', self.chunks), mode='w+',
+                                               dtype=self.dtype, shape=(self.chunkItems,) + self.shape)
+        self.chunkTimes = np.lib.format.open_memmap(_chunkPath(self.directory, 'times', self.chunks), mode='w+',
+                                                    dtype=np.int64, shape=(self.chunkItems,))
+        self.chunks += 1
+        self.fill = 0
+
+    def closeChunk(self):
+        '''Flushes the current chunk. A partly filled chunk is rewritten with only its items.'''
+        if self.chunk is None:
+            return
+        index = self.chunks - 1
+        if self.fill == self.chunkItems:
+            self.chunk.flush()
+            self.chunkTimes.flush()
+            self.chunk = self.chunkTimes = None
+            return
+        data, times = np.array(self.chunk[:self.fill]), np.array(self.chunkTimes[:self.fill])
+        self.chunk = self.chunkTimes = None  # Unmaps the files before they are replaced
+        if self.fill:
+            np.save(_chunkPath(self.directory, 'data', index), data)
+            np.save(_chunkPath(self.directory, 'times', index), times)
+        else:
+            os.remove(_chunkPath(self.directory, 'data', index))
+            os.remove(_chunkPath(self.directory, 'times', index))
+            self.chunks -= 1
+
+    def drain(self):
+        '''Moves the staged items into chunks. Runs on the writer thread only.'''
+        size = len(self.staging)
+        recorded = self.recorded
+        moved = recorded - self.written
+        while self.written < recorded:
+            if self.chunk is None or self.fill == self.chunkItems:
+                self.nextChunk()
+            start = self.written % size
+            count = min(recorded - self.written, size - start, self.chunkItems - self.fill)
+            self.chunk[self.fill:self.fill + count] = self.staging[start:start + count]
+            self.chunkTimes[self.fill:self.fill + count] = self.times[start:start + count]
+            self.fill += count
+            self.written += count  # Only now may the engine reuse the staging slots
+        return moved
+
+
+class FlowRecorder:
+    '''Records the values published on a run's flows into memory-mapped chunk files, see the notes above.'''
+    def __init__(self, directory, components, flows, config, ports=None, chunkBytes=CHUNK_BYTES, stagingBytes=STAGING_BYTES):
+        self.directory = directory
+        self.components = components
+        self.flows = flows
+        self.config = config
+        published = publishedPorts(components, flows)
+        ports = published if ports is None else list(ports)
+        for name, port in ports:
+            if (name, port) not in published:
+                raise ValueError(f"{_portKey(name, port)} does not feed a flow and cannot be recorded")
+        self.ports = {}  # (component name, port) -> _PortRecording
+        for name, port in ports:
+            info = components[name]
+            shape = parseShape(info.get('outputs', {}).get(port) or info.get('state', {}).get(port), config)
+            self.ports[(name, port)] = _PortRecording(os.path.join(directory, _portKey(name, port).replace(os.sep, '_')),
+                                                      shape, 'float64', chunkBytes, stagingBytes)
+        self.origin = time.perf_counter_ns()
+        self.closing = False
+        self.writeManifest()
+        self.thread = threading.Thread(target=self._run, name="flow recorder", daemon=True)
+        self.thread.start()
+
+    def recorder(self, name, port):
+        '''Returns record(value) staging one value of a port, or None if the port is not recorded.'''
+        recording = self.ports.get((name, port))
+        if recording is None:
+            return None
+        staging, times = recording.staging, recording.times
+        size = len(staging)
+        clock, origin = time.perf_counter_ns, self.origin
+
+        def record(value):
+            count = recording.recorded
+            if count - recording.written >= size:
+                recording.dropped += 1  # The writer is behind, never wait for it
+                return
+            staging[count % size] = value
+            times[count % size] = clock() - origin
+            recording.recorded = count + 1
+        return record
+
+    def _run(self):
+        while True:
+            closing = self.closing
+            try:
+                moved = sum(recording.drain() for recording in self.ports.values())
+            except OSError as e:
+                print(f"Recording failed: {e}")
+                return
+            if closing:
+                return
+            if not moved:
+                time.sleep(WRITE_INTERVAL)  # Only idles while the engine publishes nothing new
+
+    def writeManifest(self):
+        ports = {_portKey(name, port): {'component': name, 'port': port,
+                                        'directory': os.path.basename(recording.directory),
+                                        'shape': list(recording.shape), 'dtype': recording.dtype.str,
+                                        'items': recording.written, 'dropped': recording.dropped,
+                                        'chunks': recording.chunks, 'chunkItems': recording.chunkItems}
+                 for (name, port), recording in self.ports.items()}
+        manifest = {'version': RECORDING_VERSION, 'ports': ports, 'config': self.config,
+                    'components': self.components, 'flows': self.flows}
+        atomicWrite(os.path.join(self.directory, MANIFEST_NAME), json.dumps(manifest, indent=4).encode('utf-8'))
+
+    def close(self):
+        '''Writes whatever is still staged, closes the chunks and completes the manifest. Returns the manifest's ports.'''
+        if self.thread is not None:
+            self.closing = True
+            self.thread.join()
+            self.thread = None
+            for recording in self.ports.values():
+                recording.closeChunk()
+            self.writeManifest()
+        return {_portKey(name, port): (recording.written, recording.dropped) for (name, port), recording in self.ports.items()}
+
+
+class RecordingTap:
+    '''Stands in for a ring buffer or remote sender in the engine's publishing wrapper and records every published value.'''
+    __slots__ = ('push',)
+
+    def __init__(self, target, record):
+        if target is None:
+            def push(value):
+                record(value)
+                return value
+        else:
+            targetPush = target.push
+
+            def push(value):
+                view = targetPush(value)
+                record(view)
+                return view
+        self.push = push
+
+
+class _PortReader:
+    '''Reads the items of one recorded port in order, mapping one chunk at a time.'''
+    def __init__(self, directory, info):
+        self.directory = directory
+        self.items = info['items']
+        self.chunks = info['chunks']
+        self.chunk = self.times = None
+        self.index = 0  # Next item within the chunk
+        self.loaded = -1  # Chunk currently mapped
+
+    def load(self, index):
+        # Plain ndarray views of the maps: indexing an np.memmap costs several times more per item
+        self.chunk = np.asarray(np.load(_chunkPath(self.directory, 'data', index), mmap_mode='r'))
+        self.times = np.asarray(np.load(_chunkPath(self.directory, 'times', index), mmap_mode='r'))
+        self.loaded = index
+        self.index = 0
+
+    def ensure(self):
+        if self.chunk is None or self.index == len(self.chunk):
+            self.load(self.loaded + 1)
+
+    def nextTime(self):
+        '''Nanoseconds into the recording at which the next item was published.'''
+        self.ensure()
+        return int(self.times[self.index])
+
+    def next(self):
+        '''Read-only view of the next item, backed by the page cache.'''
+        self.ensure()
+        value = self.chunk[self.index]
+        self.index += 1
+        return value
+
+
+class Recording:
+    '''A recording directory written by FlowRecorder.'''
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_NAME), 'r') as file:
+            manifest = json.load(file)
+        if manifest.get('version') != RECORDING_VERSION:
+            raise ValueError(f"{directory} was recorded by an incompatible version")
+        self.ports = {(info['component'], info['port']): info for info in manifest['ports'].values()}
+        self.config = manifest['config']
+        self.components = manifest['components']
+        self.flows = manifest['flows']
+
+    def reader(self, name, port):
+        return _PortReader(os.path.join(self.directory, self.ports[(name, port)]['directory']), self.ports[(name, port)])
+
+    def load(self, name, port):
+        '''(values, times) of a whole recorded port, as memory maps of its chunks concatenated.'''
+        reader = self.reader(name, port)
+        values, times = [], []
+        for index in range(reader.chunks):
+            reader.load(index)
+            values.append(reader.chunk)
+            times.append(reader.times)
+        if not values:
+            info = self.ports[(name, port)]
+            return np.empty((0,) + tuple(info['shape']), dtype=info['dtype']), np.empty(0, dtype=np.int64)
+        return np.concatenate(values), np.concatenate(times)
+
+
+class FlowReplay:
+    '''Replaces components of a graph by the values recorded on their ports, paced like the recording.'''
+    def __init__(self, recording, components, flows, config, replayed=None, speed=1.0, periods=None):
+        self.recording = recording
+        self.speed = speed
+        if replayed is None:
+            # Sources: components no flow feeds, whose published ports were all recorded
+            fed = {end for output, start, pipe, end in (flow[:4] for flow in flows)}
+            published = publishedPorts(components, flows)
+            replayed = [name for name in components if name not in fed and
+                        any(start == name for start, _ in published) and
+                        all((start, output) in recording.ports for start, output in published if start == name)]
+        self.components = set(replayed)
+        if not self.components:
+            raise ValueError(f"No component of the graph can be replayed from {recording.directory}")
+        self.readers = {}  # (component name, port) -> _PortReader
+        for name in self.components:
+            if name not in components:
+                raise ValueError(f"{name} is not a component of the graph")
+            info = components[name]
+            for port in list(info.get('outputs', {})) + list(info.get('state', {})):
+                if (name, port) not in recording.ports:
+                    continue
+                shape = parseShape(info.get('outputs', {}).get(port) or info['state'][port], config)
+                recorded = tuple(recording.ports[(name, port)]['shape'])
+                if shape != recorded:
+                    raise ValueError(f"{name}.{port} was recorded with shape {recorded} but the graph declares {shape}")
+                self.readers[(name, port)] = recording.reader(name, port)
+            if not any(key[0] == name for key in self.readers):
+                raise ValueError(f"No port of {name} was recorded in {recording.directory}")
+        periods = periods or {}  # Component name -> iterations between its calls, see GUI/graphEngine.componentPeriods
+        # Iterations the recording can feed: a component called every n-th iteration published one item per n iterations
+        self.length = min(reader.items * periods.get(name, 1) for (name, port), reader in self.readers.items())
+        # Port whose publishing times pace the replay, and its component: pacing runs only when that component does,
+        # so each of its recorded times is matched with the call that replays it
+        (self.clockComponent, _), self.clock = next(iter(self.readers.items()))
+        self.origin = None
+        self.dropped = sum(recording.ports[key]['dropped'] for key in self.readers)
+
+    def function(self, name, ports, defaults):
+        '''Stands in for a replayed component: returns its recorded values, or `defaults` for the ports not recorded.'''
+        readers = [self.readers.get((name, port)) for port in ports]
+        if len(readers) == 1:
+            reader, default = readers[0], defaults[0]
+            return (lambda *args: reader.next()) if reader is not None else (lambda *args: default)
+
+        def replayed(*args):
+            return tuple(default if reader is None else reader.next() for reader, default in zip(readers, defaults))
+        return replayed
+
+    def pace(self):
+        '''Waits until the next item of the clock port is due at the replay speed. Bound right before the clock component,
+        in its calls, so it runs on the iterations where that component is called.'''
+        recorded = self.clock.nextTime()
+        now = time.perf_counter_ns()
+        if self.origin is None:
+            self.origin = now - recorded / self.speed
+        delay = self.origin + recorded / self.speed - now
+        if delay > MIN_SLEEP:
+            # Shorter waits are skipped, sleeping overshoots them; the fixed origin keeps the pace from drifting
+            time.sleep(delay / 1e9)
@@ -0,0 +1,198 @@
+# ZeroMQ transport for flows that cross machine boundaries.
+# A flow is marked remote by a fifth element holding its transport options, e.g.
+#     ["frame", "camera", "frame", "policy", {"transport": "zmq", "pattern": "pushpull",
+#                                              "bind": "tcp://*:5555", "connect": "tcp://camera-box:5555"}]
+# The producer side binds and the consumer side connects; "endpoint" can be given instead of bind/connect when both
+# addresses are the same (ipc:// or tcp://127.0.0.1 on one machine). Every remote flow needs its own bind address.
+# Patterns are PUSH/PULL (lossless, blocks when the consumer falls behind) and PUB/SUB (drops messages for slow
+# consumers, and everything sent before the subscriber has joined, so both ends of a PUB/SUB flow cannot run in the
+# same process). A consumer waiting longer than "timeout" seconds (RECEIVE_TIMEOUT by default, 0 waits forever) for
+# the next array stops the run with an error instead of hanging.
+#
+# Arrays travel as two-frame multipart messages: a small fixed header (sequence, send time, dtype, shape) followed by
+# the raw array buffer, sent with copy=False and received as a NumPy view over the ZeroMQ frame.
+#
+# Throughput and latency can be measured on a single machine with the loopback benchmark:
+#     python3 -m GUI.flowTransport --pattern pushpull --endpoint ipc:///tmp/nw-flow --shape 3,4096
+# pyzmq is imported when the first socket is opened, so the engine can check flows for remote transport cheaply.
+
+import argparse
+import json
+import multiprocessing
+import socket
+import struct
+import time
+
+import numpy as np
+
+PATTERNS = ('pushpull', 'pubsub')
+RECEIVE_TIMEOUT = 60.0  # Seconds a consumer waits for the next array of a remote flow before giving up
+_HEADER = struct.Struct('<qqBB')  # sequence, send time (perf_counter_ns), dtype char, ndim
+
+
+def isRemote(flow):
+    '''True if the flow carries transport options asking for ZeroMQ.'''
+    return len(flow) > 4 and isinstance(flow[4], dict) and flow[4].get('transport') == 'zmq'
+
+
+def flowTopic(flow):
+    return f"{flow[1]}.{flow[0]}".encode()
+
+
+def flowLabel(flow):
+    return f"{flow[1]}.{flow[0]} -> {flow[3]}.{flow[2]}"
+
+
+def bindAddress(flow):
+    '''Address the producer of a remote flow binds to.'''
+    return flow[4].get('bind', flow[4].get('endpoint'))
+
+
+def freeTcpPort():
+    '''A TCP port nothing on this machine listens on, the default for a new remote flow.'''
+    with socket.socket() as probe:
+        probe.bind(('', 0))
+        return probe.getsockname()[1]
+
+
+class ZmqSender:
+    '''Producer end of a remote flow. push() has the same signature as SharedRingBuffer.push so it can publish outputs.'''
+    def __init__(self, endpoint, pattern='pushpull', topic=b'', bind=True, highWaterMark=16):
+        if pattern not in PATTERNS:
+            raise ValueError(f"Unknown ZeroMQ pattern {pattern!r}, expected one of {PATTERNS}")
+        import zmq
+        self.socket = zmq.Context.instance().socket(zmq.PUSH if pattern == 'pushpull' else zmq.PUB)
+        self.socket.setsockopt(zmq.SNDHWM, highWaterMark)
+        self.socket.setsockopt(zmq.LINGER, 1000)  # Let queued messages go out on close, but never hang on a dead peer
+        (self.socket.bind if bind else self.socket.connect)(endpoint)
+        self.topic = topic if pattern == 'pubsub' else None
+        self.sequence = 0
+
+    def push(self, value):
+        '''Sends an array without copying it into a message and returns it unchanged.'''
+        array = np.ascontiguousarray(value)
+        header = _HEADER.pack(self.sequence, time.perf_counter_ns(), ord(array.dtype.char), array.ndim)
+        header += struct.pack(f'<{array.ndim}q', *array.shape)
+        frames = [header, array] if self.topic is None else [self.topic, header, array]
+        self.socket.send_multipart(frames, copy=False)
+        self.sequence += 1
+        return value
+
+    def close(self):
+        self.socket.close()
+
+
+class ZmqReceiver:
+    '''Consumer end of a remote flow.'''
+    def __init__(self, endpoint, pattern='pushpull', topic=b'', bind=False, highWaterMark=16, timeout=RECEIVE_TIMEOUT,
+                 label=None):
+        if pattern not in PATTERNS:
+            raise ValueError(f"Unknown ZeroMQ pattern {pattern!r}, expected one of {PATTERNS}")
+        import zmq
+        self.socket = zmq.Context.instance().socket(zmq.PULL if pattern == 'pushpull' else zmq.SUB)
+        self.socket.setsockopt(zmq.RCVHWM, highWaterMark)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.setsockopt(zmq.RCVTIMEO, int(timeout * 1000) if timeout else -1)
+        if pattern == 'pubsub':
+            self.socket.setsockopt(zmq.SUBSCRIBE, topic)
+        (self.socket.bind if bind else self.socket.connect)(endpoint)
+        self.pubsub = pattern == 'pubsub'
+        self.timeout = timeout
+        self.label = label or endpoint
+        self._again = zmq.Again
+        self.sequence = -1
+        self.sentAt = 0
+
+    def pull(self):
+        '''Waits for the next array and returns a read-only view over the received frame. Raises TimeoutError when
+        nothing arrives within the timeout.'''
+        try:
+            frames = self.socket.recv_multipart(copy=False)
+        except self._again:
+            raise TimeoutError(f"No data on remote flow {self.label} for {self.timeout:g} s, "
+                               f"is its producer running?") from None
+        header, data = frames[-2], frames[-1]
+        header = header.bytes
+        self.sequence, self.sentAt, dtypeChar, ndim = _HEADER.unpack_from(header)
+        shape = struct.unpack_from(f'<{ndim}q', header, _HEADER.size)
+        return np.frombuffer(data.buffer, dtype=np.dtype(chr(dtypeChar))).reshape(shape)
+
+    def close(self):
+        self.socket.close()
+
+
+def openSender(flow):
+    options = flow[4]
+    return ZmqSender(bindAddress(flow), options.get('pattern', 'pushpull'), flowTopic(flow), highWaterMark=options.get('hwm', 16))
+
+
+def openReceiver(flow):
+    options = flow[4]
+    return ZmqReceiver(options.get('connect', options.get('endpoint')), options.get('pattern', 'pushpull'), flowTopic(flow),
+                       highWaterMark=options.get('hwm', 16), timeout=options.get('timeout', RECEIVE_TIMEOUT),
+                       label=flowLabel(flow))
+
+
+def _loopbackSender(endpoint, pattern, shape, messages, ready):
+    sender = ZmqSender(endpoint, pattern, b'bench', bind=False)
+    array = np.random.standard_normal(shape)
+    ready.wait()
+    if pattern == 'pubsub':
+        time.sleep(0.5)  # Give the subscription time to propagate, PUB drops everything sent before it
+    for _ in range(messages):
+        sender.push(array)
+    sender.close()
+
+
+def benchmarkLoopback(endpoint="ipc:///tmp/nw-flow", pattern='pushpull', shape=(3, 4096), messages=10000):
+    '''Sends `messages` arrays from a separate process to this one and reports throughput and one-way latency.'''
+    receiver = ZmqReceiver(endpoint, pattern, b'bench', bind=True, timeout=5.0)
+    ready = multiprocessing.Event()
+    sender = multiprocessing.Process(target=_loopbackSender, args=(endpoint, pattern, shape, messages, ready))
+    sender.start()
+    ready.set()
+    latencies = np.empty(messages, dtype=np.int64)
+    received = 0
+    start = last = None
+    try:
+        for received in range(messages):
+            array = receiver.pull()
+            now = time.perf_counter_ns()
+            start = start or now
+            last = now
+            latencies[received] = now - receiver.sentAt
+        received = messages
+    except TimeoutError:
+        pass  # PUB/SUB can drop messages, report what arrived
+    elapsed = (last - start) / 1e9 if start else 0.0  # Up to the last arrival, a final receive timeout is not transfer time
+    sender.join()
+    receiver.close()
+    latencies = latencies[:received] / 1e3
+    nbytes = int(np.prod(shape)) * 8
+    return {
+        'pattern': pattern,
+        'endpoint': endpoint,
+        'shape': list(shape),
+        'messages': messages,
+        'received': int(received),
+        'msgs_per_s': received / elapsed if elapsed else 0.0,
+        'mb_per_s': received * nbytes / elapsed / 1e6 if elapsed else 0.0,
+        'latency_mean_us': float(latencies.mean()) if received else 0.0,
+        'latency_p50_us': float(np.percentile(latencies, 50)) if received else 0.0,
+        'latency_p99_us': float(np.percentile(latencies, 99)) if received else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ZeroMQ flow transport on one machine.")
+    parser.add_argument('--pattern', choices=PATTERNS, default='pushpull')
+    parser.add_argument('--endpoint', default="ipc:///tmp/nw-flow", help="ipc:// or tcp://127.0.0.1:<port>")
+    parser.add_argument('--shape', default="3,4096", help="Comma separated array shape.")
+    parser.add_argument('--messages', type=int, default=10000)
+    args = parser.parse_args(argv)
+    shape = tuple(int(dim) for dim in args.shape.split(','))
+    print(json.dumps(benchmarkLoopback(args.endpoint, args.pattern, shape, args.messages), indent=4))
+
+
+if __name__ == '__main__':
+    main()
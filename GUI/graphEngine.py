@@ -0,0 +1,541 @@
+# Headless execution engine for component-flow graphs.
+# The engine takes the same model the GUI saves (nodes.json and flows.json), resolves each component's
+# module/function from the component registry (GUI/componentRegistry.py), orders the graph topologically and steps
+# it for the configured number of iterations. It does not import Qt, so it can be driven from the GUI, from GUI/runner.py or from scripts.
+#
+# Call convention for component functions:
+#     result = function(*inputs, *state, **parameters, **kwargs)
+# Inputs and state ports are passed in the order they appear in the node info. The function returns the value
+# of its single output/state port directly, or a tuple ordered as outputs followed by state when there are several.
+# Unconnected inputs receive a zero array of their declared shape. Flows ending on a state port are feedback
+# flows: they carry the value of the previous iteration and do not constrain the execution order.
+#
+# With sharedBuffers=True every output port feeding a flow publishes into a shared-memory ring buffer
+# (GUI/ringBuffer.py) and its consumers read views of that buffer, so other processes can attach to the flow data.
+# Component functions return their own arrays, so publishing costs one copy of every published value per iteration.
+#
+# Flows marked remote (see GUI/flowTransport.py) are carried over ZeroMQ. When only part of the graph runs on this
+# machine (localComponents), the producer side of a remote flow sends and the consumer side receives before its call.
+# A remote flow into a state port receives from the second iteration on, the first starts from zeros like a local
+# feedback flow. A port feeding several flows publishes to each sender and to its shared ring buffer.
+#
+# Given profile histograms (GUI/runProfile.py), every component call and flow push is timed into them; without, the
+# calls are bound exactly as before.
+#
+# A FlowRecorder (GUI/flowRecording.py) taps the published ports to record them, a FlowReplay stands in for the
+# components it replays and paces the iterations like the recording.
+#
+# Multi-rate graphs: a component type may declare a "period" in the catalog, a number of ticks or a configuration
+# expression such as "Rollout Steps". The component is then only called on the last iteration of every period, e.g. a
+# PPO update once per rollout while acquisition runs every iteration. Between rates a flow holds the producer's latest
+# value, unless a slower consumer declares its input as a window of the producer's values: with a producer period p, a
+# consumer period q and a produced shape s, an input declared as (q / p,) + s or s + (q / p,) (a rollout, e.g.
+# (Num Channels+1, Rollout Steps) filled by (Num Channels+1,) steps) is a rollout buffer, see windowLayout(). The values
+# are written in place into a preallocated contiguous array and the consumer receives the last complete window as a
+# view, without a copy. The window is double-buffered: the producer fills the other array meanwhile, so the consumer
+# may keep its window until the next one is complete, e.g. while an update runs in the background.
+
+import ast
+import importlib
+import json
+import math
+import re
+import time
+from functools import partial
+
+import numpy as np
+
+from GUI.componentRegistry import ComponentRegistry, componentRegistry
+from GUI.flowTransport import flowLabel, isRemote
+from GUI.graphIO import loadBinaryGraph
+
+
+def loadCatalog(path=None):
+    '''Returns the component catalog describing every component type: the shared registry, or a single catalog file.'''
+    if path is None:
+        return componentRegistry()
+    registry = ComponentRegistry(path, directory=None)
+    registry.refresh(force=True)
+    return registry
+
+
+def loadGraph(folder_path):
+    '''Reads the nodes.json and flows.json pair saved by createGraph.save, or a binary .nwg graph file (see GUI/graphIO.py).'''
+    if folder_path.endswith('.nwg'):
+        components, flows, layout = loadBinaryGraph(folder_path)
+        return components, flows
+    with open(f'{folder_path}/nodes.json', 'r') as file:
+        components = json.load(file)
+    with open(f'{folder_path}/flows.json', 'r') as file:
+        flows = json.load(file)
+    return components, flows
+
+
+_SHAPE_EXPRESSION = re.compile(r'^[\d\s+\-*/()]+$')
+
+
+def parseShape(shape, config=None):
+    '''Converts a declared port shape such as "(1,)", ["(3,4096)"] or "(Num Channels+1, Rollout Steps)" to a tuple of ints.'''
+    if isinstance(shape, (list, tuple)) and shape and isinstance(shape[0], str):
+        shape = shape[0]  # Ports store their shape as a one element list
+    if not isinstance(shape, str):
+        return tuple(int(dim) for dim in shape)
+    text = shape.strip()
+    if text.startswith('(') and text.endswith(')'):
+        text = text[1:-1]
+    dims = []
+    for dim in text.split(','):
+        dim = dim.strip()
+        if not dim:
+            continue
+        if config:
+            # Longest keys first so "Num Channels Extra" is not partially replaced by "Num Channels"
+            for key in sorted(config, key=len, reverse=True):
+                if key in dim:
+                    dim = dim.replace(key, str(config[key]))
+        if not _SHAPE_EXPRESSION.match(dim):
+            raise ValueError(f"Cannot parse shape {shape!r}: unknown term in {dim!r}")
+        dims.append(int(eval(dim, {'__builtins__': {}}, {})))
+    return tuple(dims)
+
+
+def parsePeriod(period, config=None):
+    '''Converts a component type's period, 4 or "Rollout Steps", to a positive number of iterations.'''
+    if isinstance(period, str):
+        dims = parseShape(f"({period},)", config)
+        if len(dims) != 1:
+            raise ValueError(f"Cannot parse period {period!r}: expected a single number")
+        period = dims[0]
+    if period < 1:
+        raise ValueError(f"Period must be at least one iteration, got {period}")
+    return period
+
+
+def componentPeriods(components, config, catalog):
+    '''Period in iterations of every component of a graph.'''
+    return {name: parsePeriod(catalog[info['Component']].get('period', 1), config) for name, info in components.items()}
+
+
+def windowLayout(producerPeriod, consumerPeriod, produced, expected):
+    '''How many producer values a flow hands to its consumer at once and along which axis they are stacked: (q / p, 0)
+    when the consumer runs every q iterations, the producer every p and the consumer's input is declared as (q / p,) +
+    the produced shape, (q / p, -1) when it is declared as the produced shape + (q / p,), otherwise (1, 0).'''
+    if consumerPeriod > producerPeriod and not consumerPeriod % producerPeriod:
+        length = consumerPeriod // producerPeriod
+        if tuple(expected) == (length,) + tuple(produced):
+            return length, 0
+        if tuple(expected) == tuple(produced) + (length,):
+            return length, -1
+    return 1, 0
+
+
+def windowSlots(slots, lengths):
+    '''Ring slots of a port whose values fill windows of these lengths in a parallel run: room for two of each window,
+    and a multiple of every window length so each window is contiguous in the ring. `slots` without windows.'''
+    sized = None
+    for length in lengths:
+        step = math.lcm(length, sized or 1)
+        sized = step * -(-max(slots, 2 * length) // step)
+    return slots if sized is None else sized
+
+
+def parseParameter(value):
+    '''Parameters are typed into line edits, so they are stored as strings. Convert them to Python literals when possible.'''
+    if not isinstance(value, str):
+        return value
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+def componentKwargs(info, spec, config):
+    '''Keyword arguments a component is called with: its parameters and the configuration entries its type lists as kwargs.'''
+    kwargs = {key: parseParameter(value) for key, value in info.get('parameters', {}).items()}
+    for key in spec.get('kwargs', []):
+        kwargs[key] = parseParameter(config[key])
+    return kwargs
+
+
+def resolveFunction(module, function):
+    '''Imports the module of a component and returns its function.'''
+    return getattr(importlib.import_module(module), function)
+
+
+def nodePorts(info):
+    '''Returns (inputs, outputs, state) port names of a node in call order.'''
+    return list(info.get('inputs', {})), list(info.get('outputs', {})), list(info.get('state', {}))
+
+
+def topologicalOrder(components, flows):
+    '''Orders the component names so every producer runs before its consumers. Feedback flows into state ports are ignored.'''
+    indegree = {name: 0 for name in components}
+    consumers = {name: [] for name in components}
+    for output, start, pipe, end in (flow[:4] for flow in flows):
+        if pipe in components[end].get('state', {}):
+            continue
+        consumers[start].append(end)
+        indegree[end] += 1
+    # Kahn's algorithm, seeded in insertion order so the result is stable across runs
+    ready = [name for name, degree in indegree.items() if degree == 0]
+    order = []
+    while ready:
+        name = ready.pop(0)
+        order.append(name)
+        for consumer in consumers[name]:
+            indegree[consumer] -= 1
+            if indegree[consumer] == 0:
+                ready.append(consumer)
+    if len(order) != len(components):
+        cyclic = [name for name, degree in indegree.items() if degree > 0]
+        raise ValueError(f"The graph contains a cycle through: {', '.join(cyclic)}")
+    return order
+
+
+def _publishing(fn, rings):
+    '''Wraps a component so its outputs are pushed to ring buffers or remote senders. `rings` follows the output order, None for unpublished ports.
+    Pushing copies the returned value into the ring, consumers then read the ring's view of it.'''
+    if len(rings) == 1:
+        push = rings[0].push
+        return lambda *args: push(fn(*args))
+
+    def publish(*args):
+        return tuple(value if ring is None else ring.push(value) for ring, value in zip(rings, fn(*args)))
+    return publish
+
+
+class FanOut:
+    '''Stands in for a ring buffer in the publishing wrapper of a port feeding several targets, e.g. its shared ring
+    buffer and the senders of its remote flows. Returns what the first target returns.'''
+    __slots__ = ('push',)
+
+    def __init__(self, targets):
+        first = targets[0].push
+        others = [target.push for target in targets[1:]]
+
+        def push(value):
+            for send in others:
+                send(value)
+            return first(value)
+        self.push = push
+
+
+def fanOut(targets):
+    '''The push target of a port publishing to `targets`: None, the single target or a FanOut.'''
+    if len(targets) > 1:
+        return FanOut(targets)
+    return targets[0] if targets else None
+
+
+def _afterFirst(call):
+    '''Skips the first call.'''
+    first = True
+
+    def skip():
+        nonlocal first
+        if first:
+            first = False
+        else:
+            call()
+    return skip
+
+
+class WindowBuffer:
+    '''Stands in for a ring buffer in the publishing wrapper of a producer and collects the values it pushes into the
+    window input of a slower consumer, see ExecutionPlan.windows. `storage` is the consumer's slot, the values are
+    stacked along `axis` of it and of a second array of its shape.'''
+    __slots__ = ('arrays', 'length', 'count', 'push')
+
+    def __init__(self, storage, target=None, axis=0):
+        self.arrays = [storage, np.zeros_like(storage)]  # Filled in turn, the one not being filled is handed out
+        self.length = storage.shape[axis]
+        self.count = 0  # Values pushed so far
+        forward = target.push if target is not None else None
+        views = [np.moveaxis(array, axis, 0) for array in self.arrays]  # Indexed by position in the window
+        length = self.length
+
+        def push(value):
+            if forward is not None:
+                value = forward(value)
+            count = self.count
+            views[count // length % 2][count % length] = value
+            self.count = count + 1
+            return value
+        self.push = push
+
+    def ready(self):
+        '''The last complete window, oldest value first, zeros before the first one. A view, the producer fills the
+        other array until the next window is complete.'''
+        return self.arrays[1 - self.count // self.length % 2]
+
+
+def _everyNth(calls, period):
+    '''Runs the calls of a component on the last of every `period` iterations only.'''
+    countdown = period
+
+    def call():
+        nonlocal countdown
+        countdown -= 1
+        if not countdown:
+            countdown = period
+            for due in calls:
+                due()
+    return call
+
+
+def _bindCall(fn, inSlots, outSlots, values):
+    '''Builds the closure that runs one component for one iteration. Specialised by arity to keep the per-tick cost down.'''
+    if len(outSlots) == 1:
+        o = outSlots[0]
+        if len(inSlots) == 1:
+            i = inSlots[0]
+
+            def call():
+                values[o] = fn(values[i])
+        else:
+            def call():
+                values[o] = fn(*[values[i] for i in inSlots])
+    elif not outSlots:
+        def call():
+            fn(*[values[i] for i in inSlots])
+    else:
+        def call():
+            result = fn(*[values[i] for i in inSlots])
+            for o, value in zip(outSlots, result):
+                values[o] = value
+    return call
+
+
+class ExecutionPlan:
+    '''What building an engine derives from the graph before anything runs: the execution order, the slot and shape of
+    every port, where each input reads from and the resolved component calls. Plans pickle (component functions are
+    stored by reference), so they can be cached on disk, see GUI/planCache.py.'''
+    def __init__(self, components, flows, config, catalog=None, localComponents=None):
+        catalog = catalog if catalog is not None else loadCatalog()
+        self.components = components
+        self.flows = flows
+        self.config = config
+        self.localComponents = set(localComponents) if localComponents is not None else set(components)
+        self.order = [name for name in topologicalOrder(components, flows) if name in self.localComponents]
+        self.periods = componentPeriods(components, config, catalog)  # component name -> iterations between its calls
+        self.slots = {}  # (component name, port) -> index in the engine's value table
+        self.shapes = []  # slot -> shape of the port's value
+        for name in self.order:
+            info = components[name]
+            for category in ('inputs', 'outputs', 'state'):
+                for port, shape in info.get(category, {}).items():
+                    self.slots[(name, port)] = len(self.shapes)
+                    self.shapes.append(parseShape(shape, config))
+
+        # Inputs read straight from the producer's slot, so values are handed over by reference
+        readSlots = {}
+        self.remoteFlows = []  # Flows carried over ZeroMQ with at least one end on this machine
+        self.windows = []  # (producer, output, consumer, consumer slot, axis) of the flows filling a window, see windowLayout()
+        for flow in flows:
+            output, start, pipe, end = flow[:4]
+            if end not in self.localComponents and start not in self.localComponents:
+                continue
+            if isRemote(flow):
+                if start in self.localComponents and end in self.localComponents and flow[4].get('pattern') == 'pubsub':
+                    raise ValueError(f"Remote flow {flowLabel(flow)} uses pubsub with both ends on this machine, which loses "
+                                     f"the arrays sent before the subscription arrives. Use pushpull")
+                self.remoteFlows.append(flow)
+            elif start in self.localComponents and end in self.localComponents:
+                slot = self.slots[(end, pipe)]
+                length, axis = windowLayout(self.periods[start], self.periods[end], self.shapes[self.slots[(start, output)]],
+                                            self.shapes[slot])
+                if length > 1 and pipe not in components[end].get('state', {}):
+                    self.windows.append((start, output, end, slot, axis))
+                else:
+                    readSlots[(end, pipe)] = self.slots[(start, output)]
+
+        self.functions = {}
+        self.calls = []  # (component name, function with its kwargs bound, input slots, output slots, output ports)
+        self.startOffsets = {}  # component name -> first tick it runs at under the tick scheduler (its iterationAddition)
+        for name in self.order:
+            info = components[name]
+            spec = catalog[info['Component']]
+            self.startOffsets[name] = int(spec.get('iterationAddition', 0) or 0)
+            fn = resolveFunction(spec['module'], spec['function'])
+            self.functions[name] = fn
+            kwargs = componentKwargs(info, spec, config)
+            if kwargs:
+                fn = partial(fn, **kwargs)
+            inputs, outputs, state = nodePorts(info)
+            inSlots = [readSlots.get((name, port), self.slots[(name, port)]) for port in inputs + state]
+            outSlots = [self.slots[(name, port)] for port in outputs + state]
+            self.calls.append((name, fn, inSlots, outSlots, outputs + state))
+
+    def allocate(self, copies=None):
+        '''Initial value of every slot: zero arrays that are views of one block per distinct shape, so even large graphs
+        allocate a handful of arrays. With `copies`, every value has a leading axis of that length (see GUI/vectorEngine.py).'''
+        slotsByShape = {}
+        for slot, shape in enumerate(self.shapes):
+            slotsByShape.setdefault(shape, []).append(slot)
+        values = [None] * len(self.shapes)
+        batch = (copies,) if copies is not None else ()
+        for shape, slots in slotsByShape.items():
+            for slot, view in zip(slots, np.zeros((len(slots),) + batch + shape)):
+                values[slot] = view
+        return values
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        # Flat lists of the slot keys unpickle several times faster than a dictionary keyed by tuples
+        state['slots'] = ([name for name, port in self.slots], [port for name, port in self.slots], list(self.slots.values()))
+        return state
+
+    def __setstate__(self, state):
+        names, ports, slots = state['slots']
+        state['slots'] = dict(zip(zip(names, ports), slots))
+        self.__dict__.update(state)
+
+
+class GraphEngine:
+    '''Runs a component-flow graph without the GUI. Build once, then call step() or run().'''
+    def __init__(self, components, flows, config, catalog=None, sharedBuffers=False, slots=4, runId=None, localComponents=None,
+                 plan=None, profile=None, recorder=None, replay=None):
+        self.plan = plan if plan is not None else ExecutionPlan(components, flows, config, catalog, localComponents)
+        self.components = self.plan.components
+        self.flows = self.plan.flows
+        self.config = self.plan.config
+        self.iterations = int(self.config['Iterations'])
+        self.latencies = None
+        self.buffers = None
+        self.transports = []
+        self.localComponents = self.plan.localComponents
+        self.profile = profile  # ProfileHistograms the calls are timed into, or None
+        self.recorder = recorder  # FlowRecorder the published values are recorded by, or None
+        self.replay = replay  # FlowReplay feeding recorded values in place of some components, or None
+        if sharedBuffers:
+            from GUI.ringBuffer import FlowBuffers
+            self.buffers = FlowBuffers(self.components, self.flows, self.config, slots=slots, runId=runId)
+        self.build()
+
+    @classmethod
+    def fromPlan(cls, plan, **options):
+        '''Builds an engine from a compiled (e.g. cached) ExecutionPlan.'''
+        return cls(plan.components, plan.flows, plan.config, plan=plan, **options)
+
+    def build(self):
+        '''Allocates the value table and binds the plan's calls to it, the shared buffers and the remote flow sockets.'''
+        plan = self.plan
+        self.order = plan.order
+        self.slots = plan.slots
+        self.functions = plan.functions
+        self.values = self.allocate()
+
+        senders = {}  # (producer, output) -> [ZmqSender] of the remote flows leaving this machine
+        receivers = {}  # consumer -> [(slot, ZmqReceiver, feedback)] of the remote flows arriving on this machine
+        for flow in plan.remoteFlows:
+            from GUI.flowTransport import openReceiver, openSender
+            output, start, pipe, end = flow[:4]
+            if start in self.localComponents:
+                sender = openSender(flow)
+                self.transports.append(sender)
+                senders.setdefault((start, output), []).append(sender)
+            if end in self.localComponents:
+                receiver = openReceiver(flow)
+                self.transports.append(receiver)
+                receivers.setdefault(end, []).append((self.slots[(end, pipe)], receiver, pipe in self.components[end].get('state', {})))
+
+        if self.profile is not None:
+            from GUI.runProfile import COMPONENT, TRANSFER, TimedPush, timedCall
+        if self.recorder is not None:
+            from GUI.flowRecording import RecordingTap
+        self._calls = []
+        pacing = self.replay is not None and self.replay.speed > 0
+        self.componentCalls = []  # (component name, [calls]) in execution order, e.g. for GUI/tickScheduler.py
+        windows = {}  # (producer, output) -> [(consumer, consumer slot, axis)] of the windowed flows
+        for start, output, end, slot, axis in plan.windows:
+            windows.setdefault((start, output), []).append((end, slot, axis))
+        gathers = {}  # consumer -> calls handing it its windows, bound when the producer is
+        for name, fn, inSlots, outSlots, ports in plan.calls:
+            if self.replay is not None and name in self.replay.components:
+                fn = self.replay.function(name, ports, [self.values[o] for o in outSlots])
+            rings = [None] * len(ports)
+            if self.buffers is not None or senders:
+                rings = [fanOut(([self.buffers.rings[(name, port)]] if self.buffers and (name, port) in self.buffers.rings else [])
+                                + senders.get((name, port), [])) for port in ports]
+                if self.profile is not None:
+                    rings = [None if ring is None else TimedPush(ring, self.profile.recorder(f"{TRANSFER}:{name}.{port}"))
+                             for ring, port in zip(rings, ports)]
+            if self.recorder is not None:
+                records = [self.recorder.recorder(name, port) for port in ports]
+                rings = [ring if record is None else RecordingTap(ring, record) for ring, record in zip(rings, records)]
+            for index, port in enumerate(ports):
+                for end, slot, axis in windows.get((name, port), ()):
+                    storage = self.values[slot]
+                    if axis >= 0:
+                        axis += storage.ndim - len(plan.shapes[slot])  # After the leading axes of a vectorized run
+                    window = rings[index] = WindowBuffer(storage, rings[index], axis)
+                    gathers.setdefault(end, []).append(_bindCall(window.ready, [], [slot], self.values))
+            calls = [self.replay.pace] if pacing and name == self.replay.clockComponent else []
+            for slot, receiver, feedback in receivers.get(name, []):
+                pull = _bindCall(receiver.pull, [], [slot], self.values)
+                # A feedback flow carries the previous iteration's value: the first call starts from zeros, as nothing was sent yet
+                calls.append(_afterFirst(pull) if feedback else pull)
+            calls += gathers.get(name, [])
+            call = self.bindComponent(name, fn, inSlots, outSlots, rings)
+            if self.profile is not None:
+                call = timedCall(call, self.profile.recorder(f"{COMPONENT}:{name}"))
+            calls.append(call)
+            self.componentCalls.append((name, calls))
+            period = plan.periods.get(name, 1)
+            self._calls.extend(calls if period == 1 else [_everyNth(calls, period)])
+
+    def allocate(self):
+        '''Initial values of the slots.'''
+        return self.plan.allocate()
+
+    def bindComponent(self, name, fn, inSlots, outSlots, rings):
+        '''The call running one component for one iteration, publishing its outputs to `rings` (None for the others).'''
+        if any(rings):
+            fn = _publishing(fn, rings)
+        return _bindCall(fn, inSlots, outSlots, self.values)
+
+    def step(self):
+        '''Runs one iteration: every component due in it, in topological order.'''
+        for call in self._calls:
+            call()
+
+    def run(self, iterations=None):
+        '''Steps the graph for the given number of iterations (defaults to config["Iterations"]) and records per-step latency.'''
+        iterations = self.iterations if iterations is None else iterations
+        latencies = np.empty(iterations, dtype=np.int64)
+        calls = self._calls
+        clock = time.perf_counter_ns
+        for i in range(iterations):
+            start = clock()
+            for call in calls:
+                call()
+            latencies[i] = clock() - start
+        self.latencies = latencies
+        return self.report()
+
+    def value(self, component, port):
+        '''Returns the latest value of a component port.'''
+        return self.values[self.slots[(component, port)]]
+
+    def close(self):
+        '''Releases the shared flow buffers and remote flow sockets.'''
+        for transport in self.transports:
+            transport.close()
+        self.transports = []
+        if self.buffers is not None:
+            self.buffers.close()
+            self.buffers = None
+
+    def report(self):
+        '''Summarises the latencies of the last run in microseconds.'''
+        if self.latencies is None or not len(self.latencies):
+            return {}
+        latencies = self.latencies / 1e3
+        return {
+            'iterations': int(len(latencies)),
+            'total_s': float(latencies.sum() / 1e6),
+            'mean_us': float(latencies.mean()),
+            'p50_us': float(np.percentile(latencies, 50)),
+            'p99_us': float(np.percentile(latencies, 99)),
+            'max_us': float(latencies.max()),
+        }
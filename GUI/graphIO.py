@@ -0,0 +1,453 @@
+# Reading and writing saved graphs.
+# A saved graph is a folder holding nodes.json (component info keyed by name) and flows.json (a list of
+# [output, start name, input, end name, *options]). loadGraphModel() parses both files incrementally, member by member,
+# so a large graph is turned into a GraphModel without first holding the whole document and its parsed copy in
+# memory, and the caller can report progress and cancel between members.
+#
+# Graphs can also be stored as a single binary file (graph.nwg, written next to the JSON pair by createGraph). The
+# file is memory-mapped and only the sections that are asked for are decoded:
+#     header    magic, format version, section count and a table of (kind, offset, length) entries
+#     strings   every distinct string once (names, port names, shapes such as "(1,)", parameter values)
+#     nodes     one fixed-size record per component, pointing at its (category, key, value) fields
+#     flows     one fixed-size record per flow: port strings, component indices and optional transport options
+#     layout    optional (x, y) position of every node in the editor, NaN for nodes without a saved position
+#     source    optional size and SHA-256 of the nodes.json and flows.json the file was written with
+# The binary file is used only while the JSON pair next to it is the one recorded in its source section, so editing,
+# checking out or copying the JSON files (which all change modification times unreliably) never hides a newer graph.
+# Conversion to and from the JSON pair is lossless:
+#     python3 -m GUI.graphIO pack <graph folder> <file.nwg>
+#     python3 -m GUI.graphIO unpack <file.nwg> <graph folder>
+
+import argparse
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import struct
+
+from GUI.graphModel import GraphModel
+
+PROGRESS_EVERY = 500  # Members parsed between two progress callbacks
+BINARY_NAME = "graph.nwg"
+BINARY_VERSION = 2
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class _JsonStream:
+    '''Reads JSON values one at a time from a text file, refilling a bounded buffer as it goes.'''
+    def __init__(self, file, chunkSize):
+        self.file = file
+        self.chunkSize = chunkSize
+        self.buffer = ''
+        self.index = 0
+        self.offset = 0  # Characters dropped from the front of the buffer
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def more(self):
+        '''Drops the consumed part of the buffer and appends the next chunk. Returns False at the end of the file.'''
+        chunk = self.file.read(self.chunkSize)
+        if not chunk:
+            self.eof = True
+            return False
+        self.offset += self.index
+        self.buffer = self.buffer[self.index:] + chunk
+        self.index = 0
+        return True
+
+    @property
+    def position(self):
+        return self.offset + self.index
+
+    def next(self):
+        '''Skips whitespace and consumes the next character.'''
+        while True:
+            self.index = _WHITESPACE.match(self.buffer, self.index).end()
+            if self.index < len(self.buffer):
+                self.index += 1
+                return self.buffer[self.index - 1]
+            if not self.more():
+                raise ValueError("Unexpected end of JSON document")
+
+    def value(self):
+        '''Decodes the next JSON value, reading more of the file when the value crosses the end of the buffer.'''
+        while True:
+            self.index = _WHITESPACE.match(self.buffer, self.index).end()
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.index)
+                # A value ending exactly at the end of the buffer may be a truncated number, make sure it is complete
+                if end < len(self.buffer) or self.eof:
+                    self.index = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.more()
+
+
+def iterJson(path, chunkSize=1 << 20):
+    '''Yields the members of the top-level object ((key, value) pairs) or array (values) of a JSON file as they are
+    parsed, each with the fraction of the file read so far.'''
+    total = max(os.path.getsize(path), 1)
+    with open(path, 'r') as file:
+        stream = _JsonStream(file, chunkSize)
+        opener = stream.next()
+        if opener not in '{[':
+            raise ValueError(f"{path} does not contain a JSON object or array")
+        closer = '}' if opener == '{' else ']'
+        if stream.next() == closer:
+            return
+        stream.index -= 1  # Not empty, give the character back
+        while True:
+            if opener == '{':
+                key = stream.value()
+                if stream.next() != ':':
+                    raise ValueError(f"Malformed JSON in {path} near character {stream.position}")
+                yield (key, stream.value()), min(stream.position / total, 1.0)
+            else:
+                yield stream.value(), min(stream.position / total, 1.0)
+            separator = stream.next()
+            if separator == closer:
+                return
+            if separator != ',':
+                raise ValueError(f"Malformed JSON in {path} near character {stream.position}")
+
+
+def loadGraphModel(folder_path, progress=None):
+    '''Builds a GraphModel from a saved graph folder. progress(fraction) is called regularly and can return False to
+    cancel, in which case None is returned. The binary file is used when it was written from the JSON pair in the folder.'''
+    binaryPath = freshBinary(folder_path)
+    if binaryPath:
+        with BinaryGraph(binaryPath) as graph:
+            return _modelFromBinary(graph, progress)
+    nodesPath = f'{folder_path}/nodes.json'
+    flowsPath = f'{folder_path}/flows.json'
+    nodesSize = os.path.getsize(nodesPath)
+    flowsSize = os.path.getsize(flowsPath)
+    nodesShare = nodesSize / max(nodesSize + flowsSize, 1)
+    model = GraphModel()
+    for count, ((name, componentInfo), fraction) in enumerate(iterJson(nodesPath)):
+        model.addComponent(componentInfo)
+        if progress and count % PROGRESS_EVERY == 0 and progress(fraction * nodesShare) is False:
+            return None
+    for count, (flow, fraction) in enumerate(iterJson(flowsPath)):
+        model.addFlowByName(flow)
+        if progress and count % PROGRESS_EVERY == 0 and progress(nodesShare + fraction * (1 - nodesShare)) is False:
+            return None
+    return model
+
+
+def _modelFromBinary(graph, progress=None):
+    model = GraphModel()
+    total = max(graph.nodeCount + graph.flowCount, 1)
+    ids = []
+    for index in range(graph.nodeCount):
+        ids.append(model.addComponent(graph.node(index)))
+        if progress and index % PROGRESS_EVERY == 0 and progress(index / total) is False:
+            return None
+    for index, (output, start, pipe, end, options) in enumerate(graph.flowRecords()):
+        model.addFlow(output, ids[start], pipe, ids[end], options[0] if options else None)
+        if progress and index % PROGRESS_EVERY == 0 and progress((graph.nodeCount + index) / total) is False:
+            return None
+    return model
+
+
+def _fileDigest(path, chunkSize=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunkSize), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def sourceDigest(nodesData, flowsData):
+    '''The source section of a binary graph written from these nodes.json and flows.json contents.'''
+    return _SOURCE.pack(len(nodesData), hashlib.sha256(nodesData).digest(), len(flowsData), hashlib.sha256(flowsData).digest())
+
+
+def freshBinary(folder_path):
+    '''Path of the folder's binary graph if it exists and was written from the JSON pair in the folder (or there is no
+    JSON pair), else None. Sizes are compared first, the files are hashed only when they match.'''
+    binaryPath = f'{folder_path}/{BINARY_NAME}'
+    if not os.path.exists(binaryPath):
+        return None
+    paths = [f'{folder_path}/{name}' for name in ('nodes.json', 'flows.json')]
+    if not any(os.path.exists(path) for path in paths):
+        return binaryPath
+    try:
+        with BinaryGraph(binaryPath) as graph:
+            source = graph.source()
+    except (OSError, ValueError, struct.error):
+        return None
+    if source is None:
+        return None
+    nodesSize, nodesHash, flowsSize, flowsHash = _SOURCE.unpack(source)
+    try:
+        if os.path.getsize(paths[0]) != nodesSize or os.path.getsize(paths[1]) != flowsSize:
+            return None
+        if _fileDigest(paths[0]) != nodesHash or _fileDigest(paths[1]) != flowsHash:
+            return None
+    except OSError:
+        return None
+    return binaryPath
+
+
+def loadLayout(folder_path):
+    '''Node positions {name: (x, y)} saved in the folder's binary graph, or None. Only the layout section is decoded.'''
+    binaryPath = freshBinary(folder_path)
+    if not binaryPath:
+        return None
+    with BinaryGraph(binaryPath) as graph:
+        return graph.layout()
+
+
+# Binary format. Everything is little-endian, sections start on 8 byte boundaries.
+_MAGIC = b'NWGRAPH\x00'
+_HEADER = struct.Struct('<8sHHI')  # magic, version, flags, section count
+_SECTION = struct.Struct('<IxxxxQQ')  # kind, offset, length
+_COUNT = struct.Struct('<Ixxxx')
+_NODE = struct.Struct('<IIIIB')  # type string, name string, first field, field count, mask of the categories present
+_FIELD = struct.Struct('<BII')  # category | flags, key string, value string
+_FLOW = struct.Struct('<IIIII')  # output string, start node, input string, end node, options string or _NONE
+_POSITION = struct.Struct('<dd')
+_SOURCE = struct.Struct('<Q32sQ32s')  # size and SHA-256 of nodes.json, then of flows.json
+_NONE = 0xFFFFFFFF
+_UNPLACED = (math.nan, math.nan)  # Layout entry of a node without a saved position
+STRINGS, NODES, FLOWS, LAYOUT, SOURCE = 1, 2, 3, 4, 5
+_CATEGORIES = ('parameters', 'inputs', 'outputs', 'state')
+_EXTRA = 4  # Any other key of the component info, stored as JSON
+_LISTED = 0x40  # The value is a one element list holding the string, the usual form of port shapes
+_ENCODED = 0x80  # The value is JSON text
+
+
+class _StringTable:
+    def __init__(self):
+        self.indices = {}
+        self.strings = []
+
+    def add(self, text):
+        index = self.indices.get(text)
+        if index is None:
+            index = self.indices[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+
+    def pack(self):
+        blobs = [text.encode('utf-8') for text in self.strings]
+        offsets = [0]
+        for blob in blobs:
+            offsets.append(offsets[-1] + len(blob))
+        return _COUNT.pack(len(blobs)) + struct.pack(f'<{len(offsets)}Q', *offsets) + b''.join(blobs)
+
+
+def _encodeValue(value):
+    if isinstance(value, str):
+        return 0, value
+    if isinstance(value, list) and len(value) == 1 and isinstance(value[0], str):
+        return _LISTED, value[0]
+    return _ENCODED, json.dumps(value)
+
+
+def packGraph(components, flows, layout=None, source=None):
+    '''Encodes a graph given in the JSON pair form, plus optional {name: (x, y)} positions, as the binary format.
+    source is the sourceDigest() of the JSON pair the graph was saved as, if any.'''
+    strings = _StringTable()
+    indices = {}
+    nodeRecords = []
+    fields = []
+    for componentInfo in components.values():
+        indices[componentInfo['Name']] = len(nodeRecords)
+        first = len(fields)
+        mask = 0
+        for key, value in componentInfo.items():
+            if key in ('Component', 'Name'):
+                continue
+            if key in _CATEGORIES and isinstance(value, dict):
+                category = _CATEGORIES.index(key)
+                mask |= 1 << category
+                for name, item in value.items():
+                    flags, text = _encodeValue(item)
+                    fields.append(_FIELD.pack(category | flags, strings.add(name), strings.add(text)))
+            else:
+                fields.append(_FIELD.pack(_EXTRA | _ENCODED, strings.add(key), strings.add(json.dumps(value))))
+        nodeRecords.append(_NODE.pack(strings.add(componentInfo['Component']), strings.add(componentInfo['Name']),
+                                      first, len(fields) - first, mask))
+    flowRecords = []
+    for flow in flows:
+        options = strings.add(json.dumps(flow[4:])) if len(flow) > 4 else _NONE
+        flowRecords.append(_FLOW.pack(strings.add(flow[0]), indices[flow[1]], strings.add(flow[2]), indices[flow[3]], options))
+    sections = [
+        (STRINGS, strings.pack()),
+        (NODES, _COUNT.pack(len(nodeRecords)) + _COUNT.pack(len(fields)) + b''.join(nodeRecords) + b''.join(fields)),
+        (FLOWS, _COUNT.pack(len(flowRecords)) + b''.join(flowRecords)),
+    ]
+    if layout:
+        sections.append((LAYOUT, _COUNT.pack(len(nodeRecords)) + b''.join(
+            _POSITION.pack(*layout.get(componentInfo['Name'], _UNPLACED)) for componentInfo in components.values())))
+    if source is not None:
+        sections.append((SOURCE, source))
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    table = []
+    body = []
+    for kind, data in sections:
+        padding = -offset % 8
+        body.append(b'\x00' * padding)
+        offset += padding
+        table.append(_SECTION.pack(kind, offset, len(data)))
+        body.append(data)
+        offset += len(data)
+    return _HEADER.pack(_MAGIC, BINARY_VERSION, 0, len(sections)) + b''.join(table) + b''.join(body)
+
+
+def atomicWrite(path, data):
+    '''Writes bytes to a temporary file next to path and renames it over path, so readers and crashes only ever see
+    the old or the new complete file.'''
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def saveBinaryGraph(path, components, flows, layout=None, source=None):
+    atomicWrite(path, packGraph(components, flows, layout, source))
+
+
+class BinaryGraph:
+    '''A memory-mapped binary graph. Strings, nodes, flows and the layout are decoded only when they are asked for.'''
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, flags, sectionCount = _HEADER.unpack_from(self.data, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a Neuroweaver graph file")
+        if version > BINARY_VERSION:
+            raise ValueError(f"{path} uses graph format version {version}, this version reads up to {BINARY_VERSION}")
+        self.sections = {}
+        for index in range(sectionCount):
+            kind, offset, length = _SECTION.unpack_from(self.data, _HEADER.size + index * _SECTION.size)
+            self.sections[kind] = (offset, length)
+        self._strings = {}
+        self.stringsAt = self.sections[STRINGS][0]
+        self.stringCount, = _COUNT.unpack_from(self.data, self.stringsAt)
+        self.blobAt = self.stringsAt + _COUNT.size + 8 * (self.stringCount + 1)
+        self.nodesAt = self.sections[NODES][0]
+        self.nodeCount, = _COUNT.unpack_from(self.data, self.nodesAt)
+        self.fieldsAt = self.nodesAt + 2 * _COUNT.size + self.nodeCount * _NODE.size
+        self.flowsAt = self.sections[FLOWS][0]
+        self.flowCount, = _COUNT.unpack_from(self.data, self.flowsAt)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.data.close()
+
+    def string(self, index):
+        text = self._strings.get(index)
+        if text is None:
+            start, end = struct.unpack_from('<QQ', self.data, self.stringsAt + _COUNT.size + 8 * index)
+            text = self._strings[index] = self.data[self.blobAt + start:self.blobAt + end].decode('utf-8')
+        return text
+
+    def nodeName(self, index):
+        return self.string(_NODE.unpack_from(self.data, self.nodesAt + 2 * _COUNT.size + index * _NODE.size)[1])
+
+    def node(self, index):
+        '''Component info of one node, as stored in nodes.json.'''
+        typeIndex, nameIndex, first, count, mask = _NODE.unpack_from(self.data, self.nodesAt + 2 * _COUNT.size + index * _NODE.size)
+        componentInfo = {'Component': self.string(typeIndex), 'Name': self.string(nameIndex)}
+        for category, key in enumerate(_CATEGORIES):
+            if mask & (1 << category):
+                componentInfo[key] = {}
+        for flags, keyIndex, valueIndex in _FIELD.iter_unpack(self.data[self.fieldsAt + first * _FIELD.size:
+                                                                         self.fieldsAt + (first + count) * _FIELD.size]):
+            text = self.string(valueIndex)
+            value = json.loads(text) if flags & _ENCODED else [text] if flags & _LISTED else text
+            category = flags & 0x0F
+            if category == _EXTRA:
+                componentInfo[self.string(keyIndex)] = value
+            else:
+                componentInfo[_CATEGORIES[category]][self.string(keyIndex)] = value
+        return componentInfo
+
+    def components(self):
+        return {componentInfo['Name']: componentInfo for componentInfo in map(self.node, range(self.nodeCount))}
+
+    def flowRecords(self):
+        '''Flows as (output, start node index, input, end node index, options list).'''
+        start = self.flowsAt + _COUNT.size
+        for output, startNode, pipe, endNode, options in _FLOW.iter_unpack(self.data[start:start + self.flowCount * _FLOW.size]):
+            yield (self.string(output), startNode, self.string(pipe), endNode,
+                   [] if options == _NONE else json.loads(self.string(options)))
+
+    def flows(self):
+        '''Flows in the flows.json form.'''
+        names = {}
+        flows = []
+        for output, start, pipe, end, options in self.flowRecords():
+            for index in (start, end):
+                if index not in names:
+                    names[index] = self.nodeName(index)
+            flows.append([output, names[start], pipe, names[end]] + options)
+        return flows
+
+    def layout(self):
+        '''Node positions {name: (x, y)}, or None if the file has no layout section. Nodes without a position are left out.'''
+        if LAYOUT not in self.sections:
+            return None
+        offset, length = self.sections[LAYOUT]
+        count, = _COUNT.unpack_from(self.data, offset)
+        start = offset + _COUNT.size
+        positions = _POSITION.iter_unpack(self.data[start:start + count * _POSITION.size])
+        return {self.nodeName(index): position for index, position in enumerate(positions) if not math.isnan(position[0])}
+
+    def source(self):
+        '''The sourceDigest() bytes the file was written with, or None.'''
+        if SOURCE not in self.sections:
+            return None
+        offset, length = self.sections[SOURCE]
+        return bytes(self.data[offset:offset + length])
+
+
+def loadBinaryGraph(path):
+    '''Returns (components, flows, layout) from a binary graph file, in the JSON pair form.'''
+    with BinaryGraph(path) as graph:
+        return graph.components(), graph.flows(), graph.layout()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert saved graphs between the JSON pair and the binary format.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    pack = commands.add_parser('pack', help="Write the graph of a folder (nodes.json, flows.json) to a binary file.")
+    pack.add_argument('folder')
+    pack.add_argument('output')
+    unpack = commands.add_parser('unpack', help="Write nodes.json and flows.json from a binary file.")
+    unpack.add_argument('input')
+    unpack.add_argument('folder')
+    args = parser.parse_args(argv)
+    if args.command == 'pack':
+        with open(f'{args.folder}/nodes.json', 'rb') as file:
+            nodesData = file.read()
+        with open(f'{args.folder}/flows.json', 'rb') as file:
+            flowsData = file.read()
+        saveBinaryGraph(args.output, json.loads(nodesData), json.loads(flowsData), loadLayout(args.folder),
+                        sourceDigest(nodesData, flowsData))
+    else:
+        components, flows, layout = loadBinaryGraph(args.input)
+        os.makedirs(args.folder, exist_ok=True)
+        with open(f'{args.folder}/nodes.json', 'w') as file:
+            json.dump(components, file)
+        with open(f'{args.folder}/flows.json', 'w') as file:
+            json.dump(flows, file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+# Graph model behind the graph editor.
+# Components are stored under stable integer ids rather than their names, and every component keeps the ids of its
+# incoming and outgoing flows. Renaming a component therefore touches a single entry, and deleting one only visits
+# its own flows. The saved format is unchanged: nodeDict() and flowList() produce the name-keyed nodes.json and
+# flows.json contents, and fromSaved() builds a model from them.
+#
+# Every change is reported to the model's listeners as a small event dictionary, e.g.
+#     {'op': 'renameComponent', 'id': 3, 'old': 'camera', 'new': 'camera 1'}
+# Events carry what is needed to replay the change (GUI/autosave.py journals them) and to revert it.
+
+class GraphModel:
+    '''Components and flows of a graph, indexed by stable ids with per-component adjacency.'''
+    def __init__(self):
+        self.components = {}  # component id -> component info (as produced by the component dialogs)
+        self.ids = {}  # component name -> component id
+        self.flows = {}  # flow id -> [output, start id, input, end id, *options]
+        self.outgoing = {}  # component id -> set of flow ids leaving it
+        self.incoming = {}  # component id -> set of flow ids entering it
+        self._nextComponentId = 0
+        self._nextFlowId = 0
+        self.listeners = []  # Called with every change event
+
+    def addListener(self, listener):
+        self.listeners.append(listener)
+
+    def removeListener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _notify(self, event):
+        for listener in self.listeners:
+            listener(event)
+
+    @classmethod
+    def fromSaved(cls, components, flows):
+        '''Builds a model from the contents of nodes.json and flows.json.'''
+        model = cls()
+        for componentInfo in components.values():
+            model.addComponent(componentInfo)
+        for flow in flows:
+            model.addFlowByName(flow)
+        return model
+
+    def __len__(self):
+        return len(self.components)
+
+    def name(self, componentId):
+        return self.components[componentId]['Name']
+
+    def info(self, componentId):
+        return self.components[componentId]
+
+    def addComponent(self, componentInfo, componentId=None):
+        '''Adds a component and returns its id. Names must be unique.'''
+        name = componentInfo['Name']
+        if name in self.ids:
+            raise ValueError(f"A component named {name!r} already exists")
+        if componentId is None:
+            componentId = self._nextComponentId
+        self._nextComponentId = max(self._nextComponentId, componentId + 1)
+        self.components[componentId] = componentInfo
+        self.ids[name] = componentId
+        self.outgoing[componentId] = set()
+        self.incoming[componentId] = set()
+        if self.listeners:
+            self._notify({'op': 'addComponent', 'id': componentId, 'info': componentInfo})
+        return componentId
+
+    def removeComponent(self, componentId):
+        '''Removes a component and its flows. Returns the ids of the removed flows.'''
+        removed = self.removeFlowsOf(componentId)
+        info = self.components.pop(componentId)
+        del self.ids[info['Name']]
+        del self.outgoing[componentId]
+        del self.incoming[componentId]
+        if self.listeners:
+            self._notify({'op': 'removeComponent', 'id': componentId, 'info': info})
+        return removed
+
+    def renameComponent(self, componentId, newName):
+        '''Renames a component. Flows refer to ids, so none of them change.'''
+        info = self.components[componentId]
+        if newName == info['Name']:
+            return
+        if newName in self.ids:
+            raise ValueError(f"A component named {newName!r} already exists")
+        oldName = info['Name']
+        del self.ids[oldName]
+        self.ids[newName] = componentId
+        info['Name'] = newName
+        if self.listeners:
+            self._notify({'op': 'renameComponent', 'id': componentId, 'old': oldName, 'new': newName})
+
+    def updateComponent(self, componentId, updatedInfo, removed=()):
+        '''Applies the output of ComponentConfigDialog, renaming the component if needed. The keys in `removed` are
+        deleted from the component info, undo uses them to take back keys an update added.'''
+        info = self.components[componentId]
+        if self.listeners:
+            old = {key: info[key] for key in list(updatedInfo) + list(removed) if key in info}
+            added = [key for key in updatedInfo if key not in info]
+        self.renameComponent(componentId, updatedInfo['Name'])
+        for key in removed:
+            info.pop(key, None)
+        info.update(updatedInfo)
+        if self.listeners:
+            self._notify({'op': 'updateComponent', 'id': componentId, 'old': old, 'new': dict(updatedInfo),
+                          'added': added, 'removed': list(removed)})
+
+    def addFlow(self, output, startId, pipe, endId, options=None, flowId=None):
+        '''Adds a flow from startId's output to endId's input and returns its id.'''
+        if flowId is None:
+            flowId = self._nextFlowId
+        self._nextFlowId = max(self._nextFlowId, flowId + 1)
+        self.flows[flowId] = [output, startId, pipe, endId] + ([options] if options else [])
+        self.outgoing[startId].add(flowId)
+        self.incoming[endId].add(flowId)
+        if self.listeners:
+            self._notify({'op': 'addFlow', 'id': flowId, 'flow': self.flows[flowId]})
+        return flowId
+
+    def addFlowByName(self, flow):
+        '''Adds a flow given in the saved [output, start name, input, end name, *options] form.'''
+        return self.addFlow(flow[0], self.ids[flow[1]], flow[2], self.ids[flow[3]], flow[4] if len(flow) > 4 else None)
+
+    def removeFlow(self, flowId):
+        flow = self.flows.pop(flowId)
+        self.outgoing[flow[1]].discard(flowId)
+        self.incoming[flow[3]].discard(flowId)
+        if self.listeners:
+            self._notify({'op': 'removeFlow', 'id': flowId, 'flow': flow})
+        return flow
+
+    def flowsOf(self, componentId):
+        '''Ids of the flows entering or leaving a component.'''
+        return self.outgoing[componentId] | self.incoming[componentId]
+
+    def removeFlowsOf(self, componentId):
+        '''Removes the flows entering or leaving a component and returns their ids.'''
+        removed = self.flowsOf(componentId)
+        for flowId in removed:
+            self.removeFlow(flowId)
+        return removed
+
+    def savedFlow(self, flowId):
+        '''A flow in the saved form, with component names instead of ids.'''
+        output, startId, pipe, endId, *options = self.flows[flowId]
+        return [output, self.name(startId), pipe, self.name(endId)] + options
+
+    def nodeDict(self):
+        '''Contents of nodes.json: component info keyed by name.'''
+        return {info['Name']: info for info in self.components.values()}
+
+    def flowList(self):
+        '''Contents of flows.json: flows in the order they were added.'''
+        return [self.savedFlow(flowId) for flowId in self.flows]
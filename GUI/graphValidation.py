@@ -0,0 +1,305 @@
+# Static validation of a component-flow graph before it is run.
+# Port shapes are free text in the component dialogs ("(1,)", "(Num Channels+1,Rollout Steps)") and the flow dialog
+# lets any output connect to any input, so mistakes used to surface only once the runner was already allocating
+# buffers, or hours into a run. validateGraph() checks the saved model (nodes.json/flows.json contents) against the
+# component registry and the run configuration without importing any component:
+#   - every shape parses with the configuration, and every port and kwarg is known to the component type
+#   - shapes are propagated along the flows: each input takes the shape of the output feeding it, and a declared
+#     shape that differs is a mismatch
+#   - inputs no flow feeds receive zeros from the engine; that is a warning, or an error for the ports a catalog
+#     entry lists as "required"
+#   - cycles are only legal through state ports (feedback flows); any other cycle is reported with its components
+#   - every remote flow binds its own address (GUI/flowTransport.py)
+#   - component periods parse, and a consumer slower than its producer runs a multiple of the producer's period. Its
+#     input may then be declared as a window of the produced values, (consumer period / producer period,) + shape or
+#     shape + (consumer period / producer period,)
+# It also estimates the memory the graph needs per iteration, so shared buffers can be sized up front. The estimate
+# sizes buffers the way the engine does: windowed flows get the second window array of WindowBuffer, and in a parallel
+# run their rings get the extra slots of windowSlots():
+#     python3 -m GUI.graphValidation GUI/test_save1
+
+import argparse
+import json
+from collections import namedtuple
+
+import numpy as np
+
+from GUI.flowTransport import bindAddress, isRemote
+from GUI.graphEngine import loadCatalog, loadGraph, parsePeriod, parseShape, windowLayout, windowSlots
+
+DTYPE = np.dtype('float64')  # Element type of the engine's port values and of the shared flow buffers
+SLOTS = 4  # Ring buffer slots per published port, the runner's default
+
+ERROR = 'error'
+WARNING = 'warning'
+
+
+class Issue(namedtuple('Issue', 'level component port message')):
+    '''A problem found in the graph. `component` and `port` are None when the issue concerns the whole graph.'''
+    __slots__ = ()
+
+    def __str__(self):
+        where = ".".join(part for part in (self.component, self.port) if part)
+        return f"{self.level}: {where + ': ' if where else ''}{self.message}"
+
+
+def formatBytes(count):
+    '''Human readable byte count, e.g. 196.6 KiB.'''
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if count < 1024 or unit == 'GiB':
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1024
+
+
+class ValidationReport:
+    '''Issues, resolved port shapes and memory estimate of one graph.'''
+    def __init__(self):
+        self.issues = []
+        self.shapes = {}  # (component name, port) -> shape tuple, after propagation along the flows
+        self.published = set()  # (component name, port) of the outputs/state ports feeding at least one flow
+        self.windows = {}  # (consumer, input) -> (producer, output, window length) of the flows handing over windows
+
+    def add(self, level, component, port, message):
+        self.issues.append(Issue(level, component, port, message))
+
+    @property
+    def errors(self):
+        return [issue for issue in self.issues if issue.level == ERROR]
+
+    @property
+    def warnings(self):
+        return [issue for issue in self.issues if issue.level == WARNING]
+
+    @property
+    def ok(self):
+        '''True when nothing prevents the graph from running.'''
+        return not self.errors
+
+    def portBytes(self, key):
+        return int(np.prod(self.shapes[key], dtype=np.int64)) * DTYPE.itemsize
+
+    @property
+    def iterationBytes(self):
+        '''Bytes of port values the engine holds and rewrites every iteration (one array per port).'''
+        return sum(self.portBytes(key) for key in self.shapes)
+
+    @property
+    def windowBytes(self):
+        '''Bytes of the second array GraphEngine keeps for every window input, filled while the first is handed out.'''
+        return sum(self.portBytes(key) for key in self.windows if key in self.shapes)
+
+    @property
+    def flowBytes(self):
+        '''Bytes the flows carry per iteration: one value per published output port, however many flows read it.'''
+        return sum(self.portBytes(key) for key in self.published if key in self.shapes)
+
+    def portSlots(self, slots=SLOTS, parallel=False):
+        '''{(component name, port): ring slots} of the published ports. A parallel run gives the producers of windows more.'''
+        lengths = {}
+        if parallel:
+            for start, output, length in self.windows.values():
+                lengths.setdefault((start, output), []).append(length)
+        return {key: windowSlots(slots, lengths.get(key, ())) for key in self.published}
+
+    def sharedBytes(self, slots=SLOTS, parallel=False):
+        '''Shared memory the ring buffers of a --shared-buffers or --parallel run allocate.'''
+        return sum(self.portBytes(key) * count for key, count in self.portSlots(slots, parallel).items() if key in self.shapes)
+
+    def summary(self, slots=SLOTS, parallel=False):
+        '''One line memory estimate for dialogs and logs. Window inputs are read in place from the rings in a parallel
+        run, in a single process they take a second array each.'''
+        windows = f" and {formatBytes(self.windowBytes)} of second window buffers" if self.windowBytes and not parallel else ""
+        return (f"{len(self.shapes)} ports, {formatBytes(self.iterationBytes)} of port values{windows} per iteration; "
+                f"flows carry {formatBytes(self.flowBytes)} per iteration "
+                f"({formatBytes(self.sharedBytes(slots, parallel))} of shared buffers with {slots} slots"
+                f"{', more for the producers of windows' if parallel and self.windows else ''})")
+
+
+def flowShapeMismatch(startInfo, output, endInfo, pipe, config, catalog=None):
+    '''Checks a single flow as it is drawn. Returns a description of the shape mismatch, or None if the shapes agree or cannot be parsed yet.
+    Given the catalog, an input declared as a window of the values of a faster producer is accepted.'''
+    produced = startInfo.get('outputs', {}).get(output) or startInfo.get('state', {}).get(output)
+    expected = endInfo.get('inputs', {}).get(pipe) or endInfo.get('state', {}).get(pipe)
+    try:
+        produced, expected = parseShape(produced, config), parseShape(expected, config)
+        if catalog is not None and pipe in endInfo.get('inputs', {}) and windowLayout(
+                parsePeriod(catalog[startInfo['Component']].get('period', 1), config),
+                parsePeriod(catalog[endInfo['Component']].get('period', 1), config), produced, expected)[0] > 1:
+            return None
+    except (ValueError, TypeError, SyntaxError, KeyError):
+        return None  # Reported by validateGraph() before running
+    if produced == expected:
+        return None
+    return f"{startInfo['Name']}.{output} produces {produced} but {endInfo['Name']}.{pipe} expects {expected}"
+
+
+def validateGraph(components, flows, config, catalog=None):
+    '''Checks a graph (name-keyed components and [output, start, input, end] flows) and returns a ValidationReport.'''
+    catalog = catalog if catalog is not None else loadCatalog()
+    report = ValidationReport()
+
+    # Component types, declared ports and shapes
+    declared = {}  # (component name, port) -> declared shape
+    parsed = {}  # shape text -> shape tuple or the parse error, graphs repeat a handful of shapes over and over
+    periods = {}  # component name -> iterations between its calls, missing when the period does not parse
+    for name, info in components.items():
+        typeName = info.get('Component')
+        componentType = catalog[typeName] if typeName in catalog else None
+        if componentType is None:
+            report.add(ERROR, name, None, f"unknown component type {typeName!r}")
+        else:
+            for key in componentType.get('kwargs', []):
+                if key not in config:
+                    report.add(ERROR, name, None, f"kwarg {key!r} is missing from the configuration")
+            try:
+                periods[name] = parsePeriod(componentType.get('period', 1), config)
+            except (ValueError, TypeError, SyntaxError) as e:
+                report.add(ERROR, name, None, f"invalid period {componentType.get('period')!r}: {e}")
+        for category in ('inputs', 'outputs', 'state'):
+            for port, shape in info.get(category, {}).items():
+                if componentType is not None and port not in componentType.get(category, []):
+                    report.add(ERROR, name, port, f"{typeName} has no {category} port {port!r}")
+                text = shape[0] if isinstance(shape, list) and len(shape) == 1 else repr(shape)
+                if text not in parsed:
+                    try:
+                        parsed[text] = parseShape(shape, config)
+                    except (ValueError, TypeError, SyntaxError) as e:
+                        parsed[text] = e
+                if isinstance(parsed[text], Exception):
+                    report.add(ERROR, name, port, f"invalid shape {shape!r}: {parsed[text]}")
+                    continue
+                declared[(name, port)] = parsed[text]
+                if any(dim <= 0 for dim in declared[(name, port)]):
+                    report.add(ERROR, name, port, f"shape {declared[(name, port)]} has an empty dimension")
+    report.shapes.update(declared)
+
+    # Flows: endpoints, fan-in and shape propagation
+    fed = {}  # (consumer, port) -> producer (name, port)
+    bound = {}  # bind address -> the remote flow binding it
+    edges = {name: set() for name in components}  # Execution-order dependencies, feedback flows excluded
+    for flow in flows:
+        output, start, pipe, end = flow[:4]
+        label = f"flow {start}.{output} -> {end}.{pipe}"
+        if start not in components or end not in components:
+            report.add(ERROR, None, None, f"{label} references a missing component")
+            continue
+        startInfo, endInfo = components[start], components[end]
+        if output not in startInfo.get('outputs', {}) and output not in startInfo.get('state', {}):
+            report.add(ERROR, start, output, f"{label} starts on a port that is not an output or state port")
+            continue
+        feedback = pipe in endInfo.get('state', {})
+        if pipe not in endInfo.get('inputs', {}) and not feedback:
+            report.add(ERROR, end, pipe, f"{label} ends on a port that is not an input or state port")
+            continue
+        report.published.add((start, output))
+        address = bindAddress(flow) if isRemote(flow) else None
+        if address is not None:
+            if address in bound:
+                report.add(ERROR, start, output, f"remote {label} binds {address}, which {bound[address]} already binds")
+            bound[address] = label
+        if (end, pipe) in fed:
+            previous = fed[(end, pipe)]
+            report.add(ERROR, end, pipe, f"fed by both {previous[0]}.{previous[1]} and {start}.{output}")
+        fed[(end, pipe)] = (start, output)
+        if not feedback:
+            edges[start].add(end)
+        producerPeriod, consumerPeriod = periods.get(start, 1), periods.get(end, 1)
+        if not feedback and consumerPeriod > producerPeriod and consumerPeriod % producerPeriod:
+            report.add(ERROR, end, pipe, f"runs every {consumerPeriod} iterations, which is not a multiple of the "
+                                         f"{producerPeriod} iterations of {start}")
+        produced, expected = declared.get((start, output)), declared.get((end, pipe))
+        if produced is not None:
+            length = windowLayout(producerPeriod, consumerPeriod, produced, expected)[0] if expected is not None and not feedback else 1
+            if length > 1:
+                report.windows[(end, pipe)] = (start, output, length)
+                continue  # A window of the last values, the consumer receives its declared shape
+            if expected is not None and expected != produced:
+                report.add(ERROR, end, pipe, f"expects shape {expected} but {start}.{output} produces {produced}")
+            report.shapes[(end, pipe)] = produced  # What the consumer will actually receive
+
+    # Inputs nobody feeds get zeros of their declared shape
+    for name, info in components.items():
+        typeName = info.get('Component')
+        required = getattr(catalog[typeName], 'required', ()) if typeName in catalog else ()
+        for port in info.get('inputs', {}):
+            if (name, port) not in fed:
+                if port in required:
+                    report.add(ERROR, name, port, "required input is not connected")
+                else:
+                    report.add(WARNING, name, port, "input is not connected and will receive zeros")
+        for port in required:
+            if (name, port) not in fed and port not in info.get('inputs', {}):
+                report.add(ERROR, name, port, "required port is disabled" if port not in info.get('state', {})
+                           else "required state port is not connected")
+
+    for cycle in findCycles(edges):
+        report.add(ERROR, None, None, f"cycle without a state port: {' -> '.join(cycle + cycle[:1])}")
+    return report
+
+
+def findCycles(edges):
+    '''Strongly connected components with more than one node, or with a self loop, of a {node: successors} graph.'''
+    index = {}
+    lowlink = {}
+    stack = []
+    onStack = set()
+    cycles = []
+    counter = 0
+    for root in edges:
+        if root in index:
+            continue
+        # Iterative Tarjan, so long chains of components do not hit the recursion limit
+        work = [(root, iter(edges[root]))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        onStack.add(root)
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = lowlink[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    onStack.add(successor)
+                    work.append((successor, iter(edges[successor])))
+                    break
+                if successor in onStack:
+                    lowlink[node] = min(lowlink[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        onStack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in edges[node]:
+                        cycles.append(component[::-1])
+    return cycles
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate a saved Neuroweaver graph and estimate its memory use.")
+    parser.add_argument('graph', help="Folder containing nodes.json and flows.json, or a .nwg file.")
+    parser.add_argument('--config', default="GUI/config.json")
+    parser.add_argument('--slots', type=int, default=SLOTS, help="Ring buffer slots used for the shared memory estimate.")
+    parser.add_argument('--parallel', action='store_true', help="Estimate the memory of a run with the parallel scheduler.")
+    args = parser.parse_args(argv)
+    components, flows = loadGraph(args.graph)
+    with open(args.config, 'r') as file:
+        config = json.load(file)
+    report = validateGraph(components, flows, config)
+    for issue in report.issues:
+        print(issue)
+    print(report.summary(args.slots, args.parallel))
+    return 0 if report.ok else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,62 +1,187 @@
-# This file contains the definition of the DraggableNode class, which is a QLabel that can be moved around the screen.
+# This file contains the graphics items used by the graph editor canvas:
+# DraggableNode, a component that can be moved around the scene, EdgeItem, the curve drawn for a flow,
+# and GraphView, the zoomable and pannable view showing the scene.
 
-from PyQt5.QtCore import pyqtSignal, Qt, QPoint
-from PyQt5.QtGui import QFontMetrics, QFont, QLinearGradient, QPalette, QColor, QBrush
-from PyQt5.QtWidgets import QLabel
+from PyQt5.QtCore import pyqtSignal, Qt, QPointF, QRectF
+from PyQt5.QtGui import QFontMetrics, QFont, QLinearGradient, QColor, QBrush, QPen, QPainterPath, QPainter
+from PyQt5.QtWidgets import QGraphicsObject, QGraphicsPathItem, QGraphicsView, QGraphicsItem
 
-class DraggableNode(QLabel):
-    """A draggable node that can be moved around the screen."""
+class DraggableNode(QGraphicsObject):
+    """A draggable node that can be moved around the scene."""
     moved = pyqtSignal()
+    sharedFont = None # Font and metrics shared by every node, created with the first one
+    sharedMetrics = None
 
     def __init__(self, parent=None, name=None):
         super(DraggableNode, self).__init__(parent)
         self.name = name
+        self.componentId = None # Stable id of the component in the graph model
+        self.edges = [] # Edges drawn from or to this node, updated when it moves
+        self._text = ""
+        self.hovered = False
+        self.latency = None # p99 call latency in microseconds shown by the profile overlay, None when not profiled
+        self.heat = 0.0 # 0 (fastest) to 1 (slowest component of the graph), tints the node from navy to red
         self.initUI(name)
 
     def initUI(self, name):
+        if DraggableNode.sharedFont is None:
+            DraggableNode.sharedFont = QFont("Arial", 10, QFont.Bold)
+            DraggableNode.sharedMetrics = QFontMetrics(DraggableNode.sharedFont)
+        self.font = DraggableNode.sharedFont
+        self.setFlags(QGraphicsItem.ItemIsMovable | QGraphicsItem.ItemSendsGeometryChanges)
+        self.setAcceptHoverEvents(True)
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache) # Moving a node blits its cached pixmap instead of repainting it
+        self.setZValue(1) # Nodes are drawn above edges
         if name:
             self.setText(name)
-        self.setFont(QFont("Arial", 10, QFont.Bold))
-        self.setAlignment(Qt.AlignCenter)
-        self.updateSize()
-        self.setupStyles()
-
-    def setupStyles(self):
-        # Set up a gradient background with shadow
-        gradient = QLinearGradient(0, 0, 0, self.height())
-        gradient.setColorAt(0.0, QColor(245, 245, 245))
-        gradient.setColorAt(1.0, QColor(225, 225, 225))
-        palette = QPalette()
-        palette.setBrush(QPalette.Window, QBrush(gradient))
-        self.setPalette(palette)
-        self.setAutoFillBackground(True)
-
-        # Set border and shadow effect
-        self.setStyleSheet("""
-            QLabel {
-                border: 1px solid #AAA;
-                border-radius: 10px;
-                padding: 5px;
-                background-color: qlineargradient(spread:pad, x1:0, y1:0, x2:0, y2:1, stop:0 rgba(0, 0, 128, 255), stop:1 rgba(0, 0, 128, 255));
-                color: white;
-            }
-            QLabel:hover {
-                border: 1px solid #666;
-            }
-        """)
+        else:
+            self.updateSize()
 
     def updateSize(self):
-        metrics = QFontMetrics(self.font())
-        width = metrics.width(self.text()) + 40  # Adding some padding
-        height = max(metrics.height() + 20, 50)  # Ensure minimum height
-        self.setFixedSize(width, height)
+        metrics = self.sharedMetrics
+        self.prepareGeometryChange()
+        self._width = metrics.width(self._text) + 40  # Adding some padding
+        self._height = max(metrics.height() + 20, 50)  # Ensure minimum height
 
     def setText(self, text):
-        super(DraggableNode, self).setText(text)
+        self._text = text
         self.updateSize()  # Update size whenever text changes
+        for edge in self.edges:
+            edge.updatePath()
+        self.update()
 
-    def mouseMoveEvent(self, e):
-        if e.buttons() == Qt.LeftButton:
-            # Ensure movement is smooth and centered
-            self.move(self.mapToParent(e.pos() - QPoint(self.width() // 2, self.height() // 2)))
+    def text(self):
+        return self._text
+
+    def setLatency(self, latency, heat=0.0):
+        '''Shows the p99 latency of the component (microseconds), or clears the overlay with None.'''
+        if latency == self.latency and heat == self.heat:
+            return
+        self.latency = latency
+        self.heat = heat
+        self.setToolTip("" if latency is None else f"p99 latency {latency:.1f} us")
+        self.update()
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def center(self):
+        '''Centre of the node in scene coordinates, where its edges attach.'''
+        return self.pos() + QPointF(self._width / 2, self._height / 2)
+
+    def boundingRect(self):
+        return QRectF(0, 0, self._width, self._height)
+
+    def paint(self, painter, option, widget=None):
+        # Rounded navy box with a light border that darkens on hover
+        rect = self.boundingRect().adjusted(0.5, 0.5, -0.5, -0.5)
+        gradient = QLinearGradient(0, 0, 0, self._height)
+        fill = QColor(int(200 * self.heat), 0, int(128 * (1 - self.heat))) if self.latency is not None else QColor(0, 0, 128)
+        gradient.setColorAt(0.0, fill)
+        gradient.setColorAt(1.0, fill)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(QPen(QColor("#666") if self.hovered else QColor("#AAA"), 1))
+        painter.setBrush(QBrush(gradient))
+        painter.drawRoundedRect(rect, 10, 10)
+        painter.setFont(self.font)
+        painter.setPen(Qt.white)
+        painter.drawText(self.boundingRect(), Qt.AlignCenter, self._text)
+        if self.latency is not None:
+            painter.drawText(self.boundingRect().adjusted(0, 0, 0, -3), Qt.AlignHCenter | Qt.AlignBottom, f"p99 {self.latency:.1f} us")
+
+    def hoverEnterEvent(self, event):
+        self.hovered = True
+        self.update()
+        super().hoverEnterEvent(event)
+
+    def hoverLeaveEvent(self, event):
+        self.hovered = False
+        self.update()
+        super().hoverLeaveEvent(event)
+
+    def itemChange(self, change, value):
+        if change == QGraphicsItem.ItemPositionHasChanged:
+            # Only the edges attached to this node need to follow it
+            for edge in self.edges:
+                edge.updatePath()
             self.moved.emit()  # Signal that the node has been moved.
+        return value # What the base implementation returns, without the cost of calling it for every change
+
+
+class EdgeItem(QGraphicsPathItem):
+    """The curve drawn for a flow between two nodes. Its geometry is cached and only recomputed when an endpoint moves."""
+    pen = QPen(Qt.white, 2)
+    def __init__(self, start_node, end_node):
+        super().__init__()
+        self.start_node = start_node
+        self.end_node = end_node
+        self.flowId = None # Id of the flow in the graph model
+        self.endpoints = None # Cached (x1, y1, x2, y2) centres the current path was built from
+        self.curve = QPainterPath() # Reused for every update, only its element positions change
+        self.curve.cubicTo(0, 0, 0, 0, 1, 1) # Placeholder, Qt drops a cubic whose points all coincide
+        self.setPen(self.pen)
+        self.setZValue(0)
+        start_node.edges.append(self)
+        end_node.edges.append(self)
+        self.updatePath()
+
+    def updatePath(self):
+        # Endpoints are compared as plain floats, building QPointF objects costs more than the rest of the update
+        start, end = self.start_node, self.end_node
+        start_pos, end_pos = start.pos(), end.pos()
+        x1, y1 = start_pos.x() + start._width / 2, start_pos.y() + start._height / 2
+        x2, y2 = end_pos.x() + end._width / 2, end_pos.y() + end._height / 2
+        if self.endpoints == (x1, y1, x2, y2):
+            return # Nothing moved, keep the cached geometry and avoid invalidating the area
+        self.endpoints = (x1, y1, x2, y2)
+        # Control points are chosen to create a smooth curve, modify as necessary
+        middle = (x1 + x2) / 2
+        curve = self.curve
+        curve.setElementPositionAt(0, x1, y1)
+        curve.setElementPositionAt(1, middle, y1)
+        curve.setElementPositionAt(2, middle, y2)
+        curve.setElementPositionAt(3, x2, y2)
+        self.setPath(curve) # Invalidates the old and new bounding rectangles only
+
+    def detach(self):
+        '''Unregisters the edge from its nodes before it is removed from the scene.'''
+        for node in (self.start_node, self.end_node):
+            if self in node.edges:
+                node.edges.remove(self)
+
+
+class GraphView(QGraphicsView):
+    """View of the graph scene with wheel zoom and background drag panning. Clicks are reported in scene coordinates."""
+    clicked = pyqtSignal(QPointF)
+    doubleClicked = pyqtSignal(QPointF)
+    minScale = 0.05
+    maxScale = 8.0
+
+    def __init__(self, scene, parent=None):
+        super().__init__(scene, parent)
+        self.setRenderHint(QPainter.Antialiasing)
+        self.setDragMode(QGraphicsView.ScrollHandDrag) # Dragging the background pans, dragging a node moves it
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        self.setViewportUpdateMode(QGraphicsView.BoundingRectViewportUpdate) # Repaint the union of the dirty item rectangles only
+        self.setOptimizationFlags(QGraphicsView.DontSavePainterState) # Items set up their own pens and brushes
+        self.setBackgroundBrush(self.palette().window())
+        self.setAlignment(Qt.AlignLeft | Qt.AlignTop) # Keep the layout of new nodes anchored to the top left corner
+
+    def wheelEvent(self, event):
+        factor = 1.15 ** (event.angleDelta().y() / 120)
+        scale = self.transform().m11() * factor
+        if self.minScale <= scale <= self.maxScale:
+            self.scale(factor, factor)
+
+    def mousePressEvent(self, event):
+        super().mousePressEvent(event)
+        if event.button() == Qt.LeftButton:
+            self.clicked.emit(self.mapToScene(event.pos()))
+
+    def mouseDoubleClickEvent(self, event):
+        super().mouseDoubleClickEvent(event)
+        if event.button() == Qt.LeftButton:
+            self.doubleClicked.emit(self.mapToScene(event.pos()))
@@ -0,0 +1,383 @@
+# Runs a component-flow graph across several worker processes.
+# The graph is partitioned into groups (one per component, or one per linear branch) and each group runs in its own
+# process, so acquisition, filtering and learning components do not share a GIL. Flows are carried by the shared
+# memory ring buffers of GUI/ringBuffer.py: consumers wait for data (starvation) and producers wait for free slots
+# (backpressure). Workers can be pinned to CPUs with psutil.
+#
+# The report gives, per component, the time spent computing, waiting for inputs and waiting for free output slots,
+# and per flow the mean/max ring occupancy, so the bottleneck of a large graph can be spotted at a glance.
+# With profile=True the workers also fill the latency, transfer time and queue depth histograms of GUI/runProfile.py.
+#
+# Components with a period (see GUI/graphEngine.py) only run on the last iteration of every period. A consumer slower
+# than its producer consumes every value the producer published meanwhile. With a window input the producer's ring is
+# the rollout buffer: it gets room for two windows and the consumer reads its window as a view of the ring (transposed
+# for windows stacked along the last axis), while the producer fills the other half. Otherwise the consumer takes the
+# values one at a time, so the producer never waits for it, and keeps the last. A consumer faster than its producer
+# reads the producer's latest value without waiting.
+
+import multiprocessing
+import queue
+import time
+from functools import partial
+
+import numpy as np
+import psutil
+
+from GUI.flowTransport import isRemote
+from GUI.graphEngine import (componentKwargs, componentPeriods, loadCatalog, nodePorts, parseShape, resolveFunction,
+                              topologicalOrder, windowLayout, windowSlots)
+from GUI.ringBuffer import FlowBuffers, SharedRingBuffer
+
+PARTITION_MODES = ('component', 'branch')
+_SPIN_LIMIT = 2000  # Busy polls before a waiting worker starts sleeping between polls
+_IDLE_SLEEP = 20e-6
+
+
+def partitionGraph(components, flows, order, mode='component', periods=None):
+    '''Splits the ordered component names into groups that run in the same process.'''
+    if mode == 'component':
+        return [[name] for name in order]
+    if mode != 'branch':
+        raise ValueError(f"Unknown partition mode {mode!r}, expected one of {PARTITION_MODES}")
+    # A branch is a chain of components linked one-to-one at the same period; fan-in, fan-out or a change of rate
+    # (the slower component would wait for values its own process has not produced yet) starts a new group
+    periods = periods or {}
+    predecessors = {name: set() for name in components}
+    successors = {name: set() for name in components}
+    for output, start, pipe, end in (flow[:4] for flow in flows):
+        if start != end and pipe not in components[end].get('state', {}):
+            predecessors[end].add(start)
+            successors[start].add(end)
+    groupOf = {}
+    groups = []
+    for name in order:
+        if len(predecessors[name]) == 1:
+            parent = next(iter(predecessors[name]))
+            if len(successors[parent]) == 1 and periods.get(parent, 1) == periods.get(name, 1):
+                groupOf[name] = groupOf[parent]
+                groups[groupOf[name]].append(name)
+                continue
+        groupOf[name] = len(groups)
+        groups.append([name])
+    return groups
+
+
+def availableCpus():
+    '''CPUs this process may run on.'''
+    try:
+        return psutil.Process().cpu_affinity()
+    except AttributeError:  # cpu_affinity is not supported on macOS
+        return list(range(psutil.cpu_count()))
+
+
+def resolveAffinity(affinity, groups):
+    '''Turns an affinity request ("auto" or {component: cpu or [cpus]}) into a CPU list per group (None = unpinned).'''
+    if not affinity:
+        return [None] * len(groups)
+    if affinity == 'auto':
+        cpus = availableCpus()
+        return [[cpus[index % len(cpus)]] for index in range(len(groups))]
+    pinned = []
+    for group in groups:
+        cpus = set()
+        for name in group:
+            request = affinity.get(name)
+            if request is not None:
+                cpus.update([request] if isinstance(request, int) else request)
+        pinned.append(sorted(cpus) or None)
+    return pinned
+
+
+def _pin(cpus):
+    if cpus is None:
+        return
+    try:
+        psutil.Process().cpu_affinity(cpus)
+    except AttributeError:
+        print("CPU affinity is not supported on this platform, running unpinned")
+
+
+def _consume(ring, reader, count=None):
+    '''Waits until the reader has an item, or `count` items, and returns a view of it, or the window of them.'''
+    spins = 0
+    while ring.available(reader) < (count or 1):
+        spins += 1
+        if spins > _SPIN_LIMIT:
+            time.sleep(_IDLE_SLEEP)
+    return ring.consume(reader) if count is None else ring.consumeWindow(reader, count)
+
+
+def _runWorker(groupIndex, nodes, iterations, cpus, barrier, results, profileName=None):
+    '''Body of a worker process: steps its components in order for the given number of iterations.'''
+    _pin(cpus)
+    clock = time.perf_counter_ns
+    profile = None
+    if profileName:
+        from GUI.runProfile import COMPONENT, DEPTH, TRANSFER, ProfileHistograms
+        profile = ProfileHistograms.attach(profileName)
+    rings = {}
+    compiled = []
+    for node in nodes:
+        fn = resolveFunction(node['module'], node['function'])
+        if node['kwargs']:
+            fn = partial(fn, **node['kwargs'])
+        for source in node['args']:
+            if source[0] in ('ring', 'latest', 'window', 'hold') and source[1] not in rings:
+                rings[source[1]] = SharedRingBuffer.attach(source[1])
+        for ringName, statePort in node['outs']:
+            if ringName and ringName not in rings:
+                rings[ringName] = SharedRingBuffer.attach(ringName)
+        state = {port: np.zeros(shape) for port, shape in node['state'].items()}
+        zeros = [np.zeros(source[1]) if source[0] == 'zeros' else None for source in node['args']]
+        stats = {'calls': 0, 'busy_ns': 0, 'starved_ns': 0, 'blocked_ns': 0}
+        if profile:
+            stats['record'] = profile.recorder(f"{COMPONENT}:{node['name']}")
+        compiled.append((node, fn, zeros, state, stats))
+    flowStats = {}
+    for node in nodes:
+        for (ringName, statePort), port in zip(node['outs'], node['ports']):
+            if ringName:
+                flowStats[ringName] = {'fill': 0, 'max_fill': 0, 'pushes': 0, 'blocked_ns': 0}
+                if profile:
+                    flowStats[ringName]['transfer'] = profile.recorder(f"{TRANSFER}:{node['name']}.{port}")
+                    flowStats[ringName]['depth'] = profile.recorder(f"{DEPTH}:{node['name']}.{port}")
+
+    barrier.wait()
+    start = clock()
+    for iteration in range(iterations):
+        for node, fn, zeros, state, stats in compiled:
+            period = node['period']
+            if iteration % period != period - 1:
+                continue
+            t0 = clock()
+            args = []
+            for index, source in enumerate(node['args']):
+                kind = source[0]
+                if kind == 'ring':
+                    args.append(_consume(rings[source[1]], source[2]))
+                elif kind == 'window':  # The values of a faster producer since the last call, in place in the ring
+                    window = _consume(rings[source[1]], source[2], source[3])
+                    args.append(np.moveaxis(window, 0, -1) if source[4] else window)
+                elif kind == 'hold':  # The last value of a faster producer, the others are skipped
+                    ring, reader = rings[source[1]], source[2]
+                    for _ in range(source[3] - 1):
+                        _consume(ring, reader)
+                        ring.release(reader)
+                    args.append(_consume(ring, reader))
+                elif kind == 'latest':  # Feedback flow or slower producer: latest value, never waits
+                    ring = rings[source[1]]
+                    latest = ring.latest()
+                    ring.catchUp(source[2])
+                    args.append(zeros[index] if latest is None else latest)
+                elif kind == 'state':
+                    args.append(state[source[1]])
+                else:
+                    args.append(zeros[index])
+            t1 = clock()
+            result = fn(*args)
+            t2 = clock()
+            if profile:
+                stats['record'](t2 - t1)
+            outs = node['outs']
+            if len(outs) == 1:
+                result = (result,)
+            for (ringName, statePort), value in zip(outs, result if outs else ()):
+                if statePort:
+                    state[statePort] = value
+                if ringName:
+                    ring = rings[ringName]
+                    flow = flowStats[ringName]
+                    spins = 0
+                    blockStart = clock()
+                    while not ring.free():
+                        spins += 1
+                        if spins > _SPIN_LIMIT:
+                            time.sleep(_IDLE_SLEEP)
+                    if spins:
+                        flow['blocked_ns'] += clock() - blockStart
+                    fill = ring.slots - ring.free()
+                    flow['fill'] += fill
+                    flow['max_fill'] = max(flow['max_fill'], fill)
+                    flow['pushes'] += 1
+                    ring.push(value)
+                    if profile:
+                        flow['transfer'](clock() - blockStart)
+                        flow['depth'](fill)
+            for source in node['args']:
+                if source[0] in ('ring', 'hold'):
+                    rings[source[1]].release(source[2])
+                elif source[0] == 'window':
+                    rings[source[1]].release(source[2], source[3])
+            t3 = clock()
+            stats['calls'] += 1
+            stats['starved_ns'] += t1 - t0
+            stats['busy_ns'] += t2 - t1
+            stats['blocked_ns'] += t3 - t2
+    for node, fn, zeros, state, stats in compiled:
+        for source in node['args']:
+            if source[0] in ('ring', 'latest', 'window', 'hold'):
+                rings[source[1]].detach(source[2])  # Producers slower or at another period may still be publishing
+    wall = clock() - start
+    for stats in [stats for node, fn, zeros, state, stats in compiled] + list(flowStats.values()):
+        for key in ('record', 'transfer', 'depth'):
+            stats.pop(key, None)  # Recorders cannot be sent back to the scheduler
+    results.put((groupIndex, {node['name']: stats for node, fn, zeros, state, stats in compiled}, flowStats, wall))
+    for ring in rings.values():
+        ring.close()
+    if profile:
+        profile.close()
+
+
+class ParallelScheduler:
+    '''Runs independent parts of a graph in separate worker processes connected by shared-memory flows.'''
+    def __init__(self, components, flows, config, catalog=None, mode='component', affinity=None, slots=8, runId=None,
+                 profile=False):
+        self.components = components
+        self.flows = flows
+        self.config = config
+        self.catalog = catalog if catalog is not None else loadCatalog()
+        self.iterations = int(config['Iterations'])
+        self.slots = slots
+        self.runId = runId
+        self.profileEnabled = profile
+        self.profile = None  # ProfileHistograms of the last profiled run, readable until close()
+        if any(isRemote(flow) for flow in flows):
+            raise ValueError("Remote flows are not supported by the parallel scheduler, run each machine with GraphEngine")
+        self.order = topologicalOrder(components, flows)
+        self.periods = componentPeriods(components, config, self.catalog)
+        self.windows = {}  # (consumer, input) -> (length, axis) of the flows handing over windows, see windowLayout()
+        self.portSlots = {}  # (producer, output) -> ring slots, enough for two windows of every window it fills
+        windowLengths = {}  # (producer, output) -> lengths of the windows it fills
+        for output, start, pipe, end in (flow[:4] for flow in flows):
+            if pipe not in components[end].get('inputs', {}):
+                continue
+            produced = parseShape(components[start].get('outputs', {}).get(output) or components[start]['state'][output], config)
+            length, axis = windowLayout(self.periods[start], self.periods[end], produced,
+                                        parseShape(components[end]['inputs'][pipe], config))
+            if length > 1:
+                self.windows[(end, pipe)] = (length, axis)
+                windowLengths.setdefault((start, output), []).append(length)
+        self.portSlots = {key: windowSlots(slots, lengths) for key, lengths in windowLengths.items()}
+        self.groups = partitionGraph(components, flows, self.order, mode, self.periods)
+        self.affinity = resolveAffinity(affinity, self.groups)
+
+    def nodeSpecs(self, buffers):
+        '''Describes every component in terms a worker process can rebuild: function names, argument sources and output targets.'''
+        sources = {}
+        for index, (output, start, pipe, end) in enumerate(flow[:4] for flow in self.flows):
+            ring, reader = buffers.readers[index]
+            producer, consumer = self.periods[start], self.periods[end]
+            if pipe in self.components[end].get('state', {}) or consumer < producer:
+                sources[(end, pipe)] = ('latest', ring.name, reader)
+            elif (end, pipe) in self.windows:
+                sources[(end, pipe)] = ('window', ring.name, reader) + self.windows[(end, pipe)]
+            elif consumer > producer:
+                sources[(end, pipe)] = ('hold', ring.name, reader, consumer // producer)
+            else:
+                sources[(end, pipe)] = ('ring', ring.name, reader)
+        specs = {}
+        for name in self.order:
+            info = self.components[name]
+            spec = self.catalog[info['Component']]
+            inputs, outputs, state = nodePorts(info)
+            kwargs = componentKwargs(info, spec, self.config)
+            args = []
+            for port in inputs:
+                args.append(sources.get((name, port)) or ('zeros', parseShape(info['inputs'][port], self.config)))
+            for port in state:
+                args.append(sources.get((name, port)) or ('state', port))
+            outs = []
+            for port in outputs + state:
+                ring = buffers.rings.get((name, port))
+                outs.append((ring.name if ring else None, port if port in state else None))
+            specs[name] = {
+                'name': name, 'module': spec['module'], 'function': spec['function'], 'kwargs': kwargs, 'period': self.periods[name],
+                'args': args, 'outs': outs, 'ports': outputs + state,
+                'state': {port: parseShape(info['state'][port], self.config) for port in state},
+            }
+        return specs
+
+    def run(self, iterations=None):
+        '''Starts one worker per group, waits for all of them and returns the utilisation report.'''
+        iterations = self.iterations if iterations is None else iterations
+        with FlowBuffers(self.components, self.flows, self.config, slots=self.slots, runId=self.runId,
+                         portSlots=self.portSlots) as buffers:
+            specs = self.nodeSpecs(buffers)
+            profileName = None
+            if self.profileEnabled:
+                from GUI.runProfile import ProfileHistograms, profileSeries
+                self.closeProfile()
+                self.profile = ProfileHistograms(profileSeries(self.order, self.flows, depth=True), runId=buffers.runId)
+                profileName = self.profile.name
+            barrier = multiprocessing.Barrier(len(self.groups) + 1)
+            results = multiprocessing.Queue()
+            workers = []
+            for index, group in enumerate(self.groups):
+                worker = multiprocessing.Process(target=_runWorker, name=f"nw-worker-{index}",
+                                                 args=(index, [specs[name] for name in group], iterations,
+                                                       self.affinity[index], barrier, results, profileName))
+                worker.start()
+                workers.append(worker)
+            try:
+                barrier.wait(timeout=60)  # Every worker has imported its components
+                collected = []
+                while len(collected) < len(workers):
+                    try:
+                        collected.append(results.get(timeout=0.5))
+                    except queue.Empty:
+                        failed = [worker.name for worker in workers if worker.exitcode not in (None, 0)]
+                        if failed:
+                            raise RuntimeError(f"Worker process failed: {', '.join(failed)}")
+                for worker in workers:
+                    worker.join()
+            finally:
+                for worker in workers:
+                    if worker.is_alive():
+                        worker.terminate()
+                        worker.join()
+            return self.report(collected, buffers, iterations)
+
+    def closeProfile(self):
+        '''Releases the profile histograms of the last run.'''
+        if self.profile is not None:
+            self.profile.close()
+            self.profile = None
+
+    def report(self, collected, buffers, iterations):
+        '''Combines worker statistics into per-component utilisation and per-flow backpressure.'''
+        report = {'iterations': iterations, 'processes': len(self.groups), 'wall_s': 0.0, 'components': {}, 'flows': {}}
+        flowNames = {ring.name: f"{start}.{output}" for (start, output), ring in buffers.rings.items()}
+        ringSlots = {ring.name: ring.slots for ring in buffers.rings.values()}
+        for groupIndex, componentStats, flowStats, wall in sorted(collected, key=lambda item: item[0]):
+            report['wall_s'] = max(report['wall_s'], wall / 1e9)
+            for name, stats in componentStats.items():
+                report['components'][name] = {
+                    'process': groupIndex,
+                    'cpus': self.affinity[groupIndex],
+                    'calls': stats['calls'],
+                    'busy_s': stats['busy_ns'] / 1e9,
+                    'starved_s': stats['starved_ns'] / 1e9,
+                    'blocked_s': stats['blocked_ns'] / 1e9,
+                    'utilisation': stats['busy_ns'] / wall if wall else 0.0,
+                }
+            for ringName, stats in flowStats.items():
+                report['flows'][flowNames[ringName]] = {
+                    'slots': ringSlots[ringName],
+                    'mean_fill': stats['fill'] / stats['pushes'] if stats['pushes'] else 0.0,
+                    'max_fill': stats['max_fill'],
+                    'blocked_s': stats['blocked_ns'] / 1e9,
+                }
+        if report['components']:
+            report['bottleneck'] = max(report['components'], key=lambda name: report['components'][name]['utilisation'])
+        return report
+
+
+def parseAffinity(text):
+    '''Parses the runner's --affinity argument: "auto" or "component=cpu[,cpu];component=cpu".'''
+    if not text or text == 'auto':
+        return text
+    affinity = {}
+    for entry in text.split(';'):
+        name, cpus = entry.split('=')
+        affinity[name.strip()] = [int(cpu) for cpu in cpus.split(',')]
+    return affinity
@@ -0,0 +1,85 @@
+# On-disk cache of compiled execution plans.
+# Building an engine means validating the graph, importing every component module, ordering the graph and laying out
+# its buffers. The result, an ExecutionPlan (GUI/graphEngine.py), is pickled under GUI/plans/ named after a content
+# hash of everything it was derived from: the components, flows, configuration and the catalog entries of the
+# component types used. Running an unchanged graph again loads the plan instead, so the runner starts in milliseconds:
+#     python3 -m GUI.runner --plan GUI/plans/<hash>.plan
+# Changing the graph, the configuration or a used catalog entry changes the hash, so stale plans are never reused.
+# Only validated graphs are cached, which is why a cached plan runs without validating the graph again.
+# Edits to the component modules themselves need no invalidation: functions are pickled by reference and imported
+# again when a plan is loaded.
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+
+from GUI.graphEngine import loadCatalog
+from GUI.graphIO import atomicWrite
+
+PLAN_DIR = "GUI/plans"
+PLAN_VERSION = 5  # Bumped whenever ExecutionPlan or what gets cached changes, so plans pickled by older code are recompiled
+MAX_PLANS = 32  # Plans kept on disk, the least recently used ones are removed
+
+
+def graphHash(components, flows, config, catalog=None, localComponents=None):
+    '''Content hash of a run: the graph, its configuration and the catalog entries of the component types it uses.'''
+    catalog = catalog if catalog is not None else loadCatalog()
+    types = {}
+    for info in components.values():
+        typeName = info.get('Component')
+        if typeName not in types:
+            types[typeName] = dict(catalog[typeName]) if typeName in catalog else None
+    content = [PLAN_VERSION, sys.version_info[:2], components, flows, config, types,
+               sorted(localComponents) if localComponents is not None else None]
+    return hashlib.sha256(json.dumps(content, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def planPath(key, directory=PLAN_DIR):
+    return os.path.join(directory, f"{key}.plan")
+
+
+def loadPlan(path):
+    '''Unpickles a cached plan. Returns None if the file is missing or cannot be used (e.g. written by another version).'''
+    try:
+        with open(path, 'rb') as file:
+            version, plan = pickle.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError, TypeError) as e:
+        print(f"Ignoring cached plan {path}: {e}")
+        return None
+    if version != PLAN_VERSION:
+        return None
+    os.utime(path)  # Marks the plan as recently used
+    return plan
+
+
+def savePlan(plan, path):
+    '''Pickles a plan atomically. Returns False if the plan holds something that cannot be pickled.'''
+    try:
+        data = pickle.dumps((PLAN_VERSION, plan), protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, AttributeError, TypeError) as e:
+        print(f"Execution plan not cached: {e}")
+        return False
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    atomicWrite(path, data)
+    prunePlans(os.path.dirname(path) or '.')
+    return True
+
+
+def prunePlans(directory=PLAN_DIR, keep=MAX_PLANS):
+    '''Removes the least recently used plans beyond `keep`.'''
+    plans = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.plan')]
+    plans.sort(key=os.path.getmtime, reverse=True)
+    for path in plans[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def cachedPlanPath(components, flows, config, catalog=None, localComponents=None, directory=PLAN_DIR):
+    '''Where the plan of this run is cached, whether or not it has been compiled yet.'''
+    return planPath(graphHash(components, flows, config, catalog, localComponents), directory)
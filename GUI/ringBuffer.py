@@ -0,0 +1,242 @@
+# Shared-memory ring buffers carrying flow data between components.
+# Every producer output port that feeds at least one flow is backed by one SharedRingBuffer: a preallocated block of
+# fixed-shape NumPy slots in multiprocessing.shared_memory, sized from the shapes declared in the saved graph.
+# Producers copy each value into the next slot (push(), or write it in place with claim()/commit()) and publish it by
+# advancing the head counter; consumers get NumPy views of the slots, so a value is copied once when it is published
+# and never pickled or copied again on its way to the components reading it. Each flow reading the port owns a reader
+# cursor, which lets a producer in another process see how far behind its consumers are (backpressure, see
+# GUI/parallelScheduler.py). The single-process engine neither waits on nor advances the cursors: its consumers run
+# right after the producer in the same thread and read the latest slot.
+#
+# Segments are named "nw_<run id>_<index>", so GUI/cleanup.py can remove whatever a killed run left behind.
+
+import os
+import uuid
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from GUI.graphEngine import parseShape
+
+SEGMENT_PREFIX = "nw_"
+MAX_DIMS = 8
+_MAGIC = 0x4E57524231  # "NWRB1"
+_HEAD = 6 + MAX_DIMS  # Header word holding the number of published slots, reader cursors follow it
+_DETACHED = 1 << 62  # Cursor of a detached reader, ahead of anything the producer will publish
+
+
+def newRunId():
+    '''Short unique id used to name the shared memory segments of one run.'''
+    return uuid.uuid4().hex[:8]
+
+
+def _openSegment(name, size=0):
+    '''Creates (size > 0) or attaches to a segment without letting the resource tracker unlink it when this process exits.'''
+    try:
+        return SharedMemory(name=name, create=size > 0, size=size, track=False)
+    except TypeError:  # Python < 3.13 always registers the segment with the resource tracker
+        shm = SharedMemory(name=name, create=size > 0, size=size)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _unlinkSegment(shm):
+    if not hasattr(shm, '_track'):  # Python < 3.13: unlink() unregisters, so register again to keep the tracker balanced
+        resource_tracker.register(shm._name, 'shared_memory')
+    try:
+        shm.unlink()
+    except FileNotFoundError:  # Already removed, e.g. by cleanupSegments() after a run was killed
+        if not hasattr(shm, '_track'):
+            resource_tracker.unregister(shm._name, 'shared_memory')
+
+
+class SharedRingBuffer:
+    '''A single-producer, multi-reader ring of fixed-shape NumPy arrays living in shared memory.'''
+    def __init__(self, shape, dtype='float64', slots=4, readers=1, name=None, create=True):
+        if create:
+            shape = tuple(int(dim) for dim in shape)
+            if len(shape) > MAX_DIMS:
+                raise ValueError(f"Ring buffers support up to {MAX_DIMS} dimensions, got shape {shape}")
+            dtype = np.dtype(dtype)
+            headerWords = _HEAD + 1 + readers
+            headerBytes = -(-headerWords * 8 // 64) * 64  # Data starts on a cache line boundary
+            size = headerBytes + slots * int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            self.shm = _openSegment(name or f"{SEGMENT_PREFIX}{newRunId()}", max(size, 1))
+            header = np.ndarray(headerWords, dtype=np.int64, buffer=self.shm.buf)
+            header[:] = 0
+            header[1:6] = [slots, readers, len(shape), headerBytes, ord(dtype.char)]
+            header[6:6 + len(shape)] = shape
+            header[0] = _MAGIC
+        else:
+            self.shm = _openSegment(name)
+            header = np.ndarray(_HEAD, dtype=np.int64, buffer=self.shm.buf)
+            if header[0] != _MAGIC:
+                raise ValueError(f"Shared memory segment {name!r} is not a flow ring buffer")
+            slots, readers, ndim, headerBytes, dtypeChar = (int(word) for word in header[1:6])
+            shape = tuple(int(dim) for dim in header[6:6 + ndim])
+            dtype = np.dtype(chr(dtypeChar))
+        self.name = self.shm.name
+        self.shape = shape
+        self.dtype = dtype
+        self.slots = slots
+        self.readers = readers
+        self.nbytes = slots * int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        self._header = np.ndarray(_HEAD + 1 + readers, dtype=np.int64, buffer=self.shm.buf)
+        self._cursors = self._header[_HEAD + 1:]
+        self._data = np.ndarray((slots,) + shape, dtype=dtype, buffer=self.shm.buf, offset=headerBytes)
+        self._owner = create
+
+    @classmethod
+    def attach(cls, name):
+        '''Opens a ring buffer created by another process.'''
+        return cls(None, name=name, create=False)
+
+    @property
+    def head(self):
+        '''Number of slots published so far.'''
+        return int(self._header[_HEAD])
+
+    def claim(self):
+        '''Returns the next slot so the producer can write into shared memory in place. Publish it with commit().'''
+        return self._data[self._header[_HEAD] % self.slots]
+
+    def commit(self):
+        '''Publishes the slot returned by claim() and returns a view of it.'''
+        head = self._header[_HEAD]
+        self._header[_HEAD] = head + 1
+        return self._data[head % self.slots]
+
+    def push(self, value):
+        '''Copies a value into the next slot and publishes it. Returns the view consumers will read.'''
+        self._data[self._header[_HEAD] % self.slots] = value
+        return self.commit()
+
+    def latest(self):
+        '''View of the most recently published slot, or None if nothing was published yet.'''
+        head = self._header[_HEAD]
+        return self._data[(head - 1) % self.slots] if head else None
+
+    def read(self, sequence):
+        '''View of the slot holding published item number `sequence`. Valid until the producer laps it.'''
+        return self._data[sequence % self.slots]
+
+    def available(self, reader):
+        '''Number of published items the reader has not consumed yet.'''
+        return int(self._header[_HEAD] - self._cursors[reader])
+
+    def consume(self, reader):
+        '''View of the next unconsumed item for the reader. Call release() once done with it.'''
+        return self._data[self._cursors[reader] % self.slots]
+
+    def consumeWindow(self, reader, count):
+        '''The reader's next `count` items as one (count,) + shape array: a view when they are contiguous in the ring
+        (always the case when the slots are a multiple of count and the reader consumes count items at a time), a copy
+        otherwise. Call release(reader, count) once done with it.'''
+        first = int(self._cursors[reader]) % self.slots
+        if first + count <= self.slots:
+            return self._data[first:first + count]
+        return self._data.take(range(first, first + count), axis=0, mode='wrap')
+
+    def release(self, reader, count=1):
+        '''Marks the reader's current item (or `count` items) as consumed, freeing their slots for the producer.'''
+        self._cursors[reader] += count
+
+    def catchUp(self, reader):
+        '''Marks everything published so far as consumed. Used by readers that only ever want the latest item.'''
+        self._cursors[reader] = self._header[_HEAD]
+
+    def detach(self, reader):
+        '''Stops a reader from holding the producer back, used once its consumer has finished.'''
+        self._cursors[reader] = _DETACHED
+
+    def free(self):
+        '''Number of slots the producer can publish without overwriting an item a reader has not consumed.'''
+        if not self.readers:
+            return self.slots
+        return int(min(self.slots - (self._header[_HEAD] - self._cursors.min()), self.slots))  # Detached readers are ahead
+
+    def close(self):
+        '''Releases the NumPy views and detaches from the segment. The owner also removes the segment.'''
+        self._header = self._cursors = self._data = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # Views handed to consumers are still alive; the mapping goes away with them
+        if self._owner:
+            _unlinkSegment(self.shm)
+            self._owner = False
+
+
+def flowSegmentNames(flows, runId):
+    '''Segment name of the ring buffer every producer port of a run publishes into, so other processes (e.g. the
+    signal monitor of the graph editor) can find a flow's data from the saved flows and the run id alone.'''
+    names = {}
+    for output, start, pipe, end in (flow[:4] for flow in flows):
+        if (start, output) not in names:
+            names[(start, output)] = f"{SEGMENT_PREFIX}{runId}_{len(names)}"
+    return names
+
+
+class FlowBuffers:
+    '''Allocates one ring buffer per producer output port of a graph, with one reader cursor per flow reading it.
+    `portSlots` gives some ports ({(component name, output port): slots}) more slots than the others.'''
+    def __init__(self, components, flows, config, slots=4, runId=None, dtype='float64', portSlots=None):
+        self.runId = runId or newRunId()
+        self.rings = {}  # (component name, output port) -> SharedRingBuffer
+        self.readers = []  # flow index -> (ring, reader index)
+        readerCount = {}
+        for output, start, pipe, end in (flow[:4] for flow in flows):
+            readerCount[(start, output)] = readerCount.get((start, output), 0) + 1
+        names = flowSegmentNames(flows, self.runId)
+        try:
+            for (start, output), readers in readerCount.items():
+                info = components[start]
+                shape = info.get('outputs', {}).get(output) or info.get('state', {}).get(output)
+                self.rings[(start, output)] = SharedRingBuffer(parseShape(shape, config), dtype,
+                                                               (portSlots or {}).get((start, output), slots), readers,
+                                                               name=names[(start, output)])
+        except Exception:
+            self.close()
+            raise
+        nextReader = {key: 0 for key in self.rings}
+        for output, start, pipe, end in (flow[:4] for flow in flows):
+            self.readers.append((self.rings[(start, output)], nextReader[(start, output)]))
+            nextReader[(start, output)] += 1
+
+    @property
+    def nbytes(self):
+        '''Total shared memory used by the flow data.'''
+        return sum(ring.nbytes for ring in self.rings.values())
+
+    def names(self):
+        '''Maps "start.output" to segment names so other processes can attach to the flows.'''
+        return {f"{start}.{output}": ring.name for (start, output), ring in self.rings.items()}
+
+    def close(self):
+        for ring in self.rings.values():
+            ring.close()
+        self.rings = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def cleanupSegments(runId=None):
+    '''Removes leftover segments of a run (or of every run) from /dev/shm. Returns the names removed.'''
+    directory = '/dev/shm'
+    if not os.path.isdir(directory):
+        return []  # Only Linux exposes the segments as files
+    prefix = SEGMENT_PREFIX + (f"{runId}_" if runId else "")
+    removed = []
+    for fileName in os.listdir(directory):
+        if fileName.startswith(prefix):
+            try:
+                os.unlink(os.path.join(directory, fileName))
+                removed.append(fileName)
+            except OSError:
+                pass
+    return removed
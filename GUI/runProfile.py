@@ -0,0 +1,207 @@
+# Latency histograms recorded while a graph runs.
+# With profiling switched on (runner --profile, or the Profile button of the graph editor) the engine times every
+# component call and every flow transfer (the push into the flow's ring buffer or remote socket), and the parallel
+# scheduler also samples the ring occupancy (queue depth) at every push. Without it nothing is wrapped, so a
+# production run pays nothing.
+#
+# Samples go into HDR-style histograms: values below 2 * SUB_COUNT are counted exactly, larger values in SUB_COUNT
+# linear sub-buckets per power of two, so every bucket is within 1 / SUB_COUNT (about 6%) of its values whatever the
+# range, from nanoseconds to minutes, in a fixed BUCKETS counters. Recording a sample increments one counter (and
+# the row's maximum when it grows); counts and means are derived from the buckets when read. All histograms of a run
+# are preallocated in one shared memory segment named after the run, "nw_<run id>_profile". Every row has a single
+# writer (the process running that component) and readers such as the canvas overlay simply read the counters, so
+# recording takes no lock.
+
+import json
+import time
+
+import numpy as np
+
+from GUI.ringBuffer import SEGMENT_PREFIX, _openSegment, _unlinkSegment
+
+SUB_BITS = 4
+SUB_COUNT = 1 << SUB_BITS
+BUCKETS = 640  # Enough for values up to 2**43 ns (about 2.4 hours), larger ones go into the last bucket
+_MAGIC = 0x4E5750524F46  # "NWPROF"
+_HEADER = 4  # Magic, number of rows, offset and length of the series names
+_TOTALS = 1  # Every row starts with the maximum sample, followed by the buckets
+_ROW = _TOTALS + BUCKETS
+
+COMPONENT = "component"  # Series kinds: call latency of a component, in ns
+TRANSFER = "transfer"  # Time to push a value into a flow, in ns
+DEPTH = "depth"  # Occupied slots of a flow's ring buffer at each push
+
+
+def profileSegmentName(runId):
+    return f"{SEGMENT_PREFIX}{runId}_profile"
+
+
+def bucketValue(index):
+    '''Smallest value counted in a bucket.'''
+    if index < 2 * SUB_COUNT:
+        return index
+    shift = index // SUB_COUNT - 1
+    return (index - shift * SUB_COUNT) << shift
+
+
+_bucketValues = np.array([bucketValue(index) for index in range(BUCKETS)], dtype=np.float64)
+_bucketWidths = np.array([bucketValue(index + 1) - bucketValue(index) for index in range(BUCKETS)], dtype=np.float64)
+_bucketMiddles = _bucketValues + (_bucketWidths - 1) / 2
+
+
+def profileSeries(order, flows, depth=False):
+    '''Series names of a run: one per component, one per published output port, and its queue depth if requested.'''
+    series = [f"{COMPONENT}:{name}" for name in order]
+    components = set(order)
+    published = []
+    for output, start, pipe, end in (flow[:4] for flow in flows):
+        if start in components and f"{start}.{output}" not in published:
+            published.append(f"{start}.{output}")
+    series += [f"{TRANSFER}:{port}" for port in published]
+    if depth:
+        series += [f"{DEPTH}:{port}" for port in published]
+    return series
+
+
+class ProfileHistograms:
+    '''One preallocated histogram row per series, in a shared memory segment other processes can attach to.'''
+    def __init__(self, series=None, runId=None, name=None, create=True):
+        if create:
+            names = json.dumps(list(series)).encode('utf-8')
+            dataBytes = (_HEADER + len(series) * _ROW) * 8
+            self.shm = _openSegment(name or profileSegmentName(runId), dataBytes + len(names))
+            self.shm.buf[dataBytes:dataBytes + len(names)] = names
+            header = np.ndarray(_HEADER, dtype=np.int64, buffer=self.shm.buf)
+            header[1:] = [len(series), dataBytes, len(names)]
+            np.ndarray(len(series) * _ROW, dtype=np.int64, buffer=self.shm.buf, offset=_HEADER * 8)[:] = 0
+            header[0] = _MAGIC
+        else:
+            self.shm = _openSegment(name)
+            header = np.ndarray(_HEADER, dtype=np.int64, buffer=self.shm.buf)
+            if header[0] != _MAGIC:
+                raise ValueError(f"Shared memory segment {name!r} does not hold profile histograms")
+            rows, offset, length = (int(word) for word in header[1:])
+            series = json.loads(bytes(self.shm.buf[offset:offset + length]).decode('utf-8'))
+        self.name = self.shm.name
+        self.series = list(series)
+        self.index = {name: row for row, name in enumerate(self.series)}
+        self.rows = np.ndarray((len(self.series), _ROW), dtype=np.int64, buffer=self.shm.buf, offset=_HEADER * 8)
+        self._words = self.shm.buf[_HEADER * 8:(_HEADER + len(self.series) * _ROW) * 8].cast('q')  # Cheaper to update than the array
+        self._owner = create
+
+    @classmethod
+    def attach(cls, name):
+        '''Opens the histograms of a run from another process.'''
+        return cls(name=name, create=False)
+
+    def recorder(self, series):
+        '''Returns record(value) adding one sample to a series. Only one thread or process may record into a series.
+        record() is where samples are mapped to buckets, bucketValue() is its inverse.'''
+        words = self._words
+        peak = self.index[series] * _ROW
+        buckets = peak + _TOTALS
+        small = 2 * SUB_COUNT
+        largest = bucketValue(BUCKETS) - 1  # Largest value of the last bucket, larger samples are counted there
+        maximum = 0
+
+        # Kept to plain comparisons and shifts: this runs for every component call of a profiled run
+        def record(value):
+            nonlocal maximum
+            if value > maximum:
+                maximum = words[peak] = value
+            if value < small:
+                words[buckets + (value if value > 0 else 0)] += 1
+            else:
+                if value > largest:
+                    value = largest
+                shift = value.bit_length() - SUB_BITS - 1
+                words[buckets + (shift << SUB_BITS) + (value >> shift)] += 1
+        return record
+
+    def percentile(self, series, q):
+        '''Approximate q-th percentile (0-100) of a series, interpolated within its bucket. None without samples.'''
+        counts = self.rows[self.index[series], _TOTALS:].astype(np.float64)  # A copy, so it cannot change while it is read
+        count = counts.sum()
+        if not count:
+            return None
+        cumulative = np.cumsum(counts)
+        target = q / 100 * count
+        bucket = min(int(np.searchsorted(cumulative, target)), BUCKETS - 1)
+        before = cumulative[bucket] - counts[bucket]
+        fraction = (target - before) / counts[bucket] if counts[bucket] else 0.0
+        return min(_bucketValues[bucket] + fraction * _bucketWidths[bucket], float(self.rows[self.index[series], 0]))
+
+    def summary(self, series, scale=1e-3):
+        '''Count, mean, p50, p99 and max of a series, in microseconds for the timing series (scale=1 for depths).'''
+        row = self.rows[self.index[series]]
+        counts = row[_TOTALS:].astype(np.float64)
+        count = int(counts.sum())
+        if not count:
+            return {'count': 0}
+        mean = float(counts @ _bucketMiddles) / count  # Exact below 2 * SUB_COUNT, within a bucket's precision above
+        return {'count': count, 'mean': mean * scale, 'p50': self.percentile(series, 50) * scale,
+                'p99': self.percentile(series, 99) * scale, 'max': int(row[0]) * scale}
+
+    def p99(self, prefix=COMPONENT):
+        '''p99 in microseconds of every series of a kind, keyed by component or port name. Used by the canvas overlay.'''
+        latencies = {}
+        for series in self.series:
+            kind, key = series.split(':', 1)
+            if kind == prefix:
+                value = self.percentile(series, 99)
+                if value is not None:
+                    latencies[key] = value / 1e3
+        return latencies
+
+    def report(self):
+        '''The exportable report: per component call latency, per flow transfer time and queue depth.'''
+        report = {'components': {}, 'flows': {}}
+        for series in self.series:
+            kind, key = series.split(':', 1)
+            if kind == COMPONENT:
+                report['components'][key] = {f"{stat}_us" if stat != 'count' else stat: value
+                                             for stat, value in self.summary(series).items()}
+            elif kind == TRANSFER:
+                report['flows'].setdefault(key, {})['transfer'] = {f"{stat}_us" if stat != 'count' else stat: value
+                                                                  for stat, value in self.summary(series).items()}
+            elif kind == DEPTH:
+                report['flows'].setdefault(key, {})['depth'] = self.summary(series, scale=1)
+        return report
+
+    def close(self):
+        '''Detaches from the segment. The creator also removes it; attached readers keep their mapping until they close.'''
+        self.rows = None
+        if self._words is not None:
+            self._words.release()
+            self._words = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+        if self._owner:
+            _unlinkSegment(self.shm)
+            self._owner = False
+
+
+class TimedPush:
+    '''Stands in for a ring buffer or remote sender in the engine's publishing wrapper, timing every push.'''
+    __slots__ = ('push',)
+
+    def __init__(self, target, record, clock=time.perf_counter_ns):
+        push = target.push
+
+        def timedPush(value):
+            start = clock()
+            view = push(value)
+            record(clock() - start)
+            return view
+        self.push = timedPush
+
+
+def timedCall(call, record, clock=time.perf_counter_ns):
+    '''Wraps one of the engine's bound component calls so its latency is recorded.'''
+    def timed():
+        start = clock()
+        call()
+        record(clock() - start)
+    return timed
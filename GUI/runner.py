@@ -0,0 +1,245 @@
+# Runs a component-flow graph without the GUI.
+# createGraph.runNeuroweaver dumps the current graph to GUI/temp.json and starts this file as `python3 -m GUI.runner`.
+# It can also run a saved graph folder directly, e.g.:
+#     python3 -m GUI.runner --graph GUI/test_save1 --iterations 10000
+# Compiled execution plans are cached in GUI/plans/ (see GUI/planCache.py): an unchanged graph is neither validated
+# nor compiled again, and a cached plan can be run on its own with --plan.
+# --record writes the flow data under the configured Save Path and --replay feeds such a recording back into the
+# graph (see GUI/flowRecording.py), e.g. to train learning components offline on a real session:
+#     python3 -m GUI.runner --replay recordings/20240611-101500-1a2b3c4d --replay-speed 0
+# --copies and --variants run many copies of the graph in lock-step in this process (see GUI/vectorEngine.py).
+
+import argparse
+import json
+import time
+
+from GUI.graphEngine import ExecutionPlan, GraphEngine, loadCatalog, loadGraph
+from GUI.graphValidation import validateGraph
+from GUI.parallelScheduler import PARTITION_MODES, ParallelScheduler, parseAffinity
+from GUI.planCache import cachedPlanPath, loadPlan, savePlan
+from GUI.tickScheduler import POLICIES, TickScheduler, tickSettings
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Run a Neuroweaver graph headless.")
+    parser.add_argument('--temp', help="Run data written by the GUI (config, components and flows), GUI/temp.json by default.")
+    parser.add_argument('--graph', help="Folder containing nodes.json and flows.json. Overrides --temp.")
+    parser.add_argument('--config', default="GUI/config.json", help="Configuration used together with --graph.")
+    parser.add_argument('--iterations', type=int, help="Overrides the Iterations entry of the configuration.")
+    parser.add_argument('--shared-buffers', action='store_true', help="Carry flow data in shared-memory ring buffers.")
+    parser.add_argument('--slots', type=int, default=4, help="Slots per flow ring buffer.")
+    parser.add_argument('--run-id', help="Names the shared memory segments of this run (see GUI/cleanup.py).")
+    parser.add_argument('--components', help="Comma separated components to run on this machine; remote flows connect the rest.")
+    parser.add_argument('--parallel', choices=PARTITION_MODES, help="Run each component (or each linear branch) in its own process.")
+    parser.add_argument('--affinity', help='CPU pinning for --parallel: "auto" or "component=cpu[,cpu];component=cpu".')
+    parser.add_argument('--skip-validation', action='store_true', help="Do not validate shapes, flows and cycles before running. The plan is then not cached.")
+    parser.add_argument('--plan', help="Runs a cached execution plan (GUI/plans/<hash>.plan). --temp or --graph, if given, is compiled instead when the plan cannot be loaded.")
+    parser.add_argument('--no-plan-cache', action='store_true', help="Always compile the graph, without reading or writing GUI/plans/.")
+    parser.add_argument('--profile', action='store_true', help="Record per-component and per-flow latency histograms (GUI/runProfile.py).")
+    parser.add_argument('--profile-report', help="Writes the profile report to this JSON file. Implies --profile.")
+    parser.add_argument('--profile-segment', help="Records into existing profile histograms, e.g. created by the graph editor. Implies --profile.")
+    parser.add_argument('--tick-rate', type=float, help="Steps the graph at this rate in Hz (overrides Tick Rate, 0 runs as fast as possible).")
+    parser.add_argument('--overrun-policy', choices=POLICIES, help="What a late tick does: skip, catchup or degrade (overrides Overrun Policy).")
+    parser.add_argument('--record', nargs='?', const='all', help='Records every flow, or the "component.port,..." listed, under the configured Save Path.')
+    parser.add_argument('--replay', help="Feeds a recording back into the graph, which is the recorded graph unless --graph, --temp or --plan is given.")
+    parser.add_argument('--replay-speed', type=float, default=1.0, help="Replay pace relative to the recording, 0 runs as fast as possible.")
+    parser.add_argument('--replay-components', help="Comma separated components to replay, by default the recorded source components.")
+    parser.add_argument('--copies', type=int, help="Runs this many copies of the graph in lock-step, batching the vectorized components.")
+    parser.add_argument('--variants', help="JSON list of per-copy parameter overrides, {component: {parameter: value}}; one copy each by default.")
+    return parser.parse_args(argv)
+
+
+def loadRunData(args):
+    '''Returns (config, components, flows) from either a saved graph folder or the GUI temp file.'''
+    if args.graph:
+        components, flows = loadGraph(args.graph)
+        with open(args.config, 'r') as file:
+            config = json.load(file)
+        return config, components, flows
+    if args.replay and not args.temp:
+        from GUI.flowRecording import Recording
+        recording = Recording(args.replay)
+        return recording.config, recording.components, recording.flows
+    with open(args.temp or "GUI/temp.json", 'r') as file:
+        runData = json.load(file)
+    return runData['config'], runData['components'], runData['flows']
+
+
+def validate(args, config, components, flows):
+    '''Prints the validation report of the graph and exits if it cannot run.'''
+    if args.skip_validation:
+        return
+    report = validateGraph(components, flows, config)
+    for issue in report.issues:
+        print(issue)
+    print(report.summary(max(args.slots, 2) if args.parallel else args.slots, bool(args.parallel)))
+    if not report.ok:
+        raise SystemExit(f"The graph is not valid: {len(report.errors)} errors")
+
+
+def compilePlan(args, config, components, flows, localComponents):
+    '''Returns the execution plan of the graph, from the plan cache when the same graph and configuration ran before.
+    Plans compiled with --skip-validation are not cached, since cached plans run without validation.'''
+    start = time.perf_counter()
+    catalog = loadCatalog()
+    path = None
+    if not args.no_plan_cache and not args.skip_validation:
+        path = cachedPlanPath(components, flows, config, catalog, localComponents)
+        plan = loadPlan(path)
+        if plan is not None:
+            print(f"Using cached plan {path} ({(time.perf_counter() - start) * 1e3:.1f} ms)")
+            return plan
+    validate(args, config, components, flows)  # Cached plans were validated when they were compiled
+    plan = ExecutionPlan(components, flows, config, catalog, localComponents)
+    if path is not None and savePlan(plan, path):
+        print(f"Compiled and cached plan {path} ({(time.perf_counter() - start) * 1e3:.1f} ms)")
+    return plan
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    vectorized = bool(args.copies or args.variants)
+    if vectorized and (args.parallel or args.shared_buffers or args.record or args.replay or args.components):
+        raise SystemExit("--copies and --variants cannot be combined with --parallel, --shared-buffers, --record, --replay or --components")
+    if args.plan and args.parallel:
+        raise SystemExit("--plan runs the graph in a single process and cannot be combined with --parallel")
+    plan = loadPlan(args.plan) if args.plan else None
+    if args.plan and plan is None:
+        if not (args.temp or args.graph):
+            raise SystemExit(f"Cannot load the execution plan {args.plan}")
+        print(f"Cannot load the execution plan {args.plan}, compiling the graph instead")
+    if plan is None:
+        config, components, flows = loadRunData(args)
+        if args.parallel:
+            if args.record or args.replay:
+                raise SystemExit("--record and --replay run the graph in a single process and cannot be combined with --parallel")
+            if args.tick_rate or float(config.get('Tick Rate') or 0):
+                print("The tick rate is ignored with --parallel, the processes run as fast as their flows allow")
+            validate(args, config, components, flows)
+            return runParallel(args, config, components, flows)
+        localComponents = [name.strip() for name in args.components.split(',')] if args.components else None
+        plan = compilePlan(args, config, components, flows, localComponents)
+    profile = None
+    if args.profile_segment:
+        from GUI.runProfile import ProfileHistograms
+        profile = ProfileHistograms.attach(args.profile_segment)
+    elif args.profile or args.profile_report:
+        from GUI.ringBuffer import newRunId
+        from GUI.runProfile import ProfileHistograms, profileSeries
+        args.run_id = args.run_id or newRunId()
+        profile = ProfileHistograms(profileSeries(plan.order, plan.flows), runId=args.run_id)
+    recorder = None
+    try:
+        rate, policy = tickSettings(plan.config, args.tick_rate, args.overrun_policy)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    try:
+        recorder, replay = openRecording(args, plan)
+        if vectorized:
+            engine = openVectorEngine(args, plan, profile)
+        else:
+            engine = GraphEngine.fromPlan(plan, sharedBuffers=args.shared_buffers, slots=args.slots, runId=args.run_id,
+                                          profile=profile, recorder=recorder, replay=replay)
+    except Exception:
+        if profile is not None:
+            profile.close()
+        if recorder is not None:
+            recorder.close()
+        raise
+    iterations = args.iterations or engine.iterations
+    if replay is not None:
+        iterations = min(args.iterations or replay.length, replay.length)  # The whole recording by default
+    copies = f" of {engine.copies} copies" if vectorized else ""
+    print(f"Running {len(engine.order)} components{copies} for {iterations} iterations: {' -> '.join(engine.order)}")
+    if rate:
+        print(f"Ticking at {rate:g} Hz, {policy} on overrun" + (" (the tick rate paces the replay)" if replay is not None else ""))
+    try:
+        report = TickScheduler(engine, rate, policy).run(iterations) if rate else engine.run(iterations)
+    finally:
+        engine.close()
+        if profile is not None:
+            writeProfile(args, profile.report())
+            profile.close()
+        if recorder is not None:
+            closeRecording(recorder)
+    print(json.dumps(report, indent=4))
+    return report
+
+
+def openRecording(args, plan):
+    '''Returns the FlowRecorder and FlowReplay requested by --record and --replay, None for those not requested.'''
+    recorder = replay = None
+    try:
+        if args.replay:
+            from GUI.flowRecording import FlowReplay, Recording
+            replayed = [name.strip() for name in args.replay_components.split(',')] if args.replay_components else None
+            replay = FlowReplay(Recording(args.replay), plan.components, plan.flows, plan.config, replayed, args.replay_speed,
+                                plan.periods)
+            pace = f"{args.replay_speed:g}x speed" if args.replay_speed > 0 else "full speed"
+            print(f"Replaying {', '.join(sorted(replay.components))} from {args.replay}: {replay.length} iterations at {pace}")
+            if replay.dropped:
+                print(f"Warning: {replay.dropped} items were dropped while recording, replayed ports may be out of step")
+        if args.record:
+            from GUI.flowRecording import FlowRecorder, parsePortList, publishedPorts, recordingDirectory
+            from GUI.ringBuffer import newRunId
+            args.run_id = args.run_id or newRunId()
+            if args.record == 'all':
+                ports = [key for key in publishedPorts(plan.components, plan.flows) if key[0] in plan.order]
+            else:
+                ports = parsePortList(args.record)
+            recorder = FlowRecorder(recordingDirectory(plan.config, args.run_id), plan.components, plan.flows, plan.config, ports)
+            print(f"Recording {len(recorder.ports)} flows to {recorder.directory}")
+    except (ValueError, OSError) as e:
+        raise SystemExit(f"Cannot {'replay' if args.replay and replay is None else 'record'}: {e}")
+    return recorder, replay
+
+
+def openVectorEngine(args, plan, profile):
+    '''Builds the VectorEngine requested by --copies and --variants.'''
+    from GUI.vectorEngine import VectorEngine, loadVariants
+    try:
+        variants = loadVariants(args.variants) if args.variants else None
+        return VectorEngine.fromPlan(plan, copies=args.copies, variants=variants, profile=profile)
+    except (ValueError, OSError) as e:
+        raise SystemExit(f"Cannot run the copies: {e}")
+
+
+def closeRecording(recorder):
+    '''Completes a recording and prints what was written.'''
+    counts = recorder.close()
+    items = sum(written for written, dropped in counts.values())
+    dropped = sum(dropped for written, dropped in counts.values())
+    print(f"Recorded {items} items of {len(counts)} flows to {recorder.directory}" + (f", {dropped} dropped" if dropped else ""))
+
+
+def writeProfile(args, profile, top=10):
+    '''Prints the components with the highest p99 latency and exports the full profile report if requested.'''
+    slowest = sorted(profile['components'].items(), key=lambda item: item[1].get('p99_us', 0.0), reverse=True)[:top]
+    print("Slowest components by p99 latency:")
+    for name, stats in slowest:
+        if stats['count']:
+            print(f"  {stats['p99_us']:10.1f} us p99  {stats['mean_us']:10.1f} us mean  {name}")
+    if args.profile_report:
+        with open(args.profile_report, 'w') as file:
+            json.dump(profile, file, indent=4)
+        print(f"Profile report written to {args.profile_report}")
+
+
+def runParallel(args, config, components, flows):
+    scheduler = ParallelScheduler(components, flows, config, mode=args.parallel, affinity=parseAffinity(args.affinity),
+                                  slots=max(args.slots, 2), runId=args.run_id, profile=bool(args.profile or args.profile_report))
+    print(f"Running {len(scheduler.order)} components in {len(scheduler.groups)} processes for {args.iterations or scheduler.iterations} iterations")
+    try:
+        report = scheduler.run(args.iterations)
+        if scheduler.profile is not None:
+            writeProfile(args, scheduler.profile.report())
+    finally:
+        scheduler.closeProfile()
+    print(json.dumps(report, indent=4))
+    if 'bottleneck' in report:
+        print(f"Bottleneck: {report['bottleneck']} ({report['components'][report['bottleneck']]['utilisation']:.0%} busy)")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+# Live plot of the data streaming through a flow.
+# Clicking a flow's edge in the graph editor during a run opens a SignalMonitor on the ring buffer its producer port
+# publishes into ("nw_<run id>_<index>", see flowSegmentNames() in GUI/ringBuffer.py). The monitor attaches to the
+# segment read-only: it has no reader cursor, so the producer never waits for it however slow the GUI is, and it only
+# ever looks at the most recently published slots, never at one the producer may be writing.
+#
+# Every frame (FPS per second) the monitor reduces what it reads to a min/max envelope as wide as the plot is in
+# pixels, directly from shared memory, so a (3, 4096) rollout costs the GUI 3 lines of about 2 * 800 points rather
+# than a copy of every sample, and no peak a full-rate plot would show is lost:
+#   - values with at least SNAPSHOT_SAMPLES along their last axis (rollouts, spectra, images rows) are shown as the
+#     latest value, one line per row
+#   - smaller values (scalars, joint positions) are appended to a scrolling history of HISTORY items, one line per
+#     element. Items published faster than the slots of the ring can hold between two frames are skipped.
+# Lines are redrawn by blitting over a cached background; the axes are only redrawn when the data leaves the y range.
+# matplotlib is imported when the first monitor opens.
+
+import time
+
+import numpy as np
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import QLabel, QVBoxLayout, QWidget
+
+from GUI.ringBuffer import SharedRingBuffer
+
+FPS = 30
+HISTORY = 2000  # Items kept by the scrolling history of small values
+SNAPSHOT_SAMPLES = 256  # Values at least this long along their last axis are plotted as a whole
+MAX_LINES = 16  # Rows or elements plotted, the rest of a value is left out
+
+
+def minMaxDecimate(values, bins):
+    '''Min/max envelope of the rows of a (lines, samples) array in `bins` near-equal bins along the samples.
+    Returns x (2 * bins,) and y (lines, 2 * bins), alternating the minimum and maximum of each bin. Arrays of at most
+    2 * bins samples are returned as they are.'''
+    samples = values.shape[1]
+    if samples <= 2 * bins:
+        return np.arange(samples, dtype=np.float64), np.array(values, dtype=np.float64)
+    starts = np.linspace(0, samples, bins + 1).astype(np.intp)
+    # reduceat reads each sample once, straight from the (shared memory) view
+    mins = np.minimum.reduceat(values, starts[:-1], axis=1)
+    maxs = np.maximum.reduceat(values, starts[:-1], axis=1)
+    y = np.empty((values.shape[0], bins, 2))
+    y[:, :, 0] = mins
+    y[:, :, 1] = maxs
+    x = np.repeat((starts[:-1] + starts[1:] - 1) / 2, 2)
+    return x, y.reshape(values.shape[0], 2 * bins)
+
+
+class SignalMonitor(QWidget):
+    '''Window plotting the live values of one flow buffer.'''
+    def __init__(self, segmentName, title, parent=None, fps=FPS):
+        super().__init__(parent, Qt.Window)
+        from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
+        from matplotlib.figure import Figure
+        self.segmentName = segmentName
+        self.ring = None
+        self.seen = 0  # Items already appended to the history
+        self.history = None  # (lines, HISTORY) scrolling history of small values, oldest first
+        self.background = None  # Axes without the lines, captured after every full draw
+        self.lines = []
+        self.frameTime = 0.0  # Smoothed seconds spent on a frame
+        self.setWindowTitle(f"Monitor: {title}")
+        self.resize(640, 360)
+
+        self.figure = Figure(tight_layout=True)
+        self.canvas = FigureCanvasQTAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.axes.grid(True, alpha=0.3)
+        self.canvas.mpl_connect('draw_event', self.captureBackground)
+        self.status = QLabel("Waiting for the run to publish this flow")
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.canvas)
+        layout.addWidget(self.status)
+
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setInterval(1000 // fps)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+
+    def attach(self):
+        '''Opens the flow buffer once the runner has created it. Returns False while it does not exist yet.'''
+        try:
+            self.ring = SharedRingBuffer.attach(self.segmentName)
+        except (FileNotFoundError, ValueError):
+            return False  # Not created, or the header is not written yet
+        shape = self.ring.shape
+        self.snapshot = len(shape) > 0 and shape[-1] >= SNAPSHOT_SAMPLES
+        rows = int(np.prod(shape[:-1], dtype=np.int64)) if self.snapshot else int(np.prod(shape, dtype=np.int64))
+        self.lineCount = min(rows, MAX_LINES)
+        self.seen = self.ring.head
+        if self.snapshot:
+            self.axes.set_xlim(0, shape[-1] - 1)
+            self.axes.set_xlabel("sample")
+        else:
+            self.history = np.full((self.lineCount, HISTORY), np.nan)
+            self.axes.set_xlim(-HISTORY + 1, 0)
+            self.axes.set_xlabel("items ago")
+        self.lines = [self.axes.plot([], [], linewidth=1, animated=True)[0] for _ in range(self.lineCount)]
+        self.axes.set_title(f"{self.ring.shape} {self.ring.dtype}" + (f", first {MAX_LINES} of {rows}" if rows > MAX_LINES else ""))
+        self.canvas.draw()
+        return True
+
+    def read(self):
+        '''Returns (x, y) to plot from the latest published items, or None if there is nothing new.'''
+        ring = self.ring
+        head = ring.head
+        if head == self.seen:
+            return None
+        if self.snapshot:
+            value = ring.read(head - 1)
+            x, y = minMaxDecimate(value.reshape(-1, value.shape[-1])[:self.lineCount], max(int(self.axes.bbox.width), 1))
+            if ring.head - (head - 1) >= ring.slots:
+                return None  # The producer lapped the slot while it was read, show the next one instead
+            self.seen = head
+            return x, y
+        # Every item still held by the ring except the oldest slot, which the producer writes next
+        first = max(self.seen, head - ring.slots + 1)
+        self.seen = head
+        if first < head:
+            items = np.array([ring.read(sequence).reshape(-1)[:self.lineCount] for sequence in range(first, head)]).T
+            items = items[:, max(ring.head - ring.slots + 1 - first, 0):]  # Drops items lapped while they were copied
+            count = items.shape[1]
+            if count:
+                self.history[:, :-count] = self.history[:, count:]
+                self.history[:, -count:] = items
+        x, y = minMaxDecimate(self.history, max(int(self.axes.bbox.width), 1))
+        return x - (HISTORY - 1), y
+
+    def refresh(self):
+        '''Timer tick: reads the flow and redraws the lines.'''
+        if self.ring is None and not self.attach():
+            return
+        start = time.perf_counter()
+        data = self.read()
+        if data is None:
+            return
+        x, y = data
+        for line, values in zip(self.lines, y):
+            line.set_data(x, values)
+        redraw = self.background is None
+        finite = y[np.isfinite(y)]
+        if finite.size:
+            low, high = self.axes.get_ylim()
+            top, bottom = float(finite.max()), float(finite.min())
+            # Rescale when the data leaves the range or shrinks to a small part of it, which needs a full redraw
+            margin = max((top - bottom) * 0.1, abs(top) * 1e-3, 1e-9)
+            if bottom < low or top > high or (top - bottom + 2 * margin) < 0.25 * (high - low):
+                self.axes.set_ylim(bottom - margin, top + margin)
+                redraw = True
+        if redraw:
+            self.canvas.draw()  # captureBackground() caches the new axes and draws the lines
+        else:
+            self.canvas.restore_region(self.background)
+            for line in self.lines:
+                self.axes.draw_artist(line)
+            self.canvas.blit(self.axes.bbox)
+        self.frameTime = 0.9 * self.frameTime + 0.1 * (time.perf_counter() - start)
+        self.status.setText(f"item {self.seen}, {self.frameTime * 1e3:.1f} ms per frame")
+
+    def captureBackground(self, event):
+        '''After a full draw (resize, rescale), caches the axes without the lines and draws the lines on top.'''
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        for line in self.lines:
+            self.axes.draw_artist(line)
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        if self.ring is not None:
+            self.ring.close()  # Only detaches, the runner owns the segment
+            self.ring = None
+        super().closeEvent(event)
@@ -0,0 +1,55 @@
+# Start-up profiling for `python3 guiMain.py --profile-startup`.
+# StartupProfile wraps the import statement to time every module imported while it is installed (inclusive time, and
+# self time excluding the modules it imported in turn), and records named phases such as "main window shown". The
+# report lists the phases and the slowest imports, so a module that made start-up slow again is easy to spot.
+# Only the standard library is used here, so installing the profile does not itself pull anything in.
+
+import builtins
+import sys
+import time
+
+
+class StartupProfile:
+    '''Times imports and start-up phases from the moment it is created.'''
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []  # (label, seconds since start)
+        self.imports = {}  # module name -> [inclusive seconds, self seconds, nesting depth]
+        self._children = [0.0]  # Import time of the nested imports of every import in progress
+        self._original = builtins.__import__
+        builtins.__import__ = self._import
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        depth = len(self._children) - 1
+        self._children.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._children.pop()
+            self._children[-1] += elapsed
+            if name not in self.imports:
+                self.imports[name] = [elapsed, elapsed - nested, depth]
+
+    def mark(self, label):
+        '''Records that a start-up phase has been reached.'''
+        self.phases.append((label, time.perf_counter() - self.start))
+
+    def stop(self):
+        builtins.__import__ = self._original
+
+    def report(self, top=20, file=None):
+        '''Prints the phases and the `top` slowest imports.'''
+        file = file or sys.stderr
+        self.stop()
+        print("Start-up phases (ms since start):", file=file)
+        for label, seconds in self.phases:
+            print(f"  {seconds * 1e3:9.1f}  {label}", file=file)
+        total = sum(inclusive for inclusive, _, depth in self.imports.values() if depth == 0)
+        print(f"Imports: {len(self.imports)} modules, {total * 1e3:.1f} ms. Slowest (inclusive / self ms):", file=file)
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        for name, (inclusive, own, depth) in slowest:
+            print(f"  {inclusive * 1e3:9.1f} {own * 1e3:9.1f}  {'  ' * depth}{name}", file=file)
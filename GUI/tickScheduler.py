@@ -0,0 +1,167 @@
+# Real-time tick scheduler for the graph engine.
+# With a "Tick Rate" in the configuration (Hz, or --tick-rate for the runner) the graph is stepped on a fixed grid of
+# deadlines, start + tick / rate, instead of as fast as possible. Deadlines are absolute, so a late tick never shifts
+# the ticks after it and the schedule does not drift over a long session. The scheduler sleeps until shortly before
+# each deadline and spins for the last SPIN_NS, since sleeping alone overshoots by tens of microseconds.
+#
+# A component type's iterationAddition (GUI/components.json) offsets its start-up: it is first called at that tick,
+# and then for Iterations ticks like every other component, so the run lasts Iterations plus the largest offset ticks.
+# This lets a consumer start once its producer has filled a window, and keep draining it after the producer stops.
+# A component with a period (see GUI/graphEngine.py) runs on the last tick of every period counted from its start.
+#
+# Every tick records how late it started (jitter) and how long it ran. A tick still running at the next deadline is
+# an overrun, handled by the "Overrun Policy":
+#   skip     the ticks whose deadline has passed are dropped and the graph resumes on the grid (default)
+#   catchup  the late ticks run back to back until the schedule is met again, no tick is lost
+#   degrade  late ticks catch up, and while the backlog keeps growing (ticks start a period late or more, later each
+#            time) the component costing the most per tick is run every other tick, then every fourth, ... Sources
+#            and sinks (components without inputs or consumers, e.g. acquisition and stimulation) are never degraded.
+#            After RECOVER_TICKS ticks on time the most recent degradation is undone.
+
+import time
+
+import numpy as np
+
+SKIP = 'skip'
+CATCHUP = 'catchup'
+DEGRADE = 'degrade'
+POLICIES = (SKIP, CATCHUP, DEGRADE)
+SPIN_NS = 200_000  # Wait before a deadline that is spent spinning instead of sleeping
+RECOVER_TICKS = 1000  # Ticks on time before a degraded component runs twice as often again
+MAX_DIVISOR = 64  # A degraded component runs at least every MAX_DIVISOR ticks
+
+
+def tickSettings(config, rate=None, policy=None):
+    '''Tick rate (Hz, 0 when free-running) and overrun policy from the configuration, overridden by the arguments.'''
+    rate = float(config.get('Tick Rate') or 0) if rate is None else rate
+    policy = (config.get('Overrun Policy') or SKIP) if policy is None else policy
+    if rate < 0:
+        raise ValueError(f"Tick Rate must not be negative, got {rate}")
+    if policy not in POLICIES:
+        raise ValueError(f"Overrun Policy must be one of {', '.join(POLICIES)}, got {policy!r}")
+    return rate, policy
+
+
+def _waitUntil(deadline, clock=time.perf_counter_ns):
+    remaining = deadline - clock()
+    if remaining > SPIN_NS:
+        time.sleep((remaining - SPIN_NS) / 1e9)
+    while clock() < deadline:
+        pass
+
+
+class TickScheduler:
+    '''Steps a built GraphEngine at a fixed rate, see the notes above.'''
+    def __init__(self, engine, rate, policy=SKIP):
+        if rate <= 0:
+            raise ValueError("The tick scheduler needs a positive tick rate")
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overrun policy {policy!r}")
+        self.engine = engine
+        self.rate = rate
+        self.policy = policy
+        self.period = int(round(1e9 / rate))
+        self.offsets = [engine.plan.startOffsets.get(name, 0) for name, calls in engine.componentCalls]
+        self.periods = [engine.plan.periods.get(name, 1) for name, calls in engine.componentCalls]
+        fed = {end for output, start, pipe, end in (flow[:4] for flow in engine.flows)}
+        feeding = {start for output, start, pipe, end in (flow[:4] for flow in engine.flows)}
+        # Acquisition and stimulation keep their timing, only the processing between them is degraded
+        self.degradable = [name in fed and name in feeding for name, calls in engine.componentCalls]
+        self.divisors = [1] * len(engine.componentCalls)
+        self.degraded = []  # Indices of the components degraded so far, most recent last
+        self.report = None
+
+    def run(self, iterations=None):
+        '''Runs every component for `iterations` ticks (config["Iterations"] by default) and returns the timing report.'''
+        iterations = self.engine.iterations if iterations is None else iterations
+        components = self.engine.componentCalls
+        ticks = iterations + max(self.offsets, default=0)
+        lateness = np.zeros(ticks, dtype=np.int64)  # ns between a tick's deadline and its start
+        durations = np.zeros(ticks, dtype=np.int64)
+        executed = np.zeros(ticks, dtype=bool)
+        costs = [0.0] * len(components)  # Moving average of each component's call time, for degrade
+        timed = self.policy == DEGRADE
+        period = self.period
+        clock = time.perf_counter_ns
+        overruns = 0
+        onTime = 0
+        late = 0
+        degradedAt = 0  # Lateness when a component was last degraded
+        start = clock() + period  # The first deadline leaves the setup a tick
+        tick = 0
+        while tick < ticks:
+            deadline = start + tick * period
+            if clock() < deadline:
+                _waitUntil(deadline, clock)
+            begin = clock()
+            for index, (name, calls) in enumerate(components):
+                step = tick - self.offsets[index]
+                every = self.periods[index]
+                if 0 <= step < iterations and step % (every * self.divisors[index]) == every - 1:
+                    if timed:
+                        callStart = clock()
+                        for call in calls:
+                            call()
+                        costs[index] += 0.05 * (clock() - callStart - costs[index])
+                    else:
+                        for call in calls:
+                            call()
+            end = clock()
+            previousLate, late = late, begin - deadline
+            lateness[tick] = late
+            durations[tick] = end - begin
+            executed[tick] = True
+            tick += 1
+            if end <= start + tick * period:
+                onTime += 1
+                if self.degraded and onTime >= RECOVER_TICKS:
+                    self.divisors[self.degraded.pop()] //= 2
+                    onTime = degradedAt = 0
+                continue
+            overruns += 1
+            onTime = 0
+            if self.policy == SKIP:
+                tick = min(-(-(end - start) // period), ticks)  # The first tick whose deadline is still ahead
+            elif self.policy == DEGRADE and late > previousLate >= period and late >= degradedAt + period:
+                # Already a period behind and falling further behind, by a period more than at the last degradation:
+                # the load does not fit the period on average. A single slow tick only causes a backlog that shrinks
+                if self.degrade(costs):
+                    degradedAt = late
+        self.report = self.summarise(lateness, durations, executed, overruns)
+        return self.report
+
+    def degrade(self, costs):
+        '''Halves the rate of the degradable component costing the most per tick. Returns False if none is left.'''
+        candidates = [(costs[index] / divisor, index) for index, divisor in enumerate(self.divisors)
+                      if self.degradable[index] and divisor < MAX_DIVISOR]
+        if not candidates:
+            return False
+        cost, index = max(candidates)
+        self.divisors[index] *= 2
+        self.degraded.append(index)
+        return True
+
+    def summarise(self, lateness, durations, executed, overruns):
+        '''Timing report of a run in microseconds, in the form of GraphEngine.report() plus the tick statistics.'''
+        late = lateness[executed] / 1e3
+        busy = durations[executed] / 1e3
+        self.engine.latencies = durations[executed]
+        report = self.engine.report()
+        report.update({
+            'tick_rate_hz': self.rate,
+            'period_us': self.period / 1e3,
+            'policy': self.policy,
+            'ticks': int(len(executed)),
+            'executed': int(executed.sum()),
+            'skipped': int(len(executed) - executed.sum()),
+            'overruns': overruns,
+            'lateness_p50_us': float(np.percentile(late, 50)) if len(late) else 0.0,
+            'lateness_p99_us': float(np.percentile(late, 99)) if len(late) else 0.0,
+            'lateness_max_us': float(late.max()) if len(late) else 0.0,
+            'jitter_us': float(late.std()) if len(late) else 0.0,
+            'budget_used_p99': float(np.percentile(busy, 99) / (self.period / 1e3)) if len(busy) else 0.0,
+        })
+        degraded = {name: divisor for (name, calls), divisor in zip(self.engine.componentCalls, self.divisors) if divisor > 1}
+        if degraded:
+            report['degraded'] = degraded  # Components still running every n-th tick at the end of the run
+        return report
@@ -0,0 +1,104 @@
+# Vectorized execution of many copies of one graph in a single process.
+# Experiments often run the same graph for many subjects or parameter settings. Instead of starting N runs, a
+# VectorEngine instantiates the graph N times and steps all copies in lock-step: every port value gets a leading axis
+# of length N (copy i is row i) and each component is called once per iteration for all copies.
+#
+# Component types opt in with "vectorized": true in the catalog (GUI/components.json). Such a function is called once
+# with the batched values, (N,) + declared shape for every input and state port, and returns batched values the same
+# way. Any other component is called once per copy on that copy's row of every input, and its results are written into
+# the rows of its outputs in place. So a graph mixing both kinds runs unchanged and gets faster as its components opt in.
+#
+# Copies can differ in their component parameters. A variants file lists, per copy, the parameters that differ:
+#     [{"Filter": {"cutoff": "10"}}, {"Filter": {"cutoff": "20"}}, {"Filter": {"cutoff": "40"}}]
+# A component with parameters that differ between copies is called once per copy even when it is vectorized.
+#     python3 -m GUI.runner --graph GUI/test_save1 --variants sweep.json
+#     python3 -m GUI.runner --graph GUI/test_save1 --copies 32
+# Component periods and windowed flows work as in GraphEngine, with the window along the axis after the copies. Flows
+# are not published to shared memory, remote machines or recordings in a vectorized run.
+
+import json
+from functools import partial
+
+from GUI.graphEngine import GraphEngine, componentKwargs, loadCatalog
+
+
+def loadVariants(path):
+    '''Reads a variants file: a list with one {component name: {parameter: value}} dictionary per copy.'''
+    with open(path, 'r') as file:
+        variants = json.load(file)
+    if not isinstance(variants, list) or not all(isinstance(variant, dict) for variant in variants):
+        raise ValueError(f"{path} must contain a list of {{component: {{parameter: value}}}} dictionaries, one per copy")
+    return variants
+
+
+def _bindPerCopy(fns, inSlots, outSlots, values, rings):
+    '''Builds the call of a component that is not vectorized: fns[i] runs on row i of every batched input and its results
+    are written into row i of the batched outputs, which are then published as a whole.'''
+    single = len(outSlots) == 1
+    published = [(o, ring) for o, ring in zip(outSlots, rings) if ring is not None]
+
+    def call():
+        inputs = [values[i] for i in inSlots]
+        outputs = [values[o] for o in outSlots]
+        for copy, fn in enumerate(fns):
+            result = fn(*[value[copy] for value in inputs])
+            if single:
+                outputs[0][copy] = result
+            elif outputs:
+                for output, value in zip(outputs, result):
+                    output[copy] = value
+        for o, ring in published:
+            ring.push(values[o])
+    return call
+
+
+class VectorEngine(GraphEngine):
+    '''Runs `copies` copies of a graph in lock-step, see the notes above. value() returns the values of all copies.'''
+    def __init__(self, components, flows, config, copies=None, catalog=None, variants=None, plan=None, profile=None):
+        variants = list(variants or [])
+        copies = copies or len(variants)
+        if copies < 1:
+            raise ValueError("A vectorized run needs at least one copy")
+        if len(variants) > copies:
+            raise ValueError(f"{len(variants)} variants given for {copies} copies")
+        self.copies = copies
+        self.variants = variants + [{}] * (copies - len(variants))
+        self.catalog = catalog if catalog is not None else loadCatalog()
+        super().__init__(components, flows, config, self.catalog, plan=plan, profile=profile)
+
+    def build(self):
+        if self.plan.remoteFlows:
+            raise ValueError("Remote flows are not supported in a vectorized run")
+        for index, variant in enumerate(self.variants):
+            unknown = [name for name in variant if name not in self.plan.order]
+            if unknown:
+                raise ValueError(f"Variant {index} names unknown components: {', '.join(unknown)}")
+        super().build()
+
+    def allocate(self):
+        return self.plan.allocate(self.copies)
+
+    def bindComponent(self, name, fn, inSlots, outSlots, rings):
+        '''One batched call when the component is vectorized and its parameters are the same for every copy, otherwise
+        one call per copy.'''
+        info = self.components[name]
+        spec = self.catalog[info['Component']]
+        overrides = [variant.get(name) for variant in self.variants]
+        if spec.get('vectorized', False) and not any(overrides):
+            return super().bindComponent(name, fn, inSlots, outSlots, rings)
+        fns = []
+        for override in overrides:
+            if override:
+                kwargs = componentKwargs(dict(info, parameters=dict(info.get('parameters', {}), **override)), spec, self.config)
+                fns.append(partial(self.functions[name], **kwargs))
+            else:
+                fns.append(fn)
+        return _bindPerCopy(fns, inSlots, outSlots, self.values, rings)
+
+    def report(self):
+        '''GraphEngine.report() plus the number of copies and the iterations run per second summed over the copies.'''
+        report = super().report()
+        if report:
+            report['copies'] = self.copies
+            report['copy_iterations_per_s'] = report['iterations'] * self.copies / report['total_s'] if report['total_s'] else 0.0
+        return report
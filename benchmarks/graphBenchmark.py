@@ -0,0 +1,188 @@
+# Benchmarks graph building, loading, saving, painting and execution on synthetic graphs.
+# Graphs of each requested size (nodes, with as many flows) are generated from the dummy components, then the GUI
+# paths are timed under the offscreen Qt platform and the engine is run headless. Results are written as JSON so
+# they can be compared across versions:
+#     python3 -m benchmarks.graphBenchmark --sizes 10,100,1000,10000 --output bench_results.json
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QT_VERSION_STR
+from PyQt5.QtWidgets import QApplication
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+
+
+def synthesizeGraph(size):
+    '''Builds a chain of `size` dummy components alternating between the two dummy types, with size - 1 flows.'''
+    components = {}
+    flows = []
+    for index in range(size):
+        name = f"component {index}"
+        if index % 2 == 0:
+            components[name] = {'Component': 'dummyComponent1', 'Name': name, 'parameters': {},
+                                'inputs': {'dummy1': ["(1,)"]}, 'outputs': {'dummy2': ["(1,)"]}, 'state': {}}
+        else:
+            components[name] = {'Component': 'dummyComponent2', 'Name': name, 'parameters': {},
+                                'inputs': {'dummy2': ["(1,)"]}, 'outputs': {'dummy3': ["(1,)"]}, 'state': {}}
+        if index:
+            previous = f"component {index - 1}"
+            if index % 2:
+                flows.append(["dummy2", previous, "dummy2", name])
+            else:
+                flows.append(["dummy3", previous, "dummy1", name])
+    return components, flows
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def entry(seconds, items):
+    return {'total_s': seconds, 'per_item_us': seconds / items * 1e6 if items else 0.0, 'items': items}
+
+
+def gitRevision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmarkGui(app, window, size, components, flows, folder, paints):
+    '''Times MainWindow.loadFolder and the createGraph paths on one synthetic graph.'''
+    from GUI.createGraph import createGraph
+
+    timings = {}
+    seconds, _ = timed(window.loadFolder, folder)
+    app.processEvents()
+    timings['load'] = entry(seconds, size)
+    window.graph.close()
+    window.graph.deleteLater()
+    app.processEvents()
+
+    graph = createGraph({'x': 0, 'y': 0, 'h': 600, 'config': window.config})
+    graph.show()
+    start = time.perf_counter()
+    for componentInfo in components.values():
+        graph.addNodeGUI(componentInfo)
+    timings['addNodeGUI'] = entry(time.perf_counter() - start, size)
+
+    start = time.perf_counter()
+    for flow in flows:
+        graph.addFlowData(flow)  # Stores the flow and runs drawEdge
+    timings['drawEdge'] = entry(time.perf_counter() - start, len(flows))
+    app.processEvents()
+
+    start = time.perf_counter()
+    for _ in range(paints):
+        graph.view.viewport().repaint()  # Synchronous full repaint of the canvas
+    timings['paintEvent'] = entry((time.perf_counter() - start) / paints, len(flows))
+
+    # Drag one node around: should cost the same whatever the number of edges elsewhere in the graph
+    node = next(iter(graph.nodeItems.values()))
+    origin = node.pos()
+    start = time.perf_counter()
+    for step in range(paints * 10):
+        node.setPos(origin.x() + step, origin.y() + step)
+        graph.view.viewport().repaint(graph.view.mapFromScene(node.sceneBoundingRect()).boundingRect().adjusted(-50, -50, 50, 50))
+    timings['moveNode'] = entry(time.perf_counter() - start, paints * 10)
+
+    with tempfile.TemporaryDirectory() as saveFolder:
+        seconds, _ = timed(lambda: (graph.saveToFolder(saveFolder), graph.autosave.flush()))  # Until the files are on disk
+    timings['save'] = entry(seconds, size)
+    graph.close()
+    graph.deleteLater()
+    app.processEvents()
+    return timings
+
+
+def benchmarkExecution(components, flows, config, iterations):
+    '''Times engine build and run, and the same calls made directly for the overhead comparison.'''
+    from GUI.graphEngine import GraphEngine
+
+    timings = {}
+    seconds, engine = timed(GraphEngine, components, flows, config)
+    timings['engine_build'] = entry(seconds, len(components))
+    report = engine.run(iterations)
+    timings['engine_run'] = entry(report['total_s'], iterations)
+    timings['engine_run'].update({key: report[key] for key in ('mean_us', 'p50_us', 'p99_us', 'max_us')})
+
+    # Baseline: the same functions called in order with the values threaded by hand
+    calls = [engine.functions[name] for name in engine.order]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        value = engine.values[0]
+        for function in calls:
+            value = function(value)
+    direct = time.perf_counter() - start
+    timings['direct_calls'] = entry(direct, iterations)
+    timings['engine_overhead_us'] = (report['total_s'] - direct) / iterations * 1e6
+    engine.close()
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark graph build, load, save, paint and execution.")
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES), help="Comma separated graph sizes.")
+    parser.add_argument('--iterations', type=int, default=200, help="Engine iterations per size.")
+    parser.add_argument('--paints', type=int, default=5, help="Repaints averaged for paintEvent.")
+    parser.add_argument('--no-gui', action='store_true', help="Only benchmark execution.")
+    parser.add_argument('--output', default="bench_results.json")
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    window = None
+    if not args.no_gui:
+        from guiMain import MainWindow
+        window = MainWindow()
+    with open("GUI/config.json", 'r') as file:
+        config = json.load(file)
+
+    results = []
+    for size in (int(size) for size in args.sizes.split(',')):
+        components, flows = synthesizeGraph(size)
+        timings = {}
+        with tempfile.TemporaryDirectory() as folder:
+            with open(f'{folder}/nodes.json', 'w') as file:
+                json.dump(components, file)
+            with open(f'{folder}/flows.json', 'w') as file:
+                json.dump(flows, file)
+            if window is not None:
+                timings.update(benchmarkGui(app, window, size, components, flows, folder, args.paints))
+        timings.update(benchmarkExecution(components, flows, config, args.iterations))
+        results.append({'size': size, 'nodes': len(components), 'flows': len(flows), 'timings': timings})
+        print(f"{size:>6} nodes: " + ", ".join(f"{name} {value['total_s'] * 1e3:.1f} ms"
+                                              for name, value in timings.items() if isinstance(value, dict)))
+
+    output = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_revision': gitRevision(),
+            'python': platform.python_version(),
+            'qt': QT_VERSION_STR,
+            'platform': platform.platform(),
+            'qt_platform': os.environ.get("QT_QPA_PLATFORM"),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(output, file, indent=4)
+    print(f"Results written to {args.output}")
+    if window is not None:
+        window.close()
+
+
+if __name__ == '__main__':
+    main()
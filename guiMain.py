@@ -3,15 +3,26 @@
 
 # The main file starts the main menu of the GUI application.
 # From the main menu, you can create a graph, load a graph, and set configurations.
+# Only what the main menu needs is imported at start-up: the graph editor, the configuration editor and the graph
+# loading code (and numpy, psutil, ... behind them) are imported when first opened.
+# Run with --profile-startup to print where start-up time goes.
 
 import sys
 sys.path.extend("../..")  #add ../.. to python path
 sys.path.extend("..")
+if __name__ == '__main__' and '--profile-startup' in sys.argv:
+    from GUI.startupProfile import StartupProfile
+    startupProfile = StartupProfile()  # Installed before the imports below so they are timed too
+else:
+    startupProfile = None
+import gc
 import json
+import os
+import shutil
+import time
 
-from PyQt5.QtWidgets import QVBoxLayout,QMainWindow, QApplication, QAction, qApp, QPushButton, QWidget,QFileDialog, QDialog, QLabel
-from GUI.createGraph import createGraph
-from GUI.configPage import ConfigEditor
+from PyQt5.QtWidgets import QVBoxLayout,QMainWindow, QApplication, QAction, qApp, QPushButton, QWidget,QFileDialog, QDialog, QLabel, QProgressDialog, QMessageBox
+from PyQt5.QtCore import Qt, QTimer
 
 class MainWindow(QMainWindow):
     """Main window class for the Neuroweaver application interface."""
@@ -57,6 +68,7 @@ class MainWindow(QMainWindow):
         size = self.size()
         x,y,h = pos.x(),pos.y(),size.height()
         if not self.config_editor or not self.config_editor.isVisible():
+            from GUI.configPage import ConfigEditor
             self.config_editor = ConfigEditor({'x':x+size.width(),'y':y+27,'h':h})  # Create a new ConfigEditor if none or not visible
             self.config_editor.show()
         else:
@@ -77,7 +89,7 @@ class MainWindow(QMainWindow):
         if self.graph:
             createGraph.clicked.connect(self.graph.show())
         else:    
-            createGraph.clicked.connect(self.createGraph)
+            createGraph.clicked.connect(self.newGraph)
         self.layout.addWidget(createGraph)
         
         loadButton = QPushButton("Load Graph", self)
@@ -97,51 +109,102 @@ class MainWindow(QMainWindow):
         pos = self.pos()
         size = self.size()
         x,y,h = pos.x(),pos.y(),size.height()
+        from GUI.createGraph import createGraph
         self.graph = createGraph({'x':x+size.width(),'y':y+27,'h':h,'config':self.config})
         self.graph.show()
 
+    def newGraph(self):
+        """Opens an empty graph editor, offering in turn to restore the work of each session that ended without saving.
+        Sessions that are neither restored nor discarded are kept and offered again next time."""
+        from GUI.autosave import staleSessions
+        self.createGraph()
+        sessions = staleSessions()
+        for index, session in enumerate(sessions):
+            reply = QMessageBox.question(self, "Restore Unsaved Work",
+                                         f"Unsaved work from a previous session was found ({index + 1} of {len(sessions)}, "
+                                         f"last changed {time.ctime(os.path.getmtime(session))}). Restore it? "
+                                         "Discard deletes it, Ignore keeps it for later.",
+                                         QMessageBox.Yes | QMessageBox.Discard | QMessageBox.Ignore, QMessageBox.Yes)
+            if reply == QMessageBox.Yes:
+                self.graph.restoreSession(session) # Deletes the session once it is shown
+                break # The editor holds one graph, the remaining sessions are offered next time
+            elif reply == QMessageBox.Discard:
+                shutil.rmtree(session, ignore_errors=True)
+
     def load(self):
         """Load graph components and flows from a user-selected directory."""
         folder_path = QFileDialog.getExistingDirectory(self, "Select Folder Containing Graph Files")
         if folder_path:
-            try:
-                # These are given fixed names for clarity, but you can change them as needed. 
-                # If changed, ensure you change the save method in createGraph.py as well.
-                with open(f'{folder_path}/nodes.json', 'r') as file:
-                    components = json.load(file)
-                with open(f'{folder_path}/flows.json', 'r') as file:
-                    flows = json.load(file)
-                
-                # After successful loading, create the visuals of nodes and flows
-                self.createGraph()  # This might need to be adjusted based on how you manage graph instances
-                for name, componentInfo in components.items():
-                    self.graph.addNodeGUI(componentInfo)
-                for flow in flows:
-                    self.graph.flows.append(flow)
-                    self.graph.drawEdge(flow[1], flow[3])
-
-            except FileNotFoundError:
-                # In the selected directory, either nodes.json or flows.json was not found
-                fileErrorDialog = QDialog(self)
-                fileErrorDialog.setWindowTitle("Error")
-                fileErrorDialog.layout = QVBoxLayout()
-                fileErrorDialog.layout.addWidget(QLabel("File not found. Please ensure the directory contains the nodes.json and flows.json files."))
-                fileErrorDialog.setLayout(fileErrorDialog.layout)
-                okButton = QPushButton("OK", fileErrorDialog)
-                okButton.clicked.connect(fileErrorDialog.close)
-                fileErrorDialog.layout.addWidget(okButton)
-                fileErrorDialog.exec_()
-
-            except Exception as e:
-                print(f"An error occurred: {e}")
+            self.loadFolder(folder_path)
         else:
             print("No folder selected.")
 
+    def loadFolder(self, folder_path):
+        """Load the graph saved in folder_path and open it in the graph editor."""
+        from GUI.graphIO import loadGraphModel, loadLayout
+        try:
+            # These are given fixed names for clarity, but you can change them as needed. 
+            # If changed, ensure you change the save method in createGraph.py as well.
+            # The files are parsed into the graph model first, then all visuals are created in one batch
+            progress = QProgressDialog("Loading graph...", "Cancel", 0, 1000, self)
+            progress.setWindowModality(Qt.WindowModal)
+            progress.setMinimumDuration(500)  # Small graphs load before the dialog would appear
+
+            def parsing(fraction):
+                progress.setValue(int(fraction * 500))
+                return not progress.wasCanceled()
+
+            def drawing(fraction):
+                progress.setValue(500 + int(fraction * 500))
+                return not progress.wasCanceled()
+
+            collecting = gc.isenabled()
+            gc.disable()  # Tens of thousands of new objects would otherwise trigger repeated full collections
+            try:
+                model = loadGraphModel(folder_path, parsing)
+                if model is not None:
+                    self.createGraph()  # This might need to be adjusted based on how you manage graph instances
+                    if not self.graph.loadModel(model, drawing, layout=loadLayout(folder_path)):
+                        model = None
+                        self.graph.close()
+                        self.graph = None
+            finally:
+                if collecting:
+                    gc.enable()
+                progress.close()
+                progress.deleteLater()
+            if model is None:
+                print("Loading cancelled.")
+
+        except FileNotFoundError:
+            # In the selected directory, either nodes.json or flows.json was not found
+            fileErrorDialog = QDialog(self)
+            fileErrorDialog.setWindowTitle("Error")
+            fileErrorDialog.layout = QVBoxLayout()
+            fileErrorDialog.layout.addWidget(QLabel("File not found. Please ensure the directory contains the nodes.json and flows.json files."))
+            fileErrorDialog.setLayout(fileErrorDialog.layout)
+            okButton = QPushButton("OK", fileErrorDialog)
+            okButton.clicked.connect(fileErrorDialog.close)
+            fileErrorDialog.layout.addWidget(okButton)
+            fileErrorDialog.exec_()
+
+        except Exception as e:
+            print(f"An error occurred: {e}")
+
 
 
 def main():
     app = QApplication(sys.argv)
+    if startupProfile:
+        startupProfile.mark("QApplication created")
     ex = MainWindow()
+    if startupProfile:
+        startupProfile.mark("main window built")
+
+        def eventLoopStarted():
+            startupProfile.mark("event loop running")
+            startupProfile.report()
+        QTimer.singleShot(0, eventLoopStarted)
 
     sys.exit(app.exec_())
 
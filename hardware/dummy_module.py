@@ -0,0 +1,17 @@
+# Dummy hardware components used by GUI/components.json.
+# They stand in for the real acquisition/stimulation modules so graphs can be run and benchmarked without hardware.
+# Each function follows the engine call convention (see GUI/graphEngine.py): inputs are passed positionally and
+# the single output is returned.
+# Both are elementwise, so they also accept values batched along a leading axis and are marked "vectorized".
+
+import numpy as np
+
+
+def dummy1(dummy1):
+    '''Pretends to acquire a sample: returns the input shifted by one.'''
+    return np.add(dummy1, 1.0)
+
+
+def dummy2(dummy2):
+    '''Pretends to process a sample: returns the input scaled by two.'''
+    return np.multiply(dummy2, 2.0)